@@ -1,36 +1,98 @@
+import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
-from . import models
-from .database import get_db
+from . import models, passwords
+from .cache import TTLCache
+from .database import get_async_db, get_db
 
 # Chiave segreta 
 SECRET_KEY = "super-secret-medicalsymptomdiary-key-change-me"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 giorno
 
-# Hash PBKDF2-SHA256
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
-
 # Swagger
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-# hash password
+# Cache token verificati (token -> email) e utenti (email -> CurrentUser):
+# sul percorso caldo get_current_user non decodifica il JWT né interroga il DB.
+AUTH_CACHE_TTL = float(os.getenv("MSD_AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("MSD_AUTH_CACHE_SIZE", "1024"))
+
+token_cache = TTLCache("auth_tokens", AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+user_cache = TTLCache("auth_users", AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Copia dei soli campi dell'utente usati dalle API, sicura da tenere in cache."""
+    id: int
+    name: str
+    email: str
+    is_admin: bool
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "CurrentUser":
+        return cls(id=user.id, name=user.name, email=user.email, is_admin=bool(user.is_admin))
+
+
+def invalidate_user(email: Optional[str] = None) -> None:
+    """Rimuove un utente (o tutti, se email è None) dalle cache di autenticazione."""
+    if email is None:
+        user_cache.clear()
+        token_cache.clear()
+        return
+    user_cache.delete(email)
+    token_cache.delete_where(lambda _token, cached_email: cached_email == email)
+
+
+# utenti modificati/eliminati: le email (anche quella precedente, se cambiata) si
+# tolgono dalla cache solo dopo il commit, altrimenti una richiesta concorrente
+# potrebbe rimettere in cache la riga non ancora aggiornata
+_EMAIL_DA_INVALIDARE = "msd_auth_invalidate"
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalida_utente_modificato(mapper, connection, target):
+    session = object_session(target)
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    if session is None:
+        for email in emails:
+            invalidate_user(email)
+        return
+    session.info.setdefault(_EMAIL_DA_INVALIDARE, set()).update(emails)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalida_dopo_commit(session):
+    for email in session.info.pop(_EMAIL_DA_INVALIDARE, ()):
+        invalidate_user(email)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _scarta_dopo_rollback(session, previous_transaction):
+    # solo il rollback della transazione esterna annulla tutte le modifiche
+    if previous_transaction.parent is None:
+        session.info.pop(_EMAIL_DA_INVALIDARE, None)
+
+# hash password (versioni sincrone; le API usano quelle async nel pool di passwords.py)
 def get_password_hash(password: str) -> str:
     """Restituisce l'hash della password."""
-    if password is None:
-        password = ""
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify_and_update(plain_password, hashed_password)[0]
 
 # creazione token
 
@@ -39,6 +101,9 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None)
     to_encode = {"sub": subject}
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
+    # python-jose (e i backend crittografici) caricati al primo token, non all'avvio
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -57,14 +122,49 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[models
         return None
     return user
 
+
+def _salva_nuovo_hash(db: Session, user: models.User, new_hash: str) -> None:
+    user.password_hash = new_hash
+    db.commit()
+
+
+async def authenticate_user_async(db: Session, email: str, password: str) -> Optional[models.User]:
+    """Come authenticate_user, con la verifica nel pool e rehash se il costo è cambiato."""
+    user = await run_in_threadpool(get_user_by_email, db, email)
+    if not user:
+        return None
+    ok, new_hash = await passwords.averify_and_update(password, user.password_hash)
+    if not ok:
+        return None
+    if new_hash:
+        await run_in_threadpool(_salva_nuovo_hash, db, user, new_hash)
+    return user
+
 # leggo utente loggato
 
+def _email_da_token(token: str, credentials_exception: HTTPException) -> str:
+    email = token_cache.get(token)
+    if email is None:
+        from jose import JWTError, jwt
+
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
+            raise credentials_exception
+        # il token in cache non deve sopravvivere alla sua scadenza
+        token_cache.set(token, email, ttl=payload["exp"] - time.time())
+    return email
+
+
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
-) -> models.User:
+) -> CurrentUser:
     """
-    Estrae il token Bearer e carica l'utente.
+    Estrae il token Bearer e carica l'utente (dalla cache se presente).
     """
     
     credentials_exception = HTTPException(
@@ -73,15 +173,37 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    email = _email_da_token(token, credentials_exception)
+
+    user = user_cache.get(email)
+    if user is None:
+        db_user = get_user_by_email(db, email=email)
+        if db_user is None:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        user = CurrentUser.from_model(db_user)
+        user_cache.set(email, user)
+    return user
 
-    user = get_user_by_email(db, email=email)
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> CurrentUser:
+    """Come get_current_user, con la sessione async (MSD_DB_MODE=async)."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Credenziali non valide",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    email = _email_da_token(token, credentials_exception)
+
+    user = user_cache.get(email)
     if user is None:
-        raise credentials_exception
+        result = await db.execute(select(models.User).where(models.User.email == email))
+        db_user = result.scalars().first()
+        if db_user is None:
+            raise credentials_exception
+        user = CurrentUser.from_model(db_user)
+        user_cache.set(email, user)
     return user
@@ -0,0 +1,224 @@
+import os
+import threading
+import time as time_mod
+from datetime import date as dt_date, datetime, time as dt_time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Motore disponibilità visite.
+# Per ogni (struttura, giorno) tiene in memoria una bitmap degli slot occupati
+# (bit i = SLOT_TIMES[i]); viene ricostruita dal DB all'avvio e aggiornata dagli
+# handler di prenotazione/proposta/accetta/rifiuta, così le richieste di
+# disponibilità non interrogano il database.
+# Accanto alla bitmap c'è il numero di prenotazioni che tengono ogni slot
+# (una proposta può coincidere con lo slot di un'altra visita): il bit si
+# spegne solo quando l'ultima lo rilascia.
+
+def _parse_times(raw: str) -> List[dt_time]:
+    return [dt_time.fromisoformat(t.strip()) for t in raw.split(",") if t.strip()]
+
+
+SLOT_TIMES: List[dt_time] = _parse_times(
+    os.getenv("MSD_SLOT_TIMES", "08:00,09:00,10:00,11:00,12:00,13:00,14:00,15:00,16:00,17:00")
+)
+FACILITIES: List[str] = [
+    f.strip()
+    for f in os.getenv("MSD_FACILITIES", "Milano,Torino,Roma,Napoli,Palermo,Bari").split(",")
+    if f.strip()
+]
+# giorni aperti (0 = lunedì): come il frontend, niente weekend
+OPEN_WEEKDAYS = {0, 1, 2, 3, 4}
+# ogni quanti secondi ricostruire comunque l'indice dal DB (altri processi possono prenotare)
+REFRESH_SECONDS = float(os.getenv("MSD_AVAILABILITY_REFRESH", "300"))
+MAX_DAYS = 90
+
+ACTIVE_STATUSES = models.ACTIVE_STATUSES
+
+_SLOT_INDEX = {t: i for i, t in enumerate(SLOT_TIMES)}
+_FULL = (1 << len(SLOT_TIMES)) - 1
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._occupied: Dict[Tuple[str, dt_date], int] = {}
+        self._holders: Dict[Tuple[str, dt_date, int], int] = {}  # (struttura, giorno, bit) -> prenotazioni
+        self._lock = threading.Lock()
+        self._built_at: Optional[float] = None
+
+    # aggiornamento
+
+    def rebuild(self, db: Session) -> None:
+        """Ricarica dal DB gli slot occupati da oggi in poi."""
+        rows = db.execute(held_query(dt_date.today())).all()
+
+        occupied: Dict[Tuple[str, dt_date], int] = {}
+        holders: Dict[Tuple[str, dt_date, int], int] = {}
+        for facility, d, t, status, p_date, p_time in rows:
+            for slot_date, slot_time in _held_slots(d, t, status, p_date, p_time):
+                bit = _SLOT_INDEX.get(slot_time)
+                if bit is not None:
+                    key = (facility, slot_date)
+                    occupied[key] = occupied.get(key, 0) | (1 << bit)
+                    holders[key + (bit,)] = holders.get(key + (bit,), 0) + 1
+
+        with self._lock:
+            self._occupied = occupied
+            self._holders = holders
+            self._built_at = time_mod.monotonic()
+
+    def ensure_fresh(self, db_factory) -> None:
+        if self._built_at is None or time_mod.monotonic() - self._built_at > REFRESH_SECONDS:
+            db = db_factory()
+            try:
+                self.rebuild(db)
+            finally:
+                db.close()
+
+    def invalidate(self) -> None:
+        """Forza la ricostruzione dal DB alla prossima ensure_fresh."""
+        with self._lock:
+            self._built_at = None
+
+    def _set(self, facility: str, d: Optional[dt_date], t: Optional[dt_time], busy: bool) -> None:
+        if d is None or t is None:
+            return
+        bit = _SLOT_INDEX.get(t)
+        if bit is None:
+            return
+        key = (facility, d)
+        with self._lock:
+            count = self._holders.get(key + (bit,), 0) + (1 if busy else -1)
+            mask = self._occupied.get(key, 0)
+            if count > 0:
+                self._holders[key + (bit,)] = count
+                mask |= 1 << bit
+            else:
+                self._holders.pop(key + (bit,), None)
+                mask &= ~(1 << bit)
+            if mask:
+                self._occupied[key] = mask
+            else:
+                self._occupied.pop(key, None)
+
+    def occupy(self, facility: str, d: dt_date, t: dt_time) -> None:
+        self._set(facility, d, t, True)
+
+    def release(self, facility: str, d: Optional[dt_date], t: Optional[dt_time]) -> None:
+        self._set(facility, d, t, False)
+
+    def replace(self, facility: str, before: list, after: list) -> None:
+        """Aggiorna gli slot di una prenotazione dopo un cambio di stato/orario."""
+        for d, t in before:
+            if (d, t) not in after:
+                self.release(facility, d, t)
+        for d, t in after:
+            if (d, t) not in before:
+                self.occupy(facility, d, t)
+
+    # interrogazioni
+
+    def booked_times(self, facility: str, d: dt_date) -> List[dt_time]:
+        with self._lock:
+            mask = self._occupied.get((facility, d), 0)
+        return [t for i, t in enumerate(SLOT_TIMES) if mask >> i & 1]
+
+    def is_booked(self, facility: str, d: dt_date, t: dt_time) -> bool:
+        """True solo se lo slot risulta occupato (orari fuori griglia: False)."""
+        bit = _SLOT_INDEX.get(t)
+        if bit is None:
+            return False
+        with self._lock:
+            return bool(self._occupied.get((facility, d), 0) >> bit & 1)
+
+    def free_slots(
+        self, facility: str, start: dt_date, days: int, now: Optional[datetime] = None
+    ) -> Dict[dt_date, List[dt_time]]:
+        """Slot liberi per giorno aperto in [start, start + days), esclusi quelli già passati."""
+        now = now or datetime.now()
+        out: Dict[dt_date, List[dt_time]] = {}
+        with self._lock:
+            masks = {d: self._occupied.get((facility, d), 0) | _past_mask(d, now) for d in _open_days(start, days)}
+        for d, mask in masks.items():
+            if mask != _FULL:
+                out[d] = [t for i, t in enumerate(SLOT_TIMES) if not mask >> i & 1]
+        return out
+
+    def first_free(
+        self, facilities: Iterable[str], start: dt_date, days: int, now: Optional[datetime] = None
+    ) -> Optional[Tuple[str, dt_date, dt_time]]:
+        """Primo slot libero (per data e ora) tra le strutture indicate, da adesso in poi."""
+        now = now or datetime.now()
+        facilities = list(facilities)
+        with self._lock:
+            for d in _open_days(start, days):
+                past = _past_mask(d, now)
+                if past == _FULL:
+                    continue
+                best = None
+                for facility in facilities:
+                    free = ~(self._occupied.get((facility, d), 0) | past) & _FULL
+                    if free:
+                        bit = (free & -free).bit_length() - 1
+                        if best is None or bit < best[0]:
+                            best = (bit, facility)
+                if best is not None:
+                    return best[1], d, SLOT_TIMES[best[0]]
+        return None
+
+
+def held_query(today: dt_date):
+    """SELECT delle prenotazioni attive che tengono slot da oggi in poi."""
+    A = models.Appointment
+    return select(A.facility, A.date, A.time, A.status, A.proposed_date, A.proposed_time).where(
+        A.status.in_(ACTIVE_STATUSES),
+        or_(A.date >= today, A.proposed_date >= today),
+    )
+
+
+def holders_query(facility: str, d: dt_date, t: dt_time):
+    """SELECT delle prenotazioni che nel DB tengono lo slot (struttura, giorno, ora)."""
+    A = models.Appointment
+    return select(A.id).where(
+        A.facility == facility,
+        or_(
+            (A.date == d) & (A.time == t) & A.status.in_(ACTIVE_STATUSES),
+            (A.proposed_date == d) & (A.proposed_time == t) & (A.status == "PROPOSED"),
+        ),
+    )
+
+
+def _held_slots(d, t, status, p_date, p_time):
+    # una proposta tiene bloccato sia lo slot originale sia quello proposto
+    if status not in ACTIVE_STATUSES:
+        return
+    yield d, t
+    if status == "PROPOSED" and p_date and p_time and (p_date, p_time) != (d, t):
+        yield p_date, p_time
+
+
+def held_by(appt: models.Appointment) -> list:
+    """Slot (data, ora) occupati da una prenotazione nel suo stato attuale."""
+    return list(_held_slots(appt.date, appt.time, appt.status, appt.proposed_date, appt.proposed_time))
+
+
+def _past_mask(d: dt_date, now: datetime) -> int:
+    # slot già iniziati (ora locale della struttura, come date/time delle visite)
+    if d > now.date():
+        return 0
+    if d < now.date():
+        return _FULL
+    return sum(1 << i for i, t in enumerate(SLOT_TIMES) if t <= now.time())
+
+
+def _open_days(start: dt_date, days: int):
+    for n in range(days):
+        d = start + timedelta(days=n)
+        if d.weekday() in OPEN_WEEKDAYS:
+            yield d
+
+
+index = AvailabilityIndex()
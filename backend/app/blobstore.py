@@ -0,0 +1,250 @@
+import argparse
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import inspect, text
+
+# Blob store content-addressed su disco per i PDF allegati alle visite.
+# Ogni file è salvato una sola volta come byte grezzi in <BLOB_DIR>/ab/cdef...,
+# dove il nome è lo sha256 del contenuto: due upload identici condividono il file.
+# Il blob si scrive prima dell'INSERT della visita, quindi un 409 (slot occupato)
+# lascia un file senza riferimenti: non si cancella subito perché un altro upload
+# identico potrebbe starlo riusando, ci pensa "gc" (da cron), che elimina i blob
+# non referenziati più vecchi di GC_GRACE_SECONDS.
+#
+#   python -m app.blobstore migrate | gc
+
+BLOB_DIR = Path(os.getenv("MSD_BLOB_DIR", "./blobs"))
+
+logger = logging.getLogger(__name__)
+
+# dimensione massima di un PDF caricato in streaming (default 10 MB)
+MAX_UPLOAD_BYTES = int(os.getenv("MSD_MAX_PDF_BYTES", str(10 * 1024 * 1024)))
+# età minima di un blob non referenziato prima che gc lo elimini (upload in corso)
+GC_GRACE_SECONDS = int(os.getenv("MSD_BLOB_GC_GRACE", "3600"))
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class BlobChecksumMismatch(Exception):
+    pass
+
+
+def _path_for(ref: str) -> Path:
+    if len(ref) != 64 or any(c not in "0123456789abcdef" for c in ref):
+        raise BlobNotFound(ref)
+    return BLOB_DIR / ref[:2] / ref[2:]
+
+
+def _reuse(path: Path) -> bool:
+    # blob già presente: aggiorna mtime, così gc non lo tocca mentre la visita viene salvata
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def put_bytes(data: bytes) -> str:
+    """Salva i byte (se non già presenti) e restituisce il riferimento sha256."""
+    ref = hashlib.sha256(data).hexdigest()
+    path = _path_for(ref)
+    if _reuse(path):
+        return ref
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # scrittura atomica: file temporaneo nella stessa cartella + rename
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return ref
+
+
+def put_base64(data_b64: str) -> str:
+    """Decodifica un payload base64 (anche data URL) e lo salva."""
+    if data_b64.startswith("data:") and "," in data_b64:
+        data_b64 = data_b64.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(data_b64, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("PDF base64 non valido")
+    return put_bytes(raw)
+
+
+async def put_stream(
+    chunks: AsyncIterator[bytes],
+    max_bytes: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+) -> str:
+    """
+    Scrive su disco un upload a blocchi calcolando lo sha256 al volo:
+    in memoria resta un solo blocco alla volta. Supera max_bytes -> BlobTooLarge,
+    checksum diverso da expected_sha256 -> BlobChecksumMismatch.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_UPLOAD_BYTES
+    BLOB_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=BLOB_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BlobTooLarge(size)
+                digest.update(chunk)
+                f.write(chunk)
+
+        ref = digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != ref:
+            raise BlobChecksumMismatch(ref)
+
+        path = _path_for(ref)
+        if _reuse(path):
+            os.unlink(tmp)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, path)
+        return ref
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def blob_path(ref: str) -> Path:
+    """Percorso del blob su disco, per servirlo in streaming senza caricarlo."""
+    path = _path_for(ref)
+    if not path.exists():
+        raise BlobNotFound(ref)
+    return path
+
+
+def read_bytes(ref: str) -> bytes:
+    return blob_path(ref).read_bytes()
+
+
+# migrazione: sposta appointments.pdf_base64 nel blob store
+
+def migrate_appointments(engine, batch_size: int = 100) -> int:
+    """
+    Per un database creato prima del blob store: aggiunge la colonna pdf_ref,
+    sposta ogni pdf_base64 nel blob store e infine elimina la vecchia colonna.
+    Idempotente: le righe già migrate vengono saltate.
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("appointments")}
+    if "pdf_base64" not in columns:
+        return 0
+
+    with engine.begin() as conn:
+        if "pdf_ref" not in columns:
+            conn.execute(text("ALTER TABLE appointments ADD COLUMN pdf_ref VARCHAR(64)"))
+
+    migrated = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT id, pdf_base64 FROM appointments "
+                    "WHERE id > :last_id AND pdf_ref IS NULL ORDER BY id LIMIT :n"
+                ),
+                {"last_id": last_id, "n": batch_size},
+            ).all()
+            if not rows:
+                break
+            for appt_id, data_b64 in rows:
+                last_id = appt_id
+                if not data_b64:
+                    continue
+                try:
+                    ref = put_base64(data_b64)
+                except ValueError:
+                    # conservo comunque il contenuto originale: la colonna verrà eliminata
+                    logger.warning("appointment %s: base64 non valido, salvato così com'è", appt_id)
+                    ref = put_bytes(data_b64.encode())
+                conn.execute(
+                    text("UPDATE appointments SET pdf_ref = :ref WHERE id = :id"),
+                    {"ref": ref, "id": appt_id},
+                )
+                migrated += 1
+
+    # pdf_base64 è NOT NULL: va eliminata perché i nuovi insert non la valorizzano
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE appointments DROP COLUMN pdf_base64"))
+    if engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return migrated
+
+
+# gc: blob senza visita (upload finiti in 409 o visite rimosse)
+
+def collect_garbage(engine, grace_seconds: Optional[int] = None) -> int:
+    """
+    Elimina i blob (e i file temporanei rimasti) non referenziati da appointments.pdf_ref
+    e non modificati negli ultimi grace_seconds. Restituisce quanti file ha eliminato.
+    """
+    if grace_seconds is None:
+        grace_seconds = GC_GRACE_SECONDS
+    if not BLOB_DIR.exists():
+        return 0
+    # soglia presa prima di leggere i riferimenti: un blob più vecchio non può
+    # appartenere a un upload la cui visita non è ancora nella lista
+    cutoff = time.time() - grace_seconds
+    with engine.connect() as conn:
+        refs = set(conn.execute(text("SELECT DISTINCT pdf_ref FROM appointments WHERE pdf_ref IS NOT NULL")).scalars())
+
+    removed = 0
+    for path in BLOB_DIR.rglob("*"):
+        if not path.is_file() or path.stat().st_mtime > cutoff:
+            continue
+        # file temporanei (".tmp-", ".upload-") di scritture interrotte
+        if not path.name.startswith(".") and path.parent.name + path.name in refs:
+            continue
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Blob store PDF visite")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="sposta appointments.pdf_base64 nel blob store")
+    mig.add_argument("--batch-size", type=int, default=100)
+    gc = sub.add_parser("gc", help="elimina i blob non referenziati da nessuna visita")
+    gc.add_argument("--grace-seconds", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    if args.command == "migrate":
+        n = migrate_appointments(engine, args.batch_size)
+        print(f"PDF migrati: {n} (blob in {BLOB_DIR.resolve()})")
+    elif args.command == "gc":
+        n = collect_garbage(engine, args.grace_seconds)
+        print(f"blob eliminati: {n} (in {BLOB_DIR.resolve()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import asyncio
+import calendar
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Optional
+
+from sqlalchemy import BigInteger, Integer, Text, cast, func, select, text
+from sqlalchemy.orm import Session
+
+from . import lazy, models
+from .cache import TTLCache
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Statistiche di coorte (admin) su tutti i pazienti.
+# Le colonne severità/timestamp/utente e le coppie (sintomo, tag) della finestra
+# richiesta vengono caricate in array NumPy e aggregate in forma
+# vettoriale (bincount/cumsum, niente cicli Python per riga). Il risultato
+# resta in cache e quello con i parametri di default viene ricalcolato
+# periodicamente in background, così la richiesta admin non paga il calcolo.
+# NumPy viene importato al primo calcolo, non all'avvio dell'app.
+
+COHORT_DAYS = int(os.getenv("MSD_COHORT_DAYS", "30"))
+COHORT_THRESHOLD = int(os.getenv("MSD_COHORT_THRESHOLD", "7"))
+COHORT_TOP = int(os.getenv("MSD_COHORT_TOP", "20"))
+COHORT_TTL = float(os.getenv("MSD_COHORT_TTL", "900"))
+# secondi tra due ricalcoli in background (0 = disattivato)
+COHORT_REFRESH = float(os.getenv("MSD_COHORT_REFRESH", "300"))
+
+SEVERITY_LEVELS = 10
+WEEK = 7 * 24 * 3600
+
+stats_cache = TTLCache("cohort_stats", maxsize=32, ttl=COHORT_TTL)
+_compute_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+E = models.SymptomEntry
+T = models.EntryTag
+
+_np = lazy.module("numpy")
+
+
+def _epoch(column, dialect_name: str):
+    # secondi dal 1970 calcolati nel DB: niente oggetti datetime per riga
+    if dialect_name == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    return cast(func.extract("epoch", column), BigInteger)
+
+
+def _concat(column, dialect_name: str):
+    # valori di tutta la colonna in un'unica stringa "1,2,3": una sola riga dal
+    # driver invece di milioni di tuple Python
+    if dialect_name == "postgresql":
+        return func.string_agg(cast(column, Text), ",")
+    return func.group_concat(column)
+
+
+def _parse(joined: Optional[str]) -> np.ndarray:
+    np = _np()
+
+    if not joined:
+        return np.empty(0, dtype=np.int64)
+    return np.fromstring(joined, dtype=np.int64, sep=",")
+
+
+def _to_epoch(dt: datetime) -> int:
+    # come strftime('%s') su SQLite: il timestamp naive è letto come UTC
+    return calendar.timegm(dt.timetuple())
+
+
+def columns_query(since: datetime, dialect: str):
+    """Una riga: id, utente, severità ed epoch dei sintomi vivi da since, ciascuno in una stringa."""
+    # le quattro aggregazioni scorrono le righe nello stesso ordine: gli array restano allineati
+    return select(
+        _concat(E.id, dialect),
+        _concat(E.user_id, dialect),
+        _concat(E.severity, dialect),
+        _concat(_epoch(E.timestamp, dialect), dialect),
+    ).where(E.deleted_at.is_(None), E.timestamp >= since)
+
+
+def tags_query(since: datetime, dialect: str):
+    """Per ogni tag (in ordine) gli id dei sintomi vivi da since che lo riportano, in una stringa."""
+    return (
+        select(T.tag, _concat(T.entry_id, dialect))
+        .join(E, E.id == T.entry_id)
+        .where(E.deleted_at.is_(None), E.timestamp >= since)
+        .group_by(T.tag)
+        .order_by(T.tag)
+    )
+
+
+def load_columns(db: Session, since: datetime) -> Dict[str, np.ndarray]:
+    """
+    Carica in array i sintomi vivi da since in poi (ordinati per id) e le
+    coppie (sintomo, tag). Restituisce entry_id, user_id, severity, ts,
+    tag_entry, tag_code e tag_names.
+    """
+    np = _np()
+
+    dialect = db.get_bind().dialect.name
+    # le due letture devono vedere gli stessi sintomi: pysqlite non apre una
+    # transazione per le SELECT, quindi BEGIN esplicito; su PostgreSQL un'unica
+    # istantanea per tutta la transazione (la sessione deve essere nuova)
+    if dialect == "sqlite":
+        db.execute(text("BEGIN"))
+    else:
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+    row = db.execute(columns_query(since, dialect)).one()
+    entry_id, user_id, severity, ts = (_parse(v) for v in row)
+    order = np.argsort(entry_id, kind="stable")
+
+    # per ogni tag, gli id dei sintomi che lo riportano
+    tag_names, tag_entry, tag_code = [], [], []
+    rows = db.execute(tags_query(since, dialect))
+    for code, (tag, ids) in enumerate(rows):
+        ids = _parse(ids)
+        tag_names.append(tag)
+        tag_entry.append(ids)
+        tag_code.append(np.full(ids.size, code, dtype=np.int64))
+
+    return {
+        "entry_id": entry_id[order],
+        "user_id": user_id[order],
+        "severity": severity[order],
+        "ts": ts[order],
+        "tag_entry": np.concatenate(tag_entry) if tag_entry else np.empty(0, dtype=np.int64),
+        "tag_code": np.concatenate(tag_code) if tag_code else np.empty(0, dtype=np.int64),
+        "tag_names": np.array(tag_names, dtype=object),
+    }
+
+
+def _percentiles(hist: np.ndarray, counts: np.ndarray, qs=(50, 90, 95)) -> Dict[int, np.ndarray]:
+    """Percentili (nearest-rank) per riga da istogrammi di severità 1..10."""
+    np = _np()
+
+    cum = np.cumsum(hist, axis=1)
+    out = {}
+    for q in qs:
+        rank = np.maximum(np.ceil(q / 100 * counts), 1)
+        out[q] = (cum >= rank[:, None]).argmax(axis=1) + 1
+    return out
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    np = _np()
+
+    return np.divide(num, den, out=np.full(num.shape, np.nan), where=den > 0)
+
+
+def _opt(value: float, digits: int = 2) -> Optional[float]:
+    return None if math.isnan(value) else round(float(value), digits)
+
+
+def compute(cols: Dict[str, np.ndarray], now: datetime, threshold: int, top: int = COHORT_TOP) -> dict:
+    """Statistiche di coorte sugli array di load_columns (nessun accesso al DB)."""
+    np = _np()
+
+    sev, ts, users = cols["severity"], cols["ts"], cols["user_id"]
+    now_ts = _to_epoch(now)
+    levels = np.arange(1, SEVERITY_LEVELS + 1)
+
+    # severità complessiva
+    overall_hist = np.bincount(sev, minlength=SEVERITY_LEVELS + 1)[1:][None, :]
+    overall_pct = _percentiles(overall_hist, np.array([sev.size]))
+
+    # pazienti: media/max di severità per utente
+    user_ids, user_idx = np.unique(users, return_inverse=True)
+    user_count = np.bincount(user_idx, minlength=user_ids.size)
+    user_mean = _ratio(np.bincount(user_idx, weights=sev, minlength=user_ids.size), user_count)
+    user_max = np.zeros(user_ids.size, dtype=np.int64)
+    np.maximum.at(user_max, user_idx, sev)
+    above = np.flatnonzero(user_mean >= threshold)
+    above = above[np.lexsort((-user_count[above], -user_mean[above]))][:top]
+
+    # per tag: ogni coppia (sintomo, tag) viene riportata alla riga del sintomo
+    names = cols["tag_names"]
+    n_tags = names.size
+    entry_ids = cols["entry_id"]
+    # coppie di sintomi assenti dalle colonne (se le letture non fossero allineate) scartate
+    known = np.isin(cols["tag_entry"], entry_ids)
+    row = np.searchsorted(entry_ids, cols["tag_entry"][known])
+    code = cols["tag_code"][known]
+    p_sev, p_ts, p_user = sev[row], ts[row], user_idx[row]
+
+    hist = np.bincount(
+        code * (SEVERITY_LEVELS + 1) + p_sev, minlength=n_tags * (SEVERITY_LEVELS + 1)
+    ).reshape(n_tags, SEVERITY_LEVELS + 1)[:, 1:]
+    counts = hist.sum(axis=1)
+    mean = _ratio(hist @ levels, counts)
+    std = np.sqrt(np.maximum(_ratio(hist @ (levels ** 2), counts) - mean ** 2, 0))
+    pct = _percentiles(hist, counts)
+
+    pairs = np.unique(code * (user_ids.size + 1) + p_user)
+    patients = np.bincount(pairs // (user_ids.size + 1), minlength=n_tags)
+
+    this_week = p_ts >= now_ts - WEEK
+    prev_week = (p_ts >= now_ts - 2 * WEEK) & ~this_week
+    cur = np.bincount(code[this_week], minlength=n_tags)
+    prev = np.bincount(code[prev_week], minlength=n_tags)
+    cur_mean = _ratio(np.bincount(code[this_week], weights=p_sev[this_week], minlength=n_tags), cur)
+    prev_mean = _ratio(np.bincount(code[prev_week], weights=p_sev[prev_week], minlength=n_tags), prev)
+    delta = cur - prev
+    change = _ratio(delta * 100.0, prev)
+
+    tags = [
+        {
+            "tag": str(names[i]),
+            "entries": int(counts[i]),
+            "patients": int(patients[i]),
+            "mean_severity": _opt(mean[i]),
+            "std_severity": _opt(std[i]),
+            "p50": int(pct[50][i]),
+            "p90": int(pct[90][i]),
+            "p95": int(pct[95][i]),
+            "histogram": hist[i].tolist(),
+            "this_week": int(cur[i]),
+            "previous_week": int(prev[i]),
+            "week_delta": int(delta[i]),
+            "week_change_pct": _opt(change[i], 1),
+            "mean_severity_this_week": _opt(cur_mean[i]),
+            "mean_severity_previous_week": _opt(prev_mean[i]),
+        }
+        for i in np.argsort(-counts, kind="stable")
+    ]
+    rising = np.flatnonzero(delta > 0)
+    rising = rising[np.lexsort((-cur[rising], -delta[rising]))][:top]
+
+    return {
+        "computed_at": datetime.utcnow(),
+        "entries": int(sev.size),
+        "patients": int(user_ids.size),
+        "mean_severity": _opt(sev.mean()) if sev.size else None,
+        "p50": int(overall_pct[50][0]) if sev.size else None,
+        "p90": int(overall_pct[90][0]) if sev.size else None,
+        "p95": int(overall_pct[95][0]) if sev.size else None,
+        "threshold": threshold,
+        "patients_above_threshold": int((user_mean >= threshold).sum()),
+        "top_patients": [
+            {
+                "user_id": int(user_ids[i]),
+                "entries": int(user_count[i]),
+                "mean_severity": _opt(user_mean[i]),
+                "max_severity": int(user_max[i]),
+            }
+            for i in above
+        ],
+        "trending_up": [str(names[i]) for i in rising],
+        "tags": tags,
+    }
+
+
+def cohort_stats(db: Session, days: int, threshold: int) -> dict:
+    # UTC naive come i timestamp salvati (e _to_epoch)
+    now = datetime.utcnow()
+    since = now - timedelta(days=days)
+    result = compute(load_columns(db, since), now, threshold)
+    result["since"] = since
+    result["days"] = days
+    return result
+
+
+def get_stats(db_factory, days: int = COHORT_DAYS, threshold: int = COHORT_THRESHOLD, refresh: bool = False) -> dict:
+    """Statistiche dalla cache; al miss (o con refresh) le ricalcola, un calcolo alla volta."""
+    key = (days, threshold)
+    if not refresh:
+        cached = stats_cache.get(key)
+        if cached is not None:
+            return cached
+    with _compute_lock:
+        if not refresh:
+            cached = stats_cache.get(key)
+            if cached is not None:
+                return cached
+        db = db_factory()
+        try:
+            result = cohort_stats(db, days, threshold)
+        finally:
+            db.close()
+        stats_cache.set(key, result)
+        return result
+
+
+async def refresh_loop(db_factory) -> None:
+    """Ricalcola periodicamente le statistiche con i parametri di default."""
+    while True:
+        try:
+            await asyncio.to_thread(get_stats, db_factory, refresh=True)
+        except Exception:
+            logger.exception("Ricalcolo statistiche di coorte fallito")
+        await asyncio.sleep(COHORT_REFRESH)
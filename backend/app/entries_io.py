@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .schemas import SymptomEntryCreate
+
+# Import/export in blocco del diario sintomi: JSON (array), NDJSON e CSV.
+# L'import valida ogni riga con SymptomEntryCreate e restituisce gli errori
+# per riga; l'export serializza a blocchi per lo streaming.
+
+FORMATS = ("json", "ndjson", "csv")
+MEDIA_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_FIELDS = ["title", "description", "severity", "timestamp", "tags"]
+
+IMPORT_MAX_ROWS = int(os.getenv("MSD_IMPORT_MAX_ROWS", "10000"))
+IMPORT_MAX_BYTES = int(os.getenv("MSD_IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+
+
+class ImportFormatError(ValueError):
+    """Corpo non leggibile nel formato indicato (errore dell'intera richiesta)."""
+
+
+def detect_format(fmt: Optional[str], content_type: Optional[str]) -> str:
+    if fmt:
+        if fmt not in FORMATS:
+            raise ImportFormatError(f"Formato non supportato: {fmt}")
+        return fmt
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    if ctype in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        return "ndjson"
+    if ctype in ("text/csv", "application/csv"):
+        return "csv"
+    return "json"
+
+
+def _raw_rows(body: bytes, fmt: str) -> Iterator[Tuple[int, object]]:
+    """(numero riga da 1, dati grezzi oppure eccezione di parsing della singola riga)."""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ImportFormatError("Il file deve essere in UTF-8")
+
+    if fmt == "json":
+        try:
+            data = json.loads(text or "[]")
+        except ValueError as e:
+            raise ImportFormatError(f"JSON non valido: {e}")
+        if not isinstance(data, list):
+            raise ImportFormatError("Il JSON deve essere un array di sintomi")
+        yield from enumerate(data, start=1)
+
+    elif fmt == "ndjson":
+        for n, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                yield n, e
+
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {"title", "severity", "timestamp"} - set(reader.fieldnames or [])
+        if missing:
+            raise ImportFormatError(f"Colonne CSV mancanti: {', '.join(sorted(missing))}")
+        for n, row in enumerate(reader, start=1):
+            # cella vuota = campo assente
+            yield n, {k: v for k, v in row.items() if k and v not in ("", None)}
+
+
+def _messaggi(e: ValidationError) -> List[str]:
+    return [".".join(str(p) for p in err["loc"]) + ": " + err["msg"] for err in e.errors()]
+
+
+def parse_rows(body: bytes, fmt: str) -> Tuple[List[Tuple[int, SymptomEntryCreate]], List[dict]]:
+    """Righe valide (numero, sintomo) ed errori [{row, errors}] del corpo importato."""
+    valid, errors = [], []
+    for n, raw in _raw_rows(body, fmt):
+        if n > IMPORT_MAX_ROWS:
+            raise ImportFormatError(f"Massimo {IMPORT_MAX_ROWS} righe per import")
+        if isinstance(raw, Exception):
+            errors.append({"row": n, "errors": [f"JSON non valido: {raw}"]})
+            continue
+        if not isinstance(raw, dict):
+            errors.append({"row": n, "errors": ["La riga deve essere un oggetto"]})
+            continue
+        try:
+            valid.append((n, SymptomEntryCreate(**raw)))
+        except ValidationError as e:
+            errors.append({"row": n, "errors": _messaggi(e)})
+    return valid, errors
+
+
+# export
+
+def _csv_line(values: list) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+
+def serialize(rows: Iterable[dict], fmt: str) -> Iterator[str]:
+    """Serializza i sintomi (dict con CSV_FIELDS) un elemento alla volta."""
+    if fmt == "csv":
+        yield _csv_line(CSV_FIELDS)
+        for row in rows:
+            yield _csv_line([
+                row["timestamp"].isoformat() if k == "timestamp" else ("" if row[k] is None else row[k])
+                for k in CSV_FIELDS
+            ])
+        return
+
+    first = True
+    if fmt == "json":
+        yield "["
+    for row in rows:
+        item = dict(row, timestamp=row["timestamp"].isoformat())
+        if fmt == "json":
+            yield ("" if first else ",") + json.dumps(item)
+        else:
+            yield json.dumps(item) + "\n"
+        first = False
+    if fmt == "json":
+        yield "]"
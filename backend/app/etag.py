@@ -0,0 +1,40 @@
+import zlib
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# GET condizionali: ETag costruito da contatori di versione (versions.py),
+# così il confronto con If-None-Match non richiede di leggere i dati.
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make(*parts) -> str:
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+
+def query_key(request: Request) -> str:
+    """Impronta dei parametri di query: liste filtrate diverse hanno ETag diversi."""
+    query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    return format(zlib.crc32(query.encode()), "08x")
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # confronto debole: W/"x" equivale a "x" per GET
+    return "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags]
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=headers(etag))
+
+
+def headers(etag: str) -> Dict[str, str]:
+    """Header per le risposte costruite direttamente (es. fastjson.response)."""
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def set_headers(response: Response, etag: str) -> None:
+    response.headers.update(headers(etag))
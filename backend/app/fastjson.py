@@ -0,0 +1,44 @@
+import json
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fallback senza orjson
+    orjson = None
+
+# Risposte JSON veloci per le liste: righe lette come tuple di colonne
+# (niente oggetti ORM), convertite in dict e serializzate direttamente.
+# I dati vengono dal DB e hanno già i tipi dello schema, quindi si salta la
+# validazione Pydantic per riga; response_model sulla route resta per la doc.
+
+MEDIA_TYPE = "application/json"
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        # date/ora/datetime in ISO 8601 come Pydantic; chiavi non stringa (es. conteggi) ammesse
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def records(rows: Sequence) -> List[Dict[str, Any]]:
+    """Righe SQLAlchemy (Row) in dict, con i nomi delle colonne letti una volta sola."""
+    if not rows:
+        return []
+    fields = rows[0]._fields
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def response(content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=dumps(content), media_type=MEDIA_TYPE, headers=headers)
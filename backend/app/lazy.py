@@ -0,0 +1,49 @@
+import importlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from types import ModuleType
+from typing import Callable, Optional
+
+# Risorse pesanti create al primo uso, non all'import dell'app
+# (bench.startup controlla che l'avvio non carichi moduli come numpy).
+
+
+def module(name: str) -> Callable[[], ModuleType]:
+    """Funzione che importa il modulo `name` alla prima chiamata e poi lo restituisce."""
+    loaded: Optional[ModuleType] = None
+
+    def get() -> ModuleType:
+        nonlocal loaded
+        if loaded is None:
+            loaded = importlib.import_module(name)
+        return loaded
+
+    return get
+
+
+class SpawnPool:
+    """ProcessPoolExecutor creato alla prima richiesta, con processi avviati in spawn."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: il processo figlio non eredita le connessioni DB né i thread del server
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def submit(self, fn, *args):
+        return self.get().submit(fn, *args)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -1,15 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import Base, engine
-from .routers import auth_routes, patients_routes, entries_routes, appointments_routes
+from . import availability, cohort, metrics, migrations, passwords, pdf_render, sql_diagnostics
+from .database import DB_MODE, SessionLocal, dispose_async_engine, engine
+from .routers import auth_routes, patients_routes, entries_routes, appointments_routes, metrics_routes
+
+# L'import di app.main non tocca il database: schema e indici in memoria
+# vengono preparati nel lifespan, all'avvio del server. ReportLab, passlib,
+# python-jose e NumPy vengono importati al primo utilizzo.
+
+
+def carica_disponibilita():
+    db = SessionLocal()
+    try:
+        availability.index.rebuild(db)
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema: applica (o verifica, MSD_MIGRATIONS=check) le migrazioni; con
+    # MSD_MIGRATIONS=off vanno eseguite a parte (python -m app.migrations upgrade)
+    migrations.startup(engine)
+    carica_disponibilita()
+    # ricalcolo periodico delle statistiche di coorte admin
+    cohort_task = None
+    if cohort.COHORT_REFRESH > 0:
+        cohort_task = asyncio.create_task(cohort.refresh_loop(SessionLocal))
+    try:
+        yield
+    finally:
+        if cohort_task is not None:
+            cohort_task.cancel()
+        pdf_render.shutdown()
+        passwords.shutdown()
+        await dispose_async_engine()
 
-# Crea le tabelle allo start
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Medical Symptom Diary API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Middleware
@@ -24,10 +59,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# latenza, status e SQL per route, esposti su /metrics
+if metrics.ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# solo sviluppo/staging: query lente, N+1 e budget di query (MSD_SQL_DIAGNOSTICS=1)
+if sql_diagnostics.ENABLED:
+    app.add_middleware(sql_diagnostics.DiagnosticsMiddleware)
+
+if DB_MODE == "async":
+    from .routers import async_routes
+
+    app.include_router(async_routes.router)
+
 app.include_router(auth_routes.router)
 app.include_router(patients_routes.router)
 app.include_router(entries_routes.router)
 app.include_router(appointments_routes.router)
+app.include_router(metrics_routes.router)
 
 
 @app.get("/")
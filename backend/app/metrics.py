@@ -0,0 +1,263 @@
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+
+from . import cache, passwords, pdf_cache
+
+# Metriche del processo in formato testo Prometheus (GET /metrics).
+# Il middleware registra per route (il template del path, non l'URL, per non
+# moltiplicare le serie) latenza, status e richieste in corso; gli eventi
+# dell'engine contano gli statement SQL e il tempo speso, per richiesta e in
+# totale (anche fuori dalle richieste, es. ricalcolo coorte). Si aggiungono
+# hit/miss delle cache. Con più worker uvicorn ogni processo ha i suoi contatori.
+#
+# /metrics è chiuso per default: risponde a "Authorization: Bearer <token>" con
+# MSD_METRICS_TOKEN oppure con il JWT di un admin, altrimenti 401/403.
+#
+#   MSD_METRICS=0         disattiva middleware ed eventi SQL
+#   MSD_METRICS_TOKEN=... token dello scraper Prometheus
+#   MSD_METRICS_PUBLIC=1  opt-out: /metrics senza autenticazione (solo se la
+#                         porta non è raggiungibile dall'esterno)
+
+ENABLED = os.getenv("MSD_METRICS", "1") != "0"
+METRICS_TOKEN = os.getenv("MSD_METRICS_TOKEN") or None
+PUBLIC = os.getenv("MSD_METRICS_PUBLIC", "0") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# route non trovate (404): un'unica etichetta, mai l'URL richiesto
+UNMATCHED = "unmatched"
+
+# [statement, secondi] della richiesta in corso; None fuori dalle richieste
+_request_sql: ContextVar[Optional[list]] = ContextVar("msd_request_sql", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # l'ultimo è +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.in_flight = 0
+            self.requests: Dict[Tuple[str, str, int], int] = {}
+            self.latency: Dict[Tuple[str, str], Histogram] = {}
+            self.request_sql_count: Dict[Tuple[str, str], Histogram] = {}
+            self.request_sql_time: Dict[Tuple[str, str], Histogram] = {}
+            self.sql_statements = 0
+            self.sql_seconds = 0.0
+            self.sql_errors = 0
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, sql: list) -> None:
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            for table, buckets, value in (
+                (self.latency, LATENCY_BUCKETS, seconds),
+                (self.request_sql_count, SQL_COUNT_BUCKETS, sql[0]),
+                (self.request_sql_time, SQL_TIME_BUCKETS, sql[1]),
+            ):
+                if key not in table:
+                    table[key] = Histogram(buckets)
+                table[key].observe(value)
+
+    def sql_executed(self, seconds: float) -> None:
+        with self._lock:
+            self.sql_statements += 1
+            self.sql_seconds += seconds
+
+    def sql_failed(self) -> None:
+        with self._lock:
+            self.sql_errors += 1
+
+
+registry = Registry()
+
+
+# SQL
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("msd_sql_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["msd_sql_start"].pop()
+    registry.sql_executed(elapsed)
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += elapsed
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("msd_sql_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+    registry.sql_failed()
+
+
+def instrument_engine(engine) -> None:
+    """Registra gli eventi di conteggio SQL su un engine sync (per l'async: engine.sync_engine)."""
+    if not ENABLED or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# HTTP
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza, status, richieste in corso e SQL per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # se l'app solleva un'eccezione prima di rispondere
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        registry.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_sql.reset(token)
+            # FastAPI mette nello scope la route trovata
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED
+            registry.request_finished(scope["method"], route, status, time.perf_counter() - start, sql)
+
+
+# formato testo Prometheus
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def header(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels) -> None:
+        self.lines.append(f"{name}{_labels(**labels)} {_number(value)}")
+
+    def histograms(self, name: str, help_text: str, table: Dict[Tuple[str, str], Histogram]) -> None:
+        self.header(name, "histogram", help_text)
+        for (method, route), hist in sorted(table.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets + (math.inf,), hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _number(float(bound))
+                self.sample(f"{name}_bucket", cumulative, method=method, route=route, le=le)
+            self.sample(f"{name}_sum", hist.sum, method=method, route=route)
+            self.sample(f"{name}_count", cumulative, method=method, route=route)
+
+
+def _cache_stats() -> Dict[str, dict]:
+    stats = dict(cache.all_stats())
+    pdf = pdf_cache.stats()
+    stats["pdf_diary"] = {"size": pdf["files"], "hits": pdf["hits"], "misses": pdf["misses"]}
+    return stats
+
+
+def render() -> str:
+    w = _Writer()
+    with registry._lock:
+        w.header("msd_http_requests_in_flight", "gauge", "Richieste HTTP in corso.")
+        w.sample("msd_http_requests_in_flight", registry.in_flight)
+
+        w.header("msd_http_requests_total", "counter", "Richieste HTTP completate per route e status.")
+        for (method, route, status), count in sorted(registry.requests.items()):
+            w.sample("msd_http_requests_total", count, method=method, route=route, status=status)
+
+        w.histograms("msd_http_request_duration_seconds", "Latenza delle richieste HTTP.", registry.latency)
+        w.histograms("msd_http_request_sql_statements", "Statement SQL eseguiti per richiesta.",
+                     registry.request_sql_count)
+        w.histograms("msd_http_request_sql_seconds", "Tempo SQL per richiesta.", registry.request_sql_time)
+
+        w.header("msd_sql_statements_total", "counter", "Statement SQL eseguiti (anche fuori dalle richieste).")
+        w.sample("msd_sql_statements_total", registry.sql_statements)
+        w.header("msd_sql_seconds_total", "counter", "Tempo totale speso negli statement SQL.")
+        w.sample("msd_sql_seconds_total", registry.sql_seconds)
+        w.header("msd_sql_errors_total", "counter", "Statement SQL terminati con errore.")
+        w.sample("msd_sql_errors_total", registry.sql_errors)
+
+    caches = _cache_stats()
+    w.header("msd_cache_hits_total", "counter", "Letture trovate in cache.")
+    for name, s in sorted(caches.items()):
+        w.sample("msd_cache_hits_total", s["hits"], cache=name)
+    w.header("msd_cache_misses_total", "counter", "Letture non trovate in cache.")
+    for name, s in sorted(caches.items()):
+        w.sample("msd_cache_misses_total", s["misses"], cache=name)
+    w.header("msd_cache_hit_ratio", "gauge", "Hit / (hit + miss) dall'avvio; NaN senza letture.")
+    for name, s in sorted(caches.items()):
+        lookups = s["hits"] + s["misses"]
+        w.sample("msd_cache_hit_ratio", s["hits"] / lookups if lookups else math.nan, cache=name)
+    w.header("msd_cache_entries", "gauge", "Elementi presenti in cache.")
+    for name, s in sorted(caches.items()):
+        w.sample("msd_cache_entries", s["size"], cache=name)
+
+    pdf = pdf_cache.stats()
+    w.header("msd_pdf_cache_bytes", "gauge", "Byte occupati dalla cache PDF su disco.")
+    w.sample("msd_pdf_cache_bytes", pdf["bytes"])
+    w.header("msd_pdf_cache_max_bytes", "gauge", "Limite della cache PDF su disco.")
+    w.sample("msd_pdf_cache_max_bytes", pdf["max_bytes"])
+
+    cost = passwords.hash_cost()
+    w.header("msd_password_hash_rounds", "gauge", "Round configurati per l'hash delle password.")
+    w.sample("msd_password_hash_rounds", cost["rounds"], scheme=cost["scheme"])
+    w.header("msd_password_hash_workers", "gauge", "Processi del pool di hash delle password.")
+    w.sample("msd_password_hash_workers", cost["workers"])
+    return "\n".join(w.lines) + "\n"
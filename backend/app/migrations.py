@@ -0,0 +1,179 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from . import blobstore, models, rollups, search
+from .database import Base
+
+# Migrazioni di schema versionate.
+# Ogni migrazione ha un numero crescente ed è idempotente (controlla cosa
+# esiste già prima di modificare), così funziona sia su un DB nuovo, dove la
+# prima crea già lo schema attuale, sia su un DB creato da versioni precedenti.
+# Le versioni applicate restano in schema_migrations.
+#
+#   python -m app.migrations status | upgrade | check | plans
+#
+# All'avvio (main.py) il comportamento dipende da MSD_MIGRATIONS:
+# upgrade (default) applica quelle mancanti, check rifiuta l'avvio se ne
+# mancano, off non fa nulla.
+
+STARTUP_MODE = os.getenv("MSD_MIGRATIONS", "upgrade").lower()
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+class PendingMigrations(RuntimeError):
+    pass
+
+
+def _tabelle(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+
+
+def _pdf_blobstore(engine) -> None:
+    # DB precedenti al blob store: pdf_base64 -> blob + pdf_ref
+    blobstore.migrate_appointments(engine)
+
+
+_SYNC_COLUMNS = {
+    "updated_at": "DATETIME",
+    "deleted_at": "DATETIME",
+    "change_seq": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def _sintomi_sync(engine) -> None:
+    # colonne della sync incrementale (sync.py) sui DB creati prima
+    existing = {c["name"] for c in inspect(engine).get_columns("symptom_entries")}
+    missing = [name for name in _SYNC_COLUMNS if name not in existing]
+    if not missing:
+        return
+    with engine.begin() as conn:
+        for name in missing:
+            conn.execute(text(f"ALTER TABLE symptom_entries ADD COLUMN {name} {_SYNC_COLUMNS[name]}"))
+        if "updated_at" in missing:
+            conn.execute(text("UPDATE symptom_entries SET updated_at = timestamp"))
+
+
+def _indici(engine) -> None:
+    # create_all non aggiunge indici a una tabella già esistente
+    for model in (models.SymptomEntry, models.EntryTag, models.SymptomRollup, models.Appointment):
+        for index in model.__table__.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError as e:
+                # indice unico su dati esistenti che lo violano (es. due visite attive nello stesso slot)
+                raise RuntimeError(
+                    f"Impossibile creare {index.name}: ci sono righe duplicate da correggere"
+                ) from e
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "tabelle", _tabelle),
+    Migration(2, "pdf_blobstore", _pdf_blobstore),
+    Migration(3, "sintomi_sync", _sintomi_sync),
+    Migration(4, "indici", _indici),
+    Migration(5, "fts_sintomi", search.ensure_schema),
+    Migration(6, "rollup_sintomi", rollups.ensure_built),
+    Migration(7, "tag_sintomi", search.backfill_tags),
+    Migration(8, "indice_proposte", _indici),
+]
+
+
+def applied_versions(engine) -> set:
+    if not inspect(engine).has_table(schema_migrations.name):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine) -> List[Migration]:
+    done = applied_versions(engine)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def upgrade(engine) -> List[Migration]:
+    """Applica in ordine le migrazioni mancanti e restituisce quelle eseguite."""
+    _metadata.create_all(bind=engine)
+    todo = pending(engine)
+    for m in todo:
+        logger.info("Migrazione %03d %s", m.version, m.name)
+        m.apply(engine)
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    schema_migrations.insert().values(
+                        version=m.version, name=m.name, applied_at=datetime.utcnow()
+                    )
+                )
+        except IntegrityError:
+            # registrata nel frattempo da un altro processo (le migrazioni sono idempotenti)
+            pass
+    return todo
+
+
+def startup(engine, mode: str = STARTUP_MODE) -> None:
+    if mode == "off":
+        return
+    if mode == "check":
+        todo = pending(engine)
+        if todo:
+            names = ", ".join(f"{m.version:03d} {m.name}" for m in todo)
+            raise PendingMigrations(f"Migrazioni da applicare: {names} (python -m app.migrations upgrade)")
+        return
+    upgrade(engine)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Migrazioni di schema")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="elenca le migrazioni e il loro stato")
+    sub.add_parser("upgrade", help="applica le migrazioni mancanti")
+    sub.add_parser("check", help="esce con codice 1 se ci sono migrazioni da applicare")
+    sub.add_parser("plans", help="EXPLAIN QUERY PLAN delle query delle route: errore se c'è una scansione completa")
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    if args.command == "status":
+        done = applied_versions(engine)
+        for m in MIGRATIONS:
+            print(f"{m.version:03d} {m.name:<16} {'applicata' if m.version in done else 'da applicare'}")
+    elif args.command == "upgrade":
+        done = upgrade(engine)
+        print(f"Migrazioni applicate: {len(done)}")
+    elif args.command == "check":
+        todo = pending(engine)
+        for m in todo:
+            print(f"{m.version:03d} {m.name} da applicare")
+        sys.exit(1 if todo else 0)
+    elif args.command == "plans":
+        from . import query_plans
+
+        upgrade(engine)
+        sys.exit(0 if query_plans.report(engine) else 1)
+
+
+if __name__ == "__main__":
+    main()
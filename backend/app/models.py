@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Time, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Date, Time, Boolean, Index
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -17,7 +17,6 @@ class User(Base):
 
 
     entries = relationship("SymptomEntry", back_populates="user", cascade="all, delete")
-    snapshots = relationship("Snapshot", back_populates="user", cascade="all, delete")
 
 # classe sintomi
 
@@ -33,11 +32,63 @@ class SymptomEntry(Base):
     timestamp = Column(DateTime, nullable=False)
     tags = Column(String(255), nullable=True)  
 
+    # sync incrementale: change_seq = versione del diario dell'utente all'ultima
+    # modifica; le eliminazioni lasciano la riga come tombstone (deleted_at)
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
+
     user = relationship("User", back_populates="entries")
 
+    # feed admin: paginazione keyset su (timestamp, id)
+    __table_args__ = (
+        Index("ix_symptom_entries_timestamp_id", "timestamp", "id"),
+        Index("ix_symptom_entries_user_change", "user_id", "change_seq", "id"),
+        # diario di un utente per intervallo di date (lista, timeline)
+        Index("ix_symptom_entries_user_timestamp", "user_id", "timestamp"),
+    )
+
+
+# tag normalizzati dei sintomi (minuscoli, uno per riga), mantenuti da search.py
+
+class EntryTag(Base):
+    __tablename__ = "entry_tags"
+
+    entry_id = Column(Integer, ForeignKey("symptom_entries.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(100), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_entry_tags_tag_entry", "tag", "entry_id"),
+        Index("ix_entry_tags_user_tag", "user_id", "tag"),
+    )
+
+
+# aggregati giornalieri dei sintomi per utente e tag (tag "" = tutti i sintomi del giorno),
+# mantenuti da rollups.py
+
+class SymptomRollup(Base):
+    __tablename__ = "symptom_rollups"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    tag = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False)
+    severity_sum = Column(Integer, nullable=False)
+    severity_min = Column(Integer, nullable=False)
+    severity_max = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_symptom_rollups_day_tag", "day", "tag"),
+    )
+
 
 # classe appuntamenti
 
+# stati che occupano uno slot (struttura, data, ora)
+ACTIVE_STATUSES = ("PENDING", "PROPOSED", "CONFIRMED")
+
+
 class Appointment(Base):
     __tablename__ = "appointments"
 
@@ -52,6 +103,43 @@ class Appointment(Base):
     status = Column(String, nullable=False, default="PENDING")
 
     pdf_filename = Column(String, nullable=False)
-    pdf_base64 = Column(Text, nullable=False)
+    # sha256 del PDF nel blob store (blobstore.py), il contenuto non sta nella riga
+    pdf_ref = Column(String(64), nullable=True)
 
     user = relationship("User")
+
+    # coda admin: filtri per stato/struttura ordinati per data e ora
+    __table_args__ = (
+        Index("ix_appointments_status_date_time", "status", "date", "time"),
+        Index("ix_appointments_facility_date_time", "facility", "date", "time"),
+        # lista admin completa (e coda senza filtri) ordinata per data e ora
+        Index("ix_appointments_date_time", "date", "time"),
+        # visite di un utente ordinate per data e ora
+        Index("ix_appointments_user_date_time", "user_id", "date", "time"),
+        # un solo appuntamento attivo per slot: garantito dal DB, non da un check-then-insert
+        Index(
+            "uq_appointments_active_slot",
+            "facility", "date", "time",
+            unique=True,
+            sqlite_where=status.in_(ACTIVE_STATUSES),
+            postgresql_where=status.in_(ACTIVE_STATUSES),
+        ),
+        # due proposte aperte non possono indicare lo stesso slot
+        Index(
+            "uq_appointments_proposed_slot",
+            "facility", "proposed_date", "proposed_time",
+            unique=True,
+            sqlite_where=status == "PROPOSED",
+            postgresql_where=status == "PROPOSED",
+        ),
+    )
+
+
+# versione delle collezioni per utente (es. diario sintomi), incrementata a ogni modifica
+
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+
+    collection = Column(String(50), primary_key=True)
+    owner_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,61 @@
+import base64
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# cursori opachi per la paginazione keyset (ordinamento discendente)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Serializza i valori della chiave di ordinamento in un cursore opaco."""
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parsers: List[Callable[[Any], Any]]) -> List[Any]:
+    """
+    Decodifica il cursore applicando un parser per ogni valore
+    (es. datetime.fromisoformat per i timestamp, int per gli id).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError(cursor)
+        return [parse(v) for parse, v in zip(parsers, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+
+def keyset_before(columns: list, values: list):
+    """
+    Condizione "riga successiva al cursore" per ORDER BY col1 DESC, col2 DESC, ...
+    Espansa in OR/AND così funziona anche dove i row-value non sono supportati.
+    """
+    clauses = []
+    for i, col in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, col < values[i]))
+    return or_(*clauses)
+
+
+def keyset_after(columns: list, values: list):
+    """Come keyset_before, per ORDER BY col1 ASC, col2 ASC, ..."""
+    clauses = []
+    for i, col in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, col > values[i]))
+    return or_(*clauses)
+
+
+def paginate(rows: list, limit: int, key: Callable[[Any], tuple]) -> Tuple[list, Optional[str]]:
+    """
+    Riceve fino a limit + 1 righe: restituisce la pagina e il cursore
+    della pagina seguente (None se la pagina corrente è l'ultima).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(*key(page[-1]))
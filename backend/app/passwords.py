@@ -0,0 +1,60 @@
+import asyncio
+import os
+from typing import Optional, Tuple
+
+from . import lazy
+
+# Hash PBKDF2-SHA256.
+# Il calcolo è CPU-bound e tiene il GIL: le API lo eseguono in un pool di processi
+# dedicato e limitato (MSD_HASH_WORKERS), così un picco di login non blocca
+# il threadpool delle altre richieste. Il contesto passlib viene creato al
+# primo hash (di solito nei processi del pool), non all'import.
+
+HASH_SCHEME = "pbkdf2_sha256"
+PBKDF2_ROUNDS = int(os.getenv("MSD_PBKDF2_ROUNDS", "29000"))
+HASH_WORKERS = int(os.getenv("MSD_HASH_WORKERS", "2"))
+
+_pwd_context = None
+_pool = lazy.SpawnPool(HASH_WORKERS)
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        # min/max uguali ai round configurati: un hash con costo diverso va aggiornato al login
+        _pwd_context = CryptContext(
+            schemes=[HASH_SCHEME],
+            deprecated="auto",
+            pbkdf2_sha256__default_rounds=PBKDF2_ROUNDS,
+            pbkdf2_sha256__min_rounds=PBKDF2_ROUNDS,
+            pbkdf2_sha256__max_rounds=PBKDF2_ROUNDS,
+        )
+    return _pwd_context
+
+
+def hash_cost() -> dict:
+    """Parametri di costo configurati, per diagnostica/metriche."""
+    return {"scheme": HASH_SCHEME, "rounds": PBKDF2_ROUNDS, "workers": HASH_WORKERS}
+
+
+def hash_password(password: str) -> str:
+    return pwd_context().hash(password or "")
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(password corretta, nuovo hash se i parametri di costo sono cambiati)."""
+    return pwd_context().verify_and_update(password or "", hashed)
+
+
+async def ahash_password(password: str) -> str:
+    return await asyncio.wrap_future(_pool.submit(hash_password, password))
+
+
+async def averify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return await asyncio.wrap_future(_pool.submit(verify_and_update, password, hashed))
+
+
+def shutdown() -> None:
+    _pool.shutdown()
@@ -0,0 +1,127 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional
+
+# Cache su disco dei PDF diario già generati, chiave (utente, versione diario).
+# Una nuova versione rende obsolete le precedenti dello stesso utente;
+# oltre MAX_BYTES vengono eliminati i file usati meno di recente (LRU).
+# I PDF vengono restituiti già aperti (sotto lock): se un'evizione o una nuova
+# versione li rimuove mentre la risposta è in corso, l'handle resta leggibile.
+
+CACHE_DIR = Path(os.getenv("MSD_PDF_CACHE_DIR", "./pdf_cache"))
+MAX_BYTES = int(os.getenv("MSD_PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_index: Optional["OrderedDict[str, int]"] = None  # nome file -> dimensione, dal meno recente
+_total = 0
+CHUNK_BYTES = 64 * 1024
+_hits = 0
+_misses = 0
+
+
+def _name(user_id: int, version: int) -> str:
+    return f"{user_id}-{version}.pdf"
+
+
+def _load_index() -> "OrderedDict[str, int]":
+    # ricostruisce l'ordine LRU dai mtime dei file già presenti (riavvio)
+    global _index, _total
+    if _index is None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        files = sorted(CACHE_DIR.glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+        _index = OrderedDict((p.name, p.stat().st_size) for p in files)
+        _total = sum(_index.values())
+    return _index
+
+
+def _remove(name: str) -> None:
+    global _total
+    _total -= _index.pop(name, 0)
+    try:
+        (CACHE_DIR / name).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _versions(index: "OrderedDict[str, int]", user_id: int) -> List[int]:
+    prefix = f"{user_id}-"
+    return [int(n[len(prefix):-len(".pdf")]) for n in index if n.startswith(prefix)]
+
+
+def open_file(user_id: int, version: int) -> Optional[BinaryIO]:
+    """PDF in cache aperto in lettura (aggiornandone l'uso) oppure None."""
+    global _hits, _misses
+    name = _name(user_id, version)
+    with _lock:
+        index = _load_index()
+        if name not in index:
+            _misses += 1
+            return None
+        index.move_to_end(name)
+        file_path = CACHE_DIR / name
+        try:
+            f = open(file_path, "rb")
+            os.utime(file_path)
+        except FileNotFoundError:
+            _remove(name)
+            _misses += 1
+            return None
+        _hits += 1
+        return f
+
+
+def iter_file(f: BinaryIO) -> Iterator[bytes]:
+    """Contenuto di un file aperto da open_file/put_file a blocchi; lo chiude alla fine."""
+    with f:
+        while chunk := f.read(CHUNK_BYTES):
+            yield chunk
+
+
+def tmp_path(user_id: int, version: int) -> Path:
+    """File temporaneo in cui generare un PDF prima di registrarlo con put_file."""
+    with _lock:
+        _load_index()
+    return CACHE_DIR / f".{_name(user_id, version)}.{uuid.uuid4().hex}.tmp"
+
+
+def put_file(user_id: int, version: int, tmp: Path) -> BinaryIO:
+    """
+    Sposta in cache un PDF già scritto su disco, applica l'evizione LRU e lo
+    restituisce aperto. Se in cache c'è già una versione più recente dello
+    stesso utente (render lento finito dopo), il file non viene registrato e
+    serve solo alla risposta in corso.
+    """
+    global _total
+    name = _name(user_id, version)
+    size = tmp.stat().st_size
+    with _lock:
+        index = _load_index()
+
+        cached = _versions(index, user_id)
+        if any(v > version for v in cached):
+            return open(tmp, "rb")
+
+        # versioni precedenti dello stesso utente non servono più
+        for old in cached:
+            if old < version:
+                _remove(_name(user_id, old))
+
+        os.replace(tmp, CACHE_DIR / name)
+        _total += size - index.get(name, 0)
+        index[name] = size
+        index.move_to_end(name)
+        f = open(CACHE_DIR / name, "rb")
+
+        # l'ultimo file inserito resta anche se da solo supera il limite
+        while _total > MAX_BYTES and len(index) > 1:
+            _remove(next(iter(index)))
+    return f
+
+
+def stats() -> dict:
+    with _lock:
+        index = _load_index()
+        return {"files": len(index), "bytes": _total, "max_bytes": MAX_BYTES, "hits": _hits, "misses": _misses}
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+from typing import BinaryIO
+
+from . import lazy, pdf_cache
+
+# Creazione pdf diario sintomi (visuale admin).
+# Il disegno è CPU-bound: gira in un pool di processi separato dai worker HTTP,
+# legge i sintomi a blocchi dal DB e scrive il documento su file, da cui
+# la risposta viene poi servita a chunk. ReportLab viene importato solo nei
+# processi del pool, al primo PDF.
+
+PDF_WORKERS = int(os.getenv("MSD_PDF_WORKERS", "2"))
+# render in coda + in esecuzione oltre cui si risponde 503
+PDF_MAX_PENDING = int(os.getenv("MSD_PDF_MAX_PENDING", "8"))
+FETCH_BATCH = 500
+
+FONT = "Helvetica"
+FONT_SIZE = 10
+LINE_HEIGHT = 15
+MARGIN_LEFT = 50
+MARGIN_BOTTOM = 80
+
+_pool = lazy.SpawnPool(PDF_WORKERS)
+_slots = threading.BoundedSemaphore(PDF_MAX_PENDING)
+
+
+class RendererBusy(Exception):
+    pass
+
+
+class EmptyDiary(Exception):
+    pass
+
+
+def _draw_lines(pdf, lines, x, y, height):
+    for line in lines:
+        if y < MARGIN_BOTTOM:
+            pdf.showPage()
+            y = height - 50
+            pdf.setFont(FONT, FONT_SIZE)
+        pdf.drawString(x, y, line)
+        y -= LINE_HEIGHT
+    return y
+
+
+def diary_query(user_id: int):
+    """SELECT dei sintomi disegnati nel diario, dal più vecchio."""
+    from sqlalchemy import select
+
+    from . import models
+
+    E = models.SymptomEntry
+    return (
+        select(E.timestamp, E.title, E.severity, E.description)
+        .where(E.user_id == user_id, E.deleted_at.is_(None))
+        .order_by(E.timestamp.asc())
+    )
+
+
+def render_diary_to_file(user_id: int, email: str, out_path: str) -> int:
+    """
+    Eseguita nel processo del pool: disegna il diario di user_id su out_path
+    iterando i sintomi a blocchi. Restituisce il numero di sintomi disegnati.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    from .database import SessionLocal
+
+    pdf = canvas.Canvas(out_path, pagesize=A4)
+    width, height = A4
+    text_width = width - 2 * MARGIN_LEFT
+
+    y = height - 50
+    pdf.setFont("Helvetica-Bold", 14)
+    pdf.drawString(MARGIN_LEFT, y, "Diario Sintomi")
+    y -= 30
+
+    pdf.setFont(FONT, FONT_SIZE)
+    pdf.drawString(MARGIN_LEFT, y, f"Utente: {email}")
+    y -= 30
+
+    stmt = diary_query(user_id).execution_options(yield_per=FETCH_BATCH)
+
+    count = 0
+    db = SessionLocal()
+    try:
+        for ts, title, severity, description in db.execute(stmt):
+            header = f"- {ts.strftime('%d/%m/%Y %H:%M')} | {title} (Sev. {severity}/10)"
+            y = _draw_lines(pdf, simpleSplit(header, FONT, FONT_SIZE, text_width), MARGIN_LEFT, y, height)
+            if description:
+                lines = []
+                for paragraph in description.splitlines() or [""]:
+                    lines.extend(simpleSplit(paragraph, FONT, FONT_SIZE, text_width - 10) or [""])
+                y = _draw_lines(pdf, lines, MARGIN_LEFT + 10, y, height)
+            count += 1
+    finally:
+        db.close()
+
+    if count:
+        pdf.save()
+    return count
+
+
+async def render_diary(user_id: int, email: str, version: int) -> BinaryIO:
+    """Renderizza nel pool e registra il file in cache; restituisce il file aperto."""
+    if not _slots.acquire(blocking=False):
+        raise RendererBusy()
+    tmp = pdf_cache.tmp_path(user_id, version)
+    try:
+        future = _pool.submit(render_diary_to_file, user_id, email, str(tmp))
+        count = await asyncio.wrap_future(future)
+        if not count:
+            raise EmptyDiary()
+        return pdf_cache.put_file(user_id, version, tmp)
+    finally:
+        _slots.release()
+        if tmp.exists():
+            tmp.unlink()
+
+
+def shutdown() -> None:
+    _pool.shutdown()
@@ -0,0 +1,139 @@
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Callable, List, Tuple
+
+from sqlalchemy import event, select
+
+from . import models, search, versions
+from .pagination import encode_cursor
+
+# Verifica dei piani di esecuzione (SQLite): per ogni query usata dalle route
+# esegue EXPLAIN QUERY PLAN e segnala le scansioni complete di tabella.
+# "SCAN tabella" (senza indice) è sempre un errore; "SCAN tabella USING INDEX"
+# (tutte le righe, in ordine di indice) è ammesso solo per le query segnate
+# come liste complete (liste/feed admin, statistiche di coorte).
+#
+#   python -m app.migrations plans
+
+E = models.SymptomEntry
+A = models.Appointment
+
+_SCAN = re.compile(r"^SCAN (\w+)( USING (?:COVERING )?INDEX \w+)?$")
+
+# query che leggono per costruzione tutta la tabella (in ordine di indice)
+FULL_LISTING = True
+
+
+def _queries(db_session) -> List[Tuple[str, object, bool]]:
+    # import qui: i router importano a loro volta moduli dell'app
+    from . import availability, cohort, pdf_render, rollups, sync, timeline
+    from .routers.appointments_routes import (
+        _admin_queue_counts, _admin_queue_filters, _admin_queue_query, query_admin_appuntamenti,
+        query_miei_appuntamenti,
+    )
+    from .routers.entries_routes import (
+        _ADMIN_FEED_COLUMNS, _SEARCH_COLUMNS, _admin_feed_query, query_admin_sintomi, query_miei_sintomi,
+    )
+
+    day = datetime(2024, 1, 1)
+    d, t = date(2024, 1, 1), time(9, 0)
+    user_id = 1
+    live = E.deleted_at.is_(None)
+
+    return [
+        # utenti e versioni
+        ("utente per email", select(models.User).where(models.User.email == "a@b.it"), False),
+        ("utente per id", select(models.User).where(models.User.id == user_id), False),
+        ("versione collezione", versions._get_stmt(versions.ENTRIES, user_id), False),
+        # diario del paziente
+        ("sintomi utente", query_miei_sintomi(user_id, None, None, None), False),
+        ("sintomi utente per data", query_miei_sintomi(user_id, day, day + timedelta(days=30), None), False),
+        ("sintomi utente per tag", query_miei_sintomi(user_id, None, None, "nausea"), False),
+        ("sintomo per id", select(E).where(E.id == 1, E.user_id == user_id, live), False),
+        ("ricerca full-text utente", search.search_stmt(_SEARCH_COLUMNS, "testa", db_session, user_id=user_id)[0], False),
+        ("timeline utente", timeline.timeline_query(user_id, day, None, None), False),
+        ("sync iniziale", sync.changes_query(user_id, None).limit(501), False),
+        ("sync modifiche", sync.changes_query(user_id, (10, 1)).limit(501), False),
+        ("pdf diario", pdf_render.diary_query(user_id), False),
+        ("andamento utente", rollups.trend_query(d, None, None, user_id), False),
+        ("andamento utente per tag", rollups.trend_query(d, None, "nausea", user_id), False),
+        # admin, sintomi
+        ("lista admin sintomi", query_admin_sintomi(), FULL_LISTING),
+        ("feed admin", _admin_feed_query(None, None, None, None, None, None, None).limit(51), FULL_LISTING),
+        ("feed admin per utente", _admin_feed_query(user_id, None, None, None, None, None, None).limit(51), False),
+        ("feed admin per tag", _admin_feed_query(None, None, None, None, None, "nausea", None).limit(51), False),
+        ("feed admin per data", _admin_feed_query(None, 5, None, day, None, None, None).limit(51), False),
+        (
+            "ricerca full-text admin",
+            search.search_stmt(_ADMIN_FEED_COLUMNS, "testa", db_session)[0]
+            .join(models.User, models.User.id == E.user_id),
+            False,
+        ),
+        ("andamento admin", rollups.trend_query(d, None, None, None), False),
+        ("coorte colonne", cohort.columns_query(day, "sqlite"), False),
+        ("coorte tag", cohort.tags_query(day, "sqlite"), FULL_LISTING),
+        # visite
+        ("visite utente", query_miei_appuntamenti(user_id), False),
+        ("visita per id", select(A).where(A.id == 1), False),
+        ("lista admin visite", query_admin_appuntamenti(), FULL_LISTING),
+        ("coda admin", _admin_queue_query([], None, encode_cursor(d, t, 10)).limit(51), FULL_LISTING),
+        ("coda admin per stato", _admin_queue_query([], ["pending"], None).limit(51), False),
+        (
+            "coda admin per struttura",
+            _admin_queue_query(_admin_queue_filters("Milano", d, None), None, None).limit(51),
+            False,
+        ),
+        ("conteggi coda", _admin_queue_counts(_admin_queue_filters("Milano", None, None)), False),
+        ("slot occupati", availability.held_query(d), False),
+        ("slot occupato nel DB", availability.holders_query("Milano", d, t), False),
+    ]
+
+
+def explain(conn, stmt) -> List[str]:
+    """Righe "detail" di EXPLAIN QUERY PLAN per lo statement (parametri compilati da SQLAlchemy)."""
+    def _prefix(conn, cursor, statement, parameters, context, executemany):
+        return "EXPLAIN QUERY PLAN " + statement, parameters
+
+    event.listen(conn, "before_cursor_execute", _prefix, retval=True)
+    try:
+        # righe del piano lette dal cursore: non corrispondono alle colonne dello statement
+        rows = conn.execute(stmt).cursor.fetchall()
+    finally:
+        event.remove(conn, "before_cursor_execute", _prefix)
+    return [row[3] for row in rows]
+
+
+def full_scans(detail: List[str], full_listing: bool = False) -> List[str]:
+    """Tabelle lette per intero nel piano (la tabella FTS è virtuale ed è esclusa)."""
+    scans = []
+    for m in map(_SCAN.match, detail):
+        if not m or m.group(1) == search.FTS_TABLE:
+            continue
+        if m.group(2) is None or not full_listing:
+            scans.append(m.group(1))
+    return scans
+
+
+def check(engine) -> List[Tuple[str, List[str], List[str]]]:
+    """(nome, piano, tabelle in scansione completa) per ogni query; solo SQLite."""
+    from sqlalchemy.orm import Session
+
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("La verifica dei piani è disponibile solo su SQLite")
+    results = []
+    with Session(engine) as db:
+        conn = db.connection()
+        for name, stmt, full_listing in _queries(db):
+            detail = explain(conn, stmt)
+            results.append((name, detail, full_scans(detail, full_listing)))
+    return results
+
+
+def report(engine, out: Callable[[str], None] = print) -> bool:
+    ok = True
+    for name, detail, scans in check(engine):
+        ok = ok and not scans
+        out(f"{'SCAN!' if scans else 'ok   '} {name}")
+        for line in detail:
+            out(f"        {line}")
+    return ok
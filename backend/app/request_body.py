@@ -0,0 +1,24 @@
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+# corpi delle richieste letti a mano (import, upload PDF): limiti sulla dimensione
+# dichiarata, controllati prima di leggere il primo byte
+
+
+def content_length(request: Request) -> Optional[int]:
+    """Content-Length dichiarato (None se assente); non numerico -> 400."""
+    raw = request.headers.get("content-length")
+    if raw is None:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Length non valido")
+
+
+def check_content_length(request: Request, max_bytes: int, detail: str) -> None:
+    """413 se il Content-Length dichiarato supera max_bytes (il corpo va comunque limitato in lettura)."""
+    declared = content_length(request)
+    if declared is not None and declared > max_bytes:
+        raise HTTPException(status_code=413, detail=detail)
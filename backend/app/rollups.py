@@ -0,0 +1,255 @@
+import argparse
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import upsert_insert
+from .search import normalize_tags
+
+# Aggregati dei sintomi per (utente, giorno, tag): conteggio e severità
+# somma/min/max. Gli handler li aggiornano in modo incrementale nella stessa
+# transazione della modifica; le API di andamento leggono solo questa tabella.
+# Il tag "" raccoglie tutti i sintomi del giorno, indipendentemente dai tag.
+
+ALL_TAGS = ""
+
+R = models.SymptomRollup
+E = models.SymptomEntry
+
+Key = Tuple[int, date, str]
+
+
+def _keys(user_id: int, ts, tags: Optional[str]) -> List[Key]:
+    day = ts.date()
+    return [(user_id, day, tag) for tag in [ALL_TAGS] + normalize_tags(tags)]
+
+
+def _aggregate(entries: Iterable) -> Dict[Key, list]:
+    groups: Dict[Key, list] = {}
+    for e in entries:
+        for key in _keys(e.user_id, e.timestamp, e.tags):
+            g = groups.get(key)
+            if g is None:
+                groups[key] = [1, e.severity, e.severity, e.severity]
+            else:
+                g[0] += 1
+                g[1] += e.severity
+                g[2] = min(g[2], e.severity)
+                g[3] = max(g[3], e.severity)
+    return groups
+
+
+def _rows(groups: Dict[Key, list]) -> List[dict]:
+    return [
+        {
+            "user_id": user_id, "day": day, "tag": tag,
+            "count": c, "severity_sum": s, "severity_min": lo, "severity_max": hi,
+        }
+        for (user_id, day, tag), (c, s, lo, hi) in groups.items()
+    ]
+
+
+# aggiornamento incrementale (commit a carico del chiamante)
+
+def add_many(db: Session, entries: Iterable) -> None:
+    """Somma ai rollup i sintomi indicati (oggetti con user_id, timestamp, severity, tags)."""
+    rows = _rows(_aggregate(entries))
+    if not rows:
+        return
+    insert = upsert_insert(db.get_bind().dialect.name)
+    stmt = insert(R.__table__)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[R.user_id, R.day, R.tag],
+        set_={
+            "count": R.count + new.count,
+            "severity_sum": R.severity_sum + new.severity_sum,
+            "severity_min": case((new.severity_min < R.severity_min, new.severity_min), else_=R.severity_min),
+            "severity_max": case((new.severity_max > R.severity_max, new.severity_max), else_=R.severity_max),
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def add(db: Session, entry) -> None:
+    add_many(db, [entry])
+
+
+def remove(db: Session, user_id: int, ts, severity: int, tags: Optional[str]) -> None:
+    """
+    Toglie dai rollup un sintomo con i valori indicati (quelli precedenti alla modifica).
+    Conteggio e somma si decrementano con un solo UPDATE su tutti i tag del
+    giorno; min/max vengono ricalcolati dalle righe del giorno solo per i tag
+    in cui il valore tolto era proprio il minimo o il massimo.
+    La modifica della riga sintomo (e dei suoi tag) deve essere già visibile:
+    il flush viene fatto qui.
+    """
+    db.flush()
+    day = ts.date()
+    where = (R.user_id == user_id, R.day == day, R.tag.in_([tag for _, _, tag in _keys(user_id, ts, tags)]))
+    rows = db.execute(
+        update(R)
+        .where(*where)
+        .values(count=R.count - 1, severity_sum=R.severity_sum - severity)
+        .returning(R.tag, R.count, R.severity_min, R.severity_max)
+    ).all()
+    if any(row.count <= 0 for row in rows):
+        db.execute(delete(R).where(*where, R.count <= 0))
+
+    stale = [row.tag for row in rows if row.count > 0 and severity in (row.severity_min, row.severity_max)]
+    bounds = _min_max(db, user_id, day, stale) if stale else {}
+    if not bounds:
+        return
+    t = R.__table__
+    db.execute(
+        update(t)
+        .where(t.c.user_id == user_id, t.c.day == day, t.c.tag == bindparam("b_tag"))
+        .values(severity_min=bindparam("b_min"), severity_max=bindparam("b_max")),
+        [{"b_tag": tag, "b_min": lo, "b_max": hi} for tag, (lo, hi) in bounds.items()],
+    )
+
+
+def _min_max(db: Session, user_id: int, day: date, tags: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Severità minima e massima del giorno per ciascun tag (ALL_TAGS: tutti i sintomi)."""
+    where = (
+        E.user_id == user_id,
+        E.deleted_at.is_(None),
+        E.timestamp >= day,
+        E.timestamp < day + timedelta(days=1),
+    )
+    out: Dict[str, Tuple[int, int]] = {}
+    if ALL_TAGS in tags:
+        lo, hi = db.execute(select(func.min(E.severity), func.max(E.severity)).where(*where)).one()
+        if lo is not None:
+            out[ALL_TAGS] = (lo, hi)
+    named = [tag for tag in tags if tag != ALL_TAGS]
+    if named:
+        T = models.EntryTag
+        stmt = (
+            select(T.tag, func.min(E.severity), func.max(E.severity))
+            .join_from(E, T, T.entry_id == E.id)
+            .where(*where, T.tag.in_(named))
+            .group_by(T.tag)
+        )
+        for tag, lo, hi in db.execute(stmt):
+            out[tag] = (lo, hi)
+    return out
+
+
+# ricostruzione completa
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Ricalcola tutti i rollup da symptom_entries. Restituisce i gruppi scritti."""
+    db.execute(delete(R))
+    stmt = (
+        select(E.user_id, E.timestamp, E.severity, E.tags)
+        .where(E.deleted_at.is_(None))
+        .execution_options(yield_per=batch_size)
+    )
+    groups = _aggregate(db.execute(stmt))
+    rows = _rows(groups)
+    for i in range(0, len(rows), batch_size):
+        db.execute(R.__table__.insert(), rows[i:i + batch_size])
+    return len(rows)
+
+
+def ensure_built(engine) -> None:
+    """Popola i rollup se la tabella è vuota ma esistono sintomi (DB precedente ai rollup)."""
+    with Session(engine) as db:
+        if db.execute(select(R.user_id).limit(1)).first() is not None:
+            return
+        if db.execute(select(E.id).where(E.deleted_at.is_(None)).limit(1)).first() is None:
+            return
+        rebuild(db)
+        db.commit()
+
+
+# interrogazione
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def trend_query(
+    from_date: Optional[date],
+    to_date: Optional[date],
+    tag: Optional[str] = None,
+    user_id: Optional[int] = None,
+):
+    """SELECT dei rollup del tag (o di tutti i sintomi) sommati per giorno."""
+    tag_key = (normalize_tags(tag) or [ALL_TAGS])[0] if tag else ALL_TAGS
+    stmt = select(
+        R.day,
+        func.sum(R.count),
+        func.sum(R.severity_sum),
+        func.min(R.severity_min),
+        func.max(R.severity_max),
+    ).where(R.tag == tag_key)
+    if user_id is not None:
+        stmt = stmt.where(R.user_id == user_id)
+    if from_date:
+        stmt = stmt.where(R.day >= from_date)
+    if to_date:
+        stmt = stmt.where(R.day <= to_date)
+    return stmt.group_by(R.day).order_by(R.day)
+
+
+def trend(
+    db: Session,
+    bucket: str,
+    from_date: Optional[date],
+    to_date: Optional[date],
+    tag: Optional[str] = None,
+    user_id: Optional[int] = None,
+) -> List[dict]:
+    """Serie per periodo (giorno/settimana/mese) letta dai soli rollup."""
+    points: Dict[date, list] = {}
+    for day, count, total, lo, hi in db.execute(trend_query(from_date, to_date, tag, user_id)):
+        start = bucket_start(day, bucket)
+        p = points.get(start)
+        if p is None:
+            points[start] = [count, total, lo, hi]
+        else:
+            p[0] += count
+            p[1] += total
+            p[2] = min(p[2], lo)
+            p[3] = max(p[3], hi)
+
+    return [
+        {
+            "period_start": start,
+            "count": count,
+            "min_severity": lo,
+            "max_severity": hi,
+            "mean_severity": round(total / count, 2),
+        }
+        for start, (count, total, lo, hi) in points.items()
+    ]
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aggregati sintomi")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="ricalcola tutti i rollup da symptom_entries")
+    args = parser.parse_args(argv)
+
+    from . import migrations
+    from .database import engine
+
+    if args.command == "rebuild":
+        migrations.upgrade(engine)
+        with Session(engine) as db:
+            n = rebuild(db)
+            db.commit()
+        print(f"Rollup scritti: {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,314 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
 from sqlalchemy.orm import Session
 from datetime import date as dt_date, time as dt_time
 
-from app.database import get_db
-from app import models, schemas
+from app.database import SessionLocal, get_db
+from app import availability, blobstore, etag, fastjson, models, pdf_cache, pdf_render, request_body, schemas, versions
 from app.auth import get_current_user
-from typing import List
+from app.pagination import decode_cursor, keyset_before, paginate
+from typing import List, Optional
 from app.admin_deps import require_admin
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from io import BytesIO
 
 router = APIRouter(prefix="/api/appointments", tags=["Appointments"])
 
-WORKING_HOURS = [
-    dt_time(8, 0), dt_time(9, 0), dt_time(10, 0), dt_time(11, 0),
-    dt_time(12, 0), dt_time(13, 0), dt_time(14, 0), dt_time(15, 0),
-    dt_time(16, 0), dt_time(17, 0),
-]
-
-# Disponibilità orari struttura
+# Disponibilità orari struttura (orari occupati), dall'indice in memoria
 @router.get("/availability")
 def Disponibilità_appuntamenti(
     facility: str = Query(...),
     date: dt_date = Query(...),
-    db: Session = Depends(get_db),
 ):
-    appointments = db.query(models.Appointment).filter(
-        models.Appointment.facility == facility,
-        models.Appointment.date == date
-    ).all()
-
-    booked_times = [a.time.strftime("%H:%M") for a in appointments]
+    availability.index.ensure_fresh(SessionLocal)
+    booked_times = [t.strftime("%H:%M") for t in availability.index.booked_times(facility, date)]
     return booked_times
 
+# slot liberi di una struttura (o di tutte) nei prossimi giorni
+
+@router.get("/availability/free", response_model=List[schemas.FacilityFreeSlots])
+def Slot_liberi(
+    facility: Optional[List[str]] = Query(None),
+    from_date: Optional[dt_date] = Query(None),
+    days: int = Query(14, ge=1, le=availability.MAX_DAYS),
+):
+    availability.index.ensure_fresh(SessionLocal)
+    start = from_date or dt_date.today()
+    return [
+        {"facility": f, "slots": availability.index.free_slots(f, start, days)}
+        for f in (facility or availability.FACILITIES)
+    ]
+
+# primo slot libero tra le strutture
+
+@router.get("/availability/first", response_model=Optional[schemas.FreeSlot])
+def Primo_slot_libero(
+    facility: Optional[List[str]] = Query(None),
+    from_date: Optional[dt_date] = Query(None),
+    days: int = Query(30, ge=1, le=availability.MAX_DAYS),
+):
+    availability.index.ensure_fresh(SessionLocal)
+    found = availability.index.first_free(
+        facility or availability.FACILITIES, from_date or dt_date.today(), days
+    )
+    if found is None:
+        return None
+    f, d, t = found
+    return {"facility": f, "date": d, "time": t}
+
 
 
 # Utente, prenota visita
+
+SLOT_OCCUPATO = "Orario già prenotato per questa struttura"
+
+
+def _slot_tenuto_nel_db(db: Session, facility: str, date: dt_date, time: dt_time, escludi: Optional[int] = None) -> bool:
+    stmt = availability.holders_query(facility, date, time)
+    if escludi is not None:
+        stmt = stmt.where(models.Appointment.id != escludi)
+    return db.execute(stmt.limit(1)).first() is not None
+
+
+def _verifica_slot_libero(db: Session, facility: str, date: dt_date, time: dt_time):
+    # l'indice in memoria è solo la via veloce: può essere vecchio (altri processi),
+    # quindi un "occupato" si conferma sul DB prima del 409; un "libero" lo decide
+    # il vincolo unico all'INSERT
+    if not availability.index.is_booked(facility, date, time):
+        return
+    if _slot_tenuto_nel_db(db, facility, date, time):
+        raise HTTPException(status_code=409, detail=SLOT_OCCUPATO)
+    # indice disallineato: alla prossima richiesta di disponibilità si ricostruisce
+    availability.index.invalidate()
+
+
+def _commit_slot(db: Session) -> None:
+    """Commit di una modifica che occupa uno slot: violazione del vincolo unico -> 409."""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=SLOT_OCCUPATO)
+
+
+def _crea_prenotazione(
+    db: Session,
+    user_id: int,
+    facility: str,
+    date: dt_date,
+    time: dt_time,
+    pdf_filename: str,
+    pdf_ref: str,
+) -> dict:
+    # un solo INSERT ... RETURNING: niente SELECT prima (check) né dopo (refresh)
+    stmt = (
+        insert(models.Appointment)
+        .values(
+            user_id=user_id,
+            facility=facility,
+            date=date,
+            time=time,
+            status="PENDING",
+            pdf_filename=pdf_filename,
+            pdf_ref=pdf_ref,
+        )
+        .returning(models.Appointment.id)
+    )
+    try:
+        appointment_id = db.execute(stmt).scalar_one()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=SLOT_OCCUPATO)
+    versions.bump(db, versions.APPOINTMENTS, user_id)
+    _commit_slot(db)
+
+    availability.index.occupy(facility, date, time)
+    return {
+        "id": appointment_id,
+        "facility": facility,
+        "date": date,
+        "time": time,
+        "status": "PENDING",
+        "pdf_filename": pdf_filename,
+    }
+
+
 @router.post("", response_model=schemas.AppointmentOut)
 def Prenota_visita(
     data: schemas.AppointmentCreate,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    # orari occupati
-    existing = db.query(models.Appointment).filter(
-        models.Appointment.facility == data.facility,
-        models.Appointment.date == data.date,
-        models.Appointment.time == data.time
-    ).first()
-
-    if existing:
-        raise HTTPException(
-            status_code=409,
-            detail="Orario già prenotato per questa struttura"
-        )
+    _verifica_slot_libero(db, data.facility, data.date, data.time)
+
+    try:
+        pdf_ref = blobstore.put_base64(data.pdf_base64)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    appointment = models.Appointment(
-        user_id=current_user.id,
-        facility=data.facility,
-        date=data.date,
-        time=data.time,
-        status="PENDING",
-        pdf_filename=data.pdf_filename,
-        pdf_base64=data.pdf_base64
+    return _crea_prenotazione(
+        db, current_user.id, data.facility, data.date, data.time, data.pdf_filename, pdf_ref
     )
 
-    db.add(appointment)
-    db.commit()
-    db.refresh(appointment)
-    return appointment
+# Utente, prenota visita con PDF binario in streaming
+
+# oltre al PDF, il multipart può contenere intestazioni e piccoli campi
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class _ParteMultipart:
+    """Callback di MultipartParser: tiene i byte della prima parte "pdf"."""
+
+    def __init__(self):
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.in_pdf = False
+        self.found = False
+        self.data: List[bytes] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        self.in_pdf = not self.found and options.get(b"name") == b"pdf"
+        self.found = self.found or self.in_pdf
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.in_pdf:
+            self.data.append(data[start:end])
+
+    def on_part_end(self):
+        self.in_pdf = False
+
+
+async def _chunks_multipart(request: Request):
+    """Parte "pdf" di un multipart/form-data, letta a blocchi dal corpo senza spool su disco."""
+    _, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Boundary multipart mancante")
+
+    parte = _ParteMultipart()
+    parser = MultipartParser(boundary, parte.callbacks())
+    # anche senza Content-Length (chunked) il corpo non può superare il limite
+    max_body = blobstore.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body:
+                raise blobstore.BlobTooLarge(received)
+            parser.write(chunk)
+            for piece in parte.data:
+                yield piece
+            parte.data.clear()
+        parser.finalize()
+    except MultipartParseError:
+        raise HTTPException(status_code=400, detail="Corpo multipart non valido")
+    if not parte.found:
+        raise HTTPException(status_code=400, detail="Campo file 'pdf' mancante")
+
+
+@router.post("/upload", response_model=schemas.AppointmentOut)
+async def Prenota_visita_upload(
+    request: Request,
+    facility: str = Query(...),
+    date: dt_date = Query(...),
+    time: dt_time = Query(...),
+    pdf_filename: str = Query(...),
+    x_content_sha256: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Il PDF arriva come corpo binario (application/pdf) oppure come parte "pdf"
+    di un multipart/form-data e viene scritto nel blob store a blocchi,
+    senza passare da base64 né da un modello Pydantic.
+    """
+    multipart = request.headers.get("content-type", "").startswith("multipart/form-data")
+    max_body = blobstore.MAX_UPLOAD_BYTES + (MULTIPART_OVERHEAD_BYTES if multipart else 0)
+    request_body.check_content_length(request, max_body, "PDF troppo grande")
+
+    if availability.index.is_booked(facility, date, time):
+        # il DB serve solo per confermare un "occupato": fuori dall'event loop
+        await run_in_threadpool(_verifica_slot_libero, db, facility, date, time)
+
+    chunks = _chunks_multipart(request) if multipart else request.stream()
+
+    try:
+        pdf_ref = await blobstore.put_stream(chunks, expected_sha256=x_content_sha256)
+    except blobstore.BlobTooLarge:
+        raise HTTPException(status_code=413, detail="PDF troppo grande")
+    except blobstore.BlobChecksumMismatch:
+        raise HTTPException(status_code=400, detail="Checksum del PDF non corrispondente")
+
+    return await run_in_threadpool(
+        _crea_prenotazione, db, current_user.id, facility, date, time, pdf_filename, pdf_ref
+    )
 
 # Utente, mie visite
+
+# colonne di AppointmentOut: la lista legge tuple, non oggetti ORM
+APPOINTMENT_OUT_COLUMNS = (
+    models.Appointment.id,
+    models.Appointment.facility,
+    models.Appointment.date,
+    models.Appointment.time,
+    models.Appointment.proposed_date,
+    models.Appointment.proposed_time,
+    models.Appointment.status,
+    models.Appointment.pdf_filename,
+)
+
+
+def query_miei_appuntamenti(user_id: int):
+    """SELECT delle visite di un utente, condivisa con la versione async."""
+    return select(*APPOINTMENT_OUT_COLUMNS).where(
+        models.Appointment.user_id == user_id
+    ).order_by(models.Appointment.date.desc(), models.Appointment.time.desc())
+
+
 @router.get("", response_model=List[schemas.AppointmentOut])
 def Miei_appuntamenti(
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
 ):
-    items = db.query(models.Appointment).filter(
-        models.Appointment.user_id == current_user.id
-    ).order_by(models.Appointment.date.desc(), models.Appointment.time.desc()).all()
-    return items
+    version = versions.get(db, versions.APPOINTMENTS, current_user.id)
+    current_etag = etag.make("appointments", current_user.id, version)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    rows = db.execute(query_miei_appuntamenti(current_user.id)).all()
+    return fastjson.response(fastjson.records(rows), etag.headers(current_etag))
 
 # admin cambio stato || accetta o rifiuta 
 
@@ -94,43 +322,128 @@ def update_appointment_status(
     appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
     if not appt:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    slot_prima = availability.held_by(appt)
 
     new_status = data.status.strip().upper()
     if new_status not in ("CONFIRMED", "REJECTED"):
         raise HTTPException(status_code=400, detail="Status non valido")
 
     appt.status = new_status
-    db.commit()
+    versions.bump(db, versions.APPOINTMENTS, appt.user_id)
+    _commit_slot(db)
     db.refresh(appt)
+    availability.index.replace(appt.facility, slot_prima, availability.held_by(appt))
     return appt
 
 # admin visualizza tutti gli appuntamenti
 
+def query_admin_appuntamenti():
+    """SELECT di tutte le visite con l'email dell'utente, dalla più lontana."""
+    return (
+        select(*_ADMIN_QUEUE_COLUMNS)
+        .join(models.User, models.User.id == models.Appointment.user_id)
+        .order_by(models.Appointment.date.desc(), models.Appointment.time.desc())
+    )
+
+
 @router.get("/admin/all", response_model=List[schemas.AppointmentAdminOut])
 def admin_list_all_appointments(
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     admin=Depends(require_admin),
 ):
-    items = (
-            db.query(models.Appointment, models.User.email)
-            .join(models.User, models.User.id == models.Appointment.user_id)
-            .order_by(models.Appointment.date.desc(), models.Appointment.time.desc())
-            .all()
+    version = versions.get(db, versions.APPOINTMENTS, versions.GLOBAL)
+    current_etag = etag.make("appointments-all", version)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    rows = db.execute(query_admin_appuntamenti()).all()
+    return fastjson.response(fastjson.records(rows), etag.headers(current_etag))
+
+# admin, coda prenotazioni filtrata e paginata (keyset su data, ora, id) + conteggi per stato
+
+_ADMIN_QUEUE_COLUMNS = (
+    models.Appointment.id,
+    models.Appointment.facility,
+    models.Appointment.date,
+    models.Appointment.time,
+    models.Appointment.pdf_filename,
+    models.Appointment.status,
+    models.Appointment.user_id,
+    models.User.email.label("user_email"),
+)
+
+
+def _admin_queue_filters(facility: Optional[str], from_date: Optional[dt_date], to_date: Optional[dt_date]) -> list:
+    filters = []
+    if facility:
+        filters.append(models.Appointment.facility == facility)
+    if from_date:
+        filters.append(models.Appointment.date >= from_date)
+    if to_date:
+        filters.append(models.Appointment.date <= to_date)
+    return filters
+
+
+def _admin_queue_counts(filters: list):
+    return (
+        select(models.Appointment.status, func.count())
+        .where(*filters)
+        .group_by(models.Appointment.status)
+    )
+
+
+def _admin_queue_query(filters: list, status: Optional[List[str]], cursor: Optional[str]):
+    stmt = (
+        select(*_ADMIN_QUEUE_COLUMNS)
+        .join(models.User, models.User.id == models.Appointment.user_id)
+        .where(*filters)
+    )
+    if status:
+        stmt = stmt.where(models.Appointment.status.in_([s.strip().upper() for s in status]))
+    if cursor:
+        d, t, appt_id = decode_cursor(cursor, [dt_date.fromisoformat, dt_time.fromisoformat, int])
+        stmt = stmt.where(
+            keyset_before(
+                [models.Appointment.date, models.Appointment.time, models.Appointment.id],
+                [d, t, appt_id],
+            )
         )
+    return stmt.order_by(
+        models.Appointment.date.desc(), models.Appointment.time.desc(), models.Appointment.id.desc()
+    )
 
-    return [
-        {
-            "id": appt.id,
-            "facility": appt.facility,
-            "date": appt.date,
-            "time": appt.time,
-            "pdf_filename": appt.pdf_filename,
-            "status": appt.status,
-            "user_id": appt.user_id,
-            "user_email": email,
-        }
-        for appt, email in items
-    ]
+
+@router.get("/admin/queue", response_model=schemas.AppointmentAdminPage)
+def admin_coda_appuntamenti(
+    request: Request,
+    status: Optional[List[str]] = Query(None),
+    facility: Optional[str] = Query(None),
+    from_date: Optional[dt_date] = Query(None),
+    to_date: Optional[dt_date] = Query(None),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    """
+    Pagina della coda admin. I conteggi per stato rispettano i filtri
+    su struttura e date ma non quello sullo stato.
+    """
+    version = versions.get(db, versions.APPOINTMENTS, versions.GLOBAL)
+    current_etag = etag.make("appointments-queue", version, etag.query_key(request))
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    filters = _admin_queue_filters(facility, from_date, to_date)
+    counts = {st: n for st, n in db.execute(_admin_queue_counts(filters)).all()}
+    rows = db.execute(_admin_queue_query(filters, status, cursor).limit(limit + 1)).all()
+    page, next_cursor = paginate(rows, limit, key=lambda r: (r.date, r.time, r.id))
+    return fastjson.response(
+        {"items": fastjson.records(page), "next_cursor": next_cursor, "counts": counts},
+        etag.headers(current_etag),
+    )
 
 # Admin propone nuove tempistiche || pulsante di proposta
 
@@ -144,14 +457,25 @@ def propose_new_slot(
     appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
     if not appt:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    slot_prima = availability.held_by(appt)
+
+    # lo slot proposto non può essere di un'altra visita: l'indice unico delle visite
+    # copre solo date/time, quindi qui si controlla sempre il DB; tra due proposte
+    # decide uq_appointments_proposed_slot al commit, e all'accettazione l'indice unico
+    if (data.proposed_date, data.proposed_time) not in slot_prima and _slot_tenuto_nel_db(
+        db, appt.facility, data.proposed_date, data.proposed_time, escludi=appt.id
+    ):
+        raise HTTPException(status_code=409, detail=SLOT_OCCUPATO)
 
     # Imposta proposta e stato
     appt.proposed_date = data.proposed_date
     appt.proposed_time = data.proposed_time
     appt.status = "PROPOSED"
 
-    db.commit()
+    versions.bump(db, versions.APPOINTMENTS, appt.user_id)
+    _commit_slot(db)
     db.refresh(appt)
+    availability.index.replace(appt.facility, slot_prima, availability.held_by(appt))
     return appt
 
 # visite utente con status = proposed || Accetta
@@ -165,6 +489,7 @@ def accept_proposal(
     appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
     if not appt:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    slot_prima = availability.held_by(appt)
 
     if appt.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Non autorizzato")
@@ -179,8 +504,10 @@ def accept_proposal(
     appt.proposed_time = None
     appt.status = "CONFIRMED"
 
-    db.commit()
+    versions.bump(db, versions.APPOINTMENTS, appt.user_id)
+    _commit_slot(db)
     db.refresh(appt)
+    availability.index.replace(appt.facility, slot_prima, availability.held_by(appt))
     return appt
 
 # visite utente con status = proposed || Rifiuta
@@ -194,6 +521,7 @@ def reject_proposal(
     appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
     if not appt:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    slot_prima = availability.held_by(appt)
 
     if appt.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Non autorizzato")
@@ -206,76 +534,90 @@ def reject_proposal(
     appt.proposed_time = None
     appt.status = "REJECTED"
 
+    versions.bump(db, versions.APPOINTMENTS, appt.user_id)
     db.commit()
     db.refresh(appt)
+    availability.index.replace(appt.facility, slot_prima, availability.held_by(appt))
     return appt
 
-    import base64
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
-# creazione pdf per visite, visuale admin
+# PDF allegato alla prenotazione, letto dal blob store solo quando serve
 
-@router.get("/{appointment_id}/pdf")
-def admin_download_diary_pdf(
+@router.get("/{appointment_id}/attachment")
+def scarica_allegato(
     appointment_id: int,
     db: Session = Depends(get_db),
-    admin=Depends(require_admin),
+    current_user=Depends(get_current_user),
 ):
-    appt = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appt = (
+        db.query(models.Appointment.user_id, models.Appointment.pdf_filename, models.Appointment.pdf_ref)
+        .filter(models.Appointment.id == appointment_id)
+        .first()
+    )
     if not appt:
         raise HTTPException(status_code=404, detail="Prenotazione non trovata")
 
-    user = db.query(models.User).filter(models.User.id == appt.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Utente non trovato")
+    if appt.user_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Non autorizzato")
+
+    try:
+        path = blobstore.blob_path(appt.pdf_ref or "")
+    except blobstore.BlobNotFound:
+        raise HTTPException(status_code=404, detail="Allegato non trovato")
 
-    # Recupera TUTTI i sintomi dell’utente
-    entries = (
-        db.query(models.SymptomEntry)
-        .filter(models.SymptomEntry.user_id == user.id)
-        .order_by(models.SymptomEntry.timestamp.asc())
-        .all()
-    )
+    return FileResponse(path, media_type="application/pdf", filename=appt.pdf_filename)
 
-    if not entries:
-        raise HTTPException(status_code=404, detail="Nessun sintomo registrato")
-
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    y = height - 50
-    pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString(50, y, "Diario Sintomi")
-    y -= 30
-
-    pdf.setFont("Helvetica", 10)
-    pdf.drawString(50, y, f"Utente: {user.email}")
-    y -= 30
-
-    for e in entries:
-        if y < 80:
-            pdf.showPage()
-            y = height - 50
-            pdf.setFont("Helvetica", 10)
-
-        pdf.drawString(50, y, f"- {e.timestamp.strftime('%d/%m/%Y %H:%M')} | {e.title} (Sev. {e.severity}/10)")
-        y -= 15
-        if e.description:
-            pdf.drawString(60, y, e.description[:120])
-            y -= 15
-
-    pdf.save()
-    buffer.seek(0)
-
-    filename = f"{user.email}_DiarioSintomi.pdf"
-
-    return Response(
-        content=buffer.read(),
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        },
+# creazione pdf per visite, visuale admin
+# il PDF è in cache per (utente, versione diario): ETag uguale -> 304,
+# altrimenti viene generato nel pool di processi di pdf_render
+
+def _chiave_diario(db: Session, appointment_id: int):
+    row = (
+        db.query(models.User.id, models.User.email)
+        .join(models.Appointment, models.Appointment.user_id == models.User.id)
+        .filter(models.Appointment.id == appointment_id)
+        .first()
     )
+    if not row:
+        raise HTTPException(status_code=404, detail="Prenotazione non trovata")
+    user_id, email = row
+    return user_id, email, versions.get(db, versions.ENTRIES, user_id)
 
 
+@router.get("/{appointment_id}/pdf")
+async def admin_download_diary_pdf(
+    appointment_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    user_id, email, version = await run_in_threadpool(_chiave_diario, db, appointment_id)
+
+    current_etag = etag.make("diary", user_id, version)
+    filename = f"{email}_DiarioSintomi.pdf"
+    headers = {
+        "ETag": current_etag,
+        "Cache-Control": etag.CACHE_CONTROL,
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+
+    if etag.matches(if_none_match, current_etag):
+        return Response(status_code=304, headers=headers)
+
+    # file aperto sotto il lock della cache: un'evizione concorrente non lo rende illeggibile
+    f = pdf_cache.open_file(user_id, version)
+    if f is None:
+        try:
+            f = await pdf_render.render_diary(user_id, email, version)
+        except pdf_render.EmptyDiary:
+            raise HTTPException(status_code=404, detail="Nessun sintomo registrato")
+        except pdf_render.RendererBusy:
+            raise HTTPException(
+                status_code=503,
+                detail="Generazione PDF occupata, riprova tra poco",
+                headers={"Retry-After": "5"},
+            )
+
+    headers["Content-Length"] = str(os.fstat(f.fileno()).st_size)
+    return StreamingResponse(pdf_cache.iter_file(f), media_type="application/pdf", headers=headers)
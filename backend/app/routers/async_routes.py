@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import etag, fastjson, schemas, versions
+from ..auth import CurrentUser, get_current_user_async
+from ..database import get_async_db
+from .appointments_routes import query_miei_appuntamenti
+from .entries_routes import query_miei_sintomi
+from .patients_routes import etag_account
+
+# Versioni async delle route di lettura più frequenti (MSD_DB_MODE=async).
+# Registrate prima dei router sync, hanno la precedenza sugli stessi path;
+# scritture e route admin restano sync nel threadpool.
+
+router = APIRouter(tags=["async"])
+
+
+@router.get("/api/users/me", response_model=schemas.UserOut)
+async def Il_mio_account_async(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    """Restituisce le info dell'utente loggato"""
+    current_etag = etag_account(current_user)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+    etag.set_headers(response, current_etag)
+    return current_user
+
+
+@router.get("/api/entries", response_model=List[schemas.SymptomEntryOut])
+async def I_Miei_Sintomi_async(
+    request: Request,
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    tag: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    version = await versions.aget(db, versions.ENTRIES, current_user.id)
+    current_etag = etag.make("entries", current_user.id, version, etag.query_key(request))
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    result = await db.execute(query_miei_sintomi(current_user.id, from_date, to_date, tag))
+    return fastjson.response(fastjson.records(result.all()), etag.headers(current_etag))
+
+
+@router.get("/api/appointments", response_model=List[schemas.AppointmentOut])
+async def Miei_appuntamenti_async(
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    version = await versions.aget(db, versions.APPOINTMENTS, current_user.id)
+    current_etag = etag.make("appointments", current_user.id, version)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    result = await db.execute(query_miei_appuntamenti(current_user.id))
+    return fastjson.response(fastjson.records(result.all()), etag.headers(current_etag))
@@ -1,19 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from .. import models, schemas
+from .. import models, passwords, schemas
 from ..database import get_db
-from ..auth import get_password_hash, authenticate_user, create_access_token
+from ..auth import authenticate_user_async, create_access_token
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 # reg
 
+def _email_registrata(db: Session, email: str) -> bool:
+    return db.query(models.User.id).filter(models.User.email == email).first() is not None
+
+
+def _salva_utente(db: Session, user: models.User) -> models.User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
 @router.post("/register", response_model=schemas.UserOut)
-def registra_utente(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
-    if existing:
+async def registra_utente(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(_email_registrata, db, user_in.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email già registrata",
@@ -22,24 +33,21 @@ def registra_utente(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
     user = models.User(
         name=user_in.name,
         email=user_in.email,
-        password_hash=get_password_hash(user_in.password),
+        password_hash=await passwords.ahash_password(user_in.password),
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    return user
+    return await run_in_threadpool(_salva_utente, db, user)
 
 # login
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
 ):
     """
     Usa 'username' come email e 'password' come password
     """
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
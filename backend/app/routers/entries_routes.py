@@ -1,12 +1,17 @@
-from datetime import datetime
+from datetime import date, datetime
+from types import SimpleNamespace
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
-from .. import models, schemas
-from ..database import get_db
-from ..auth import get_current_user
+from .. import cohort, entries_io, etag, fastjson, models, request_body, rollups, schemas, search, sync, timeline, versions
+from ..database import SessionLocal, get_db
+from ..auth import CurrentUser, get_current_user
+from ..pagination import decode_cursor, keyset_before, paginate
 from app.admin_deps import require_admin
 
 router = APIRouter(prefix="/api/entries", tags=["entries"])
@@ -17,7 +22,7 @@ router = APIRouter(prefix="/api/entries", tags=["entries"])
 def Inserisci_Sintomo(
     entry_in: schemas.SymptomEntryCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     entry = models.SymptomEntry(
         user_id=current_user.id,
@@ -26,51 +31,256 @@ def Inserisci_Sintomo(
         severity=entry_in.severity,
         timestamp=entry_in.timestamp,
         tags=entry_in.tags,
+        change_seq=versions.bump(db, versions.ENTRIES, current_user.id),
     )
     db.add(entry)
+    db.flush()
+    search.index_entry(db, entry)
+    rollups.add(db, entry)
     db.commit()
     db.refresh(entry)
     return entry
 
 # Utente, visualizza i suoi sinotmi
 
+# colonne di SymptomEntryOut: la lista legge tuple, non oggetti ORM
+ENTRY_OUT_COLUMNS = (
+    models.SymptomEntry.id,
+    models.SymptomEntry.title,
+    models.SymptomEntry.description,
+    models.SymptomEntry.severity,
+    models.SymptomEntry.timestamp,
+    models.SymptomEntry.tags,
+    models.SymptomEntry.updated_at,
+)
+
+
+def query_miei_sintomi(
+    user_id: int,
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    tag: Optional[str],
+):
+    """SELECT dei sintomi di un utente, condivisa con la versione async."""
+    stmt = select(*ENTRY_OUT_COLUMNS).where(
+        models.SymptomEntry.user_id == user_id,
+        models.SymptomEntry.deleted_at.is_(None),
+    )
+
+    if from_date:
+        stmt = stmt.where(models.SymptomEntry.timestamp >= from_date)
+    if to_date:
+        stmt = stmt.where(models.SymptomEntry.timestamp <= to_date)
+    if tag:
+        stmt = stmt.where(search.has_tag(tag))
+
+    return stmt.order_by(models.SymptomEntry.timestamp.desc())
+
+
 @router.get("", response_model=List[schemas.SymptomEntryOut])
 def I_Miei_Sintomi(
+    request: Request,
     from_date: Optional[datetime] = Query(None),
     to_date: Optional[datetime] = Query(None),
     tag: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    q = db.query(models.SymptomEntry).filter(models.SymptomEntry.user_id == current_user.id)
+    # versione letta prima dei dati: una scrittura concorrente produce al più un 200 in più
+    version = versions.get(db, versions.ENTRIES, current_user.id)
+    current_etag = etag.make("entries", current_user.id, version, etag.query_key(request))
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
 
-    if from_date:
-        q = q.filter(models.SymptomEntry.timestamp >= from_date)
-    if to_date:
-        q = q.filter(models.SymptomEntry.timestamp <= to_date)
+    stmt = query_miei_sintomi(current_user.id, from_date, to_date, tag)
+    rows = db.execute(stmt).all()
+    return fastjson.response(fastjson.records(rows), etag.headers(current_etag))
+
+_SEARCH_COLUMNS = (
+    models.SymptomEntry.id,
+    models.SymptomEntry.title,
+    models.SymptomEntry.description,
+    models.SymptomEntry.severity,
+    models.SymptomEntry.timestamp,
+    models.SymptomEntry.tags,
+    models.SymptomEntry.updated_at,
+)
+
+
+# utente, timeline severità per i grafici: al massimo `points` punti (LTTB)
+
+@router.get("/timeline", response_model=schemas.Timeline)
+def Timeline_Sintomi(
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    tag: Optional[str] = Query(None),
+    points: int = Query(200, ge=3, le=2000),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return timeline.user_timeline(db, current_user.id, from_date, to_date, tag, points)
+
+# utente, ricerca full-text nel proprio diario (titolo/descrizione), ordinata per rilevanza
+
+@router.get("/search", response_model=schemas.SymptomSearchPage)
+def Cerca_Sintomi(
+    q: str = Query(..., min_length=1, max_length=200),
+    tag: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    if not search.fts_query(q):
+        return {"items": [], "next_offset": None}
+
+    stmt, _ = search.search_stmt(_SEARCH_COLUMNS, q, db, user_id=current_user.id)
     if tag:
-        like = f"%{tag}%"
-        q = q.filter(models.SymptomEntry.tags.ilike(like))
+        stmt = stmt.where(search.has_tag(tag))
 
-    entries = q.order_by(models.SymptomEntry.timestamp.desc()).all()
-    return entries
+    rows = db.execute(stmt.offset(offset).limit(limit + 1)).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    return {"items": [r._asdict() for r in rows[:limit]], "next_offset": next_offset}
 
-# Utente, modifica sintomo
+# utente, import in blocco (JSON array, NDJSON, CSV): le righe valide vengono
+# inserite in un'unica transazione, quelle non valide riportate con il numero di riga
 
-@router.put("/{entry_id}", response_model=schemas.SymptomEntryOut)
-def Aggiorna_Sintomo(
-    entry_id: int,
-    entry_in: schemas.SymptomEntryUpdate,
+async def _leggi_corpo(request: Request) -> bytes:
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > entries_io.IMPORT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="File troppo grande")
+    return bytes(body)
+
+
+def _importa(db: Session, user_id: int, body: bytes, fmt: str) -> dict:
+    valid, errors = entries_io.parse_rows(body, fmt)
+    if not valid:
+        return {"inserted": 0, "ids": [], "errors": errors}
+
+    change_seq = versions.bump(db, versions.ENTRIES, user_id)
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "title": e.title,
+            "description": e.description,
+            "severity": e.severity,
+            "timestamp": e.timestamp,
+            "tags": e.tags,
+            "updated_at": now,
+            "change_seq": change_seq,
+        }
+        for _, e in valid
+    ]
+    # un solo INSERT multi-riga. Su SQLite sort_by_parameter_order ricadrebbe in
+    # un INSERT per riga, ma gli id vi sono assegnati in ordine di VALUES e basta
+    # riordinarli; sugli altri database l'ordine lo garantisce SQLAlchemy.
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    stmt = insert(models.SymptomEntry).returning(models.SymptomEntry.id, sort_by_parameter_order=not sqlite)
+    ids = db.scalars(stmt, rows).all()
+    if sqlite:
+        ids = sorted(ids)
+    created = [SimpleNamespace(id=i, **row) for i, row in zip(ids, rows)]
+    search.index_entries(db, created)
+    rollups.add_many(db, created)
+    db.commit()
+    return {"inserted": len(ids), "ids": ids, "errors": errors}
+
+
+@router.post("/import", response_model=schemas.EntryImportResult)
+async def Importa_Sintomi(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format"),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
+    """Formato da ?format= oppure dal Content-Type (default JSON)."""
+    request_body.check_content_length(request, entries_io.IMPORT_MAX_BYTES, "File troppo grande")
+
+    body = await _leggi_corpo(request)
+    try:
+        fmt = entries_io.detect_format(fmt, request.headers.get("content-type"))
+        return await run_in_threadpool(_importa, db, current_user.id, body, fmt)
+    except entries_io.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# utente, export del proprio diario in streaming
+
+@router.get("/export")
+def Esporta_Sintomi(
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    tag: Optional[str] = Query(None),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    stmt = query_miei_sintomi(current_user.id, from_date, to_date, tag).with_only_columns(
+        *(getattr(models.SymptomEntry, f) for f in entries_io.CSV_FIELDS)
+    )
+    return StreamingResponse(
+        _stream_righe(stmt, fmt),
+        media_type=entries_io.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="diario_sintomi.{fmt}"'},
+    )
+
+# utente, andamento del proprio diario (solo dai rollup)
+
+@router.get("/trends", response_model=schemas.TrendSeries)
+def Andamento_Sintomi(
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    from_date: Optional[date] = Query(None),
+    to_date: Optional[date] = Query(None),
+    tag: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    points = rollups.trend(db, bucket, from_date, to_date, tag=tag, user_id=current_user.id)
+    return {"bucket": bucket, "tag": tag, "points": points}
+
+# utente, sync incrementale: solo le modifiche successive al cursore
+
+@router.get("/changes", response_model=schemas.SymptomEntryChanges)
+def Modifiche_Sintomi(
+    since: Optional[str] = Query(None),
+    limit: int = Query(500, ge=1, le=sync.CHANGES_MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Senza since restituisce il diario completo (senza tombstone); il client
+    salva il cursore e lo ripassa finché has_more è true.
+    """
+    return sync.changes(db, current_user.id, since, limit)
+
+# Utente, modifica sintomo
+
+def _mio_sintomo(db: Session, entry_id: int, user_id: int) -> models.SymptomEntry:
     entry = (
         db.query(models.SymptomEntry)
-        .filter(models.SymptomEntry.id == entry_id, models.SymptomEntry.user_id == current_user.id)
+        .filter(
+            models.SymptomEntry.id == entry_id,
+            models.SymptomEntry.user_id == user_id,
+            models.SymptomEntry.deleted_at.is_(None),
+        )
         .first()
     )
     if not entry:
         raise HTTPException(status_code=404, detail="Sintomo non trovato")
+    return entry
+
+
+@router.put("/{entry_id}", response_model=schemas.SymptomEntryOut)
+def Aggiorna_Sintomo(
+    entry_id: int,
+    entry_in: schemas.SymptomEntryUpdate,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    entry = _mio_sintomo(db, entry_id, current_user.id)
+    prima = (entry.timestamp, entry.severity, entry.tags)
 
     if entry_in.title is not None:
         entry.title = entry_in.title
@@ -83,6 +293,10 @@ def Aggiorna_Sintomo(
     if entry_in.tags is not None:
         entry.tags = entry_in.tags
 
+    search.index_entry(db, entry)
+    entry.change_seq = versions.bump(db, versions.ENTRIES, current_user.id)
+    rollups.remove(db, current_user.id, *prima)
+    rollups.add(db, entry)
     db.commit()
     db.refresh(entry)
     return entry
@@ -93,47 +307,191 @@ def Aggiorna_Sintomo(
 def Elimina_sintomo(
     entry_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    entry = (
-        db.query(models.SymptomEntry)
-        .filter(models.SymptomEntry.id == entry_id, models.SymptomEntry.user_id == current_user.id)
-        .first()
-    )
-    if not entry:
-        raise HTTPException(status_code=404, detail="Sintomo non trovato")
+    entry = _mio_sintomo(db, entry_id, current_user.id)
 
-    db.delete(entry)
+    # tombstone: la riga resta per la sync dei client, esce da liste e ricerche
+    search.remove_entry(db, entry.id)
+    entry.deleted_at = datetime.utcnow()
+    entry.change_seq = versions.bump(db, versions.ENTRIES, current_user.id)
+    rollups.remove(db, current_user.id, entry.timestamp, entry.severity, entry.tags)
     db.commit()
     return {"status": "deleted"}
 
 # admin, visualizza tutti i sintomi registrati
 
+def query_admin_sintomi():
+    """SELECT di tutti i sintomi con l'email dell'utente, dal più recente."""
+    return (
+        select(*_ADMIN_FEED_COLUMNS)
+        .join(models.User, models.User.id == models.SymptomEntry.user_id)
+        .where(models.SymptomEntry.deleted_at.is_(None))
+        .order_by(models.SymptomEntry.timestamp.desc())
+    )
+
+
 @router.get("/admin/all", response_model=List[schemas.EntryAdminOut])
 def admin_list_all_entries(
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     admin=Depends(require_admin),
 ):
-    items = (
-        db.query(models.SymptomEntry, models.User.email)
-        .join(models.User, models.User.id == models.SymptomEntry.user_id)
-        .order_by(models.SymptomEntry.timestamp.desc())
-        .all()
+    version = versions.get(db, versions.ENTRIES, versions.GLOBAL)
+    current_etag = etag.make("entries-all", version)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    rows = db.execute(query_admin_sintomi()).all()
+    return fastjson.response(fastjson.records(rows), etag.headers(current_etag))
+
+# admin, feed sintomi paginato (keyset su timestamp, id) con filtri lato server
+
+FEED_STREAM_BATCH = 500
+
+_ADMIN_FEED_COLUMNS = (
+    models.SymptomEntry.id,
+    models.SymptomEntry.title,
+    models.SymptomEntry.description,
+    models.SymptomEntry.severity,
+    models.SymptomEntry.timestamp,
+    models.SymptomEntry.tags,
+    models.SymptomEntry.user_id,
+    models.User.email.label("user_email"),
+)
+
+
+def _admin_feed_query(
+    user_id: Optional[int],
+    min_severity: Optional[int],
+    max_severity: Optional[int],
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    tag: Optional[str],
+    cursor: Optional[str],
+):
+    stmt = select(*_ADMIN_FEED_COLUMNS).join(
+        models.User, models.User.id == models.SymptomEntry.user_id
+    ).where(models.SymptomEntry.deleted_at.is_(None))
+
+    if user_id is not None:
+        stmt = stmt.where(models.SymptomEntry.user_id == user_id)
+    if min_severity is not None:
+        stmt = stmt.where(models.SymptomEntry.severity >= min_severity)
+    if max_severity is not None:
+        stmt = stmt.where(models.SymptomEntry.severity <= max_severity)
+    if from_date:
+        stmt = stmt.where(models.SymptomEntry.timestamp >= from_date)
+    if to_date:
+        stmt = stmt.where(models.SymptomEntry.timestamp <= to_date)
+    if tag:
+        stmt = stmt.where(search.tagged(tag))
+    if cursor:
+        ts, entry_id = decode_cursor(cursor, [datetime.fromisoformat, int])
+        stmt = stmt.where(
+            keyset_before([models.SymptomEntry.timestamp, models.SymptomEntry.id], [ts, entry_id])
+        )
+
+    return stmt.order_by(models.SymptomEntry.timestamp.desc(), models.SymptomEntry.id.desc())
+
+
+def _stream_righe(stmt, fmt: str):
+    # sessione propria: quella della dependency viene chiusa prima dello streaming
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=FEED_STREAM_BATCH))
+        yield from entries_io.serialize((row._asdict() for row in result), fmt)
+    finally:
+        db.close()
+
+
+@router.get("/admin/feed", response_model=schemas.EntryAdminPage)
+def admin_feed_sintomi(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: Optional[int] = Query(None),
+    min_severity: Optional[int] = Query(None, ge=1, le=10),
+    max_severity: Optional[int] = Query(None, ge=1, le=10),
+    from_date: Optional[datetime] = Query(None),
+    to_date: Optional[datetime] = Query(None),
+    tag: Optional[str] = Query(None),
+    stream: bool = Query(False),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    """
+    Pagina del feed sintomi. Con stream=true restituisce NDJSON di tutte
+    le righe filtrate (a partire dal cursore) senza caricarle in memoria.
+    """
+    stmt = _admin_feed_query(user_id, min_severity, max_severity, from_date, to_date, tag, cursor)
+
+    if stream:
+        return StreamingResponse(_stream_righe(stmt, "ndjson"), media_type="application/x-ndjson")
+
+    version = versions.get(db, versions.ENTRIES, versions.GLOBAL)
+    current_etag = etag.make("entries-feed", version, etag.query_key(request))
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    page, next_cursor = paginate(rows, limit, key=lambda r: (r.timestamp, r.id))
+    return fastjson.response(
+        {"items": fastjson.records(page), "next_cursor": next_cursor}, etag.headers(current_etag)
     )
 
-    return [
-        {
-            "id": e.id,
-            "title": e.title,
-            "description": e.description,
-            "severity": e.severity,
-            "timestamp": e.timestamp,
-            "tags": e.tags,
-            "user_id": e.user_id,
-            "user_email": email,
-        }
-        for e, email in items
-    ]
 
+# admin, ricerca full-text su tutti i diari
+
+@router.get("/admin/search", response_model=schemas.EntryAdminSearchPage)
+def admin_cerca_sintomi(
+    q: str = Query(..., min_length=1, max_length=200),
+    tag: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    if not search.fts_query(q):
+        return {"items": [], "next_offset": None}
+
+    stmt, _ = search.search_stmt(_ADMIN_FEED_COLUMNS, q, db, user_id=user_id)
+    stmt = stmt.join(models.User, models.User.id == models.SymptomEntry.user_id)
+    if tag:
+        stmt = stmt.where(search.has_tag(tag))
+
+    rows = db.execute(stmt.offset(offset).limit(limit + 1)).all()
+    next_offset = offset + limit if len(rows) > limit else None
+    return {"items": [r._asdict() for r in rows[:limit]], "next_offset": next_offset}
 
+# admin, andamento su tutti i diari o su un singolo utente
 
+@router.get("/admin/trends", response_model=schemas.TrendSeries)
+def admin_andamento_sintomi(
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    from_date: Optional[date] = Query(None),
+    to_date: Optional[date] = Query(None),
+    tag: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    admin=Depends(require_admin),
+):
+    points = rollups.trend(db, bucket, from_date, to_date, tag=tag, user_id=user_id)
+    return {"bucket": bucket, "tag": tag, "points": points}
+
+# admin, statistiche di coorte su tutti i pazienti (calcolo vettoriale, in cache)
+
+@router.get("/admin/cohort", response_model=schemas.CohortStats)
+def admin_statistiche_coorte(
+    days: int = Query(cohort.COHORT_DAYS, ge=1, le=365),
+    threshold: int = Query(cohort.COHORT_THRESHOLD, ge=1, le=10),
+    refresh: bool = Query(False),
+    admin=Depends(require_admin),
+):
+    """
+    Distribuzioni di severità per tag, variazione settimana su settimana e
+    pazienti con severità media oltre la soglia. refresh=true forza il ricalcolo.
+    """
+    return cohort.get_stats(SessionLocal, days, threshold, refresh=refresh)
@@ -0,0 +1,39 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from .. import metrics
+from ..auth import get_current_user
+from ..database import SessionLocal
+
+router = APIRouter(tags=["metrics"])
+
+# metriche Prometheus: servono "Authorization: Bearer <MSD_METRICS_TOKEN>" oppure
+# il token di un admin; MSD_METRICS_PUBLIC=1 le apre a tutti (vedi metrics.py)
+
+
+def _verifica_accesso(authorization: Optional[str]) -> None:
+    if metrics.PUBLIC:
+        return
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=401, detail="Token metriche mancante", headers={"WWW-Authenticate": "Bearer"}
+        )
+    if metrics.METRICS_TOKEN and secrets.compare_digest(token, metrics.METRICS_TOKEN):
+        return
+    # altrimenti un JWT di un admin (di solito già in cache: nessuna query)
+    db = SessionLocal()
+    try:
+        user = get_current_user(token=token, db=db)
+    finally:
+        db.close()
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Solo admin")
+
+
+@router.get("/metrics", include_in_schema=False)
+def metriche(authorization: Optional[str] = Header(None)):
+    _verifica_accesso(authorization)
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,18 +1,30 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+import zlib
+from typing import Optional
 
-from .. import models, schemas
-from ..database import get_db
-from ..auth import get_current_user
+from fastapi import APIRouter, Depends, Header, Response
+
+from .. import etag, schemas
+from ..auth import CurrentUser, get_current_user
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 # leggo utente registrato
 
+def etag_account(user: CurrentUser) -> str:
+    # dai dati dell'utente già in cache (auth): nessuna query
+    fingerprint = zlib.crc32(f"{user.name}\x00{user.email}\x00{user.is_admin}".encode())
+    return etag.make("me", user.id, format(fingerprint, "08x"))
+
+
 @router.get("/me", response_model=schemas.UserOut)
 def Il_mio_account(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     """Restituisce le info dell'utente loggato"""
+    current_etag = etag_account(current_user)
+    if etag.matches(if_none_match, current_etag):
+        return etag.not_modified(current_etag)
+    etag.set_headers(response, current_etag)
     return current_user
@@ -1,6 +1,6 @@
 from datetime import datetime
 from datetime import date, time
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -53,6 +53,7 @@ class SymptomEntryUpdate(BaseModel):
 
 class SymptomEntryOut(SymptomEntryBase):
     id: int
+    updated_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
@@ -98,6 +99,20 @@ class AppointmentAdminOut(BaseModel):
     class Config:
         orm_mode = True
 
+class FacilityFreeSlots(BaseModel):
+    facility: str
+    slots: Dict[date, List[time]]
+
+class FreeSlot(BaseModel):
+    facility: str
+    date: date
+    time: time
+
+class AppointmentAdminPage(BaseModel):
+    items: List[AppointmentAdminOut]
+    next_cursor: Optional[str] = None
+    counts: Dict[str, int]
+
 class AppointmentProposeUpdate(BaseModel):
     proposed_date: date
     proposed_time: time 
@@ -119,3 +134,127 @@ class EntryAdminOut(BaseModel):
         orm_mode = True
 
 
+class EntryAdminPage(BaseModel):
+    items: List[EntryAdminOut]
+    next_cursor: Optional[str] = None
+
+
+# Ricerca sintomi (score: rilevanza bm25, più basso = più rilevante; assente senza FTS)
+
+class SymptomSearchHit(SymptomEntryOut):
+    score: Optional[float] = None
+
+
+class SymptomSearchPage(BaseModel):
+    items: List[SymptomSearchHit]
+    next_offset: Optional[int] = None
+
+
+class EntryAdminSearchHit(EntryAdminOut):
+    score: Optional[float] = None
+
+
+class EntryAdminSearchPage(BaseModel):
+    items: List[EntryAdminSearchHit]
+    next_offset: Optional[int] = None
+
+
+# Import sintomi in blocco
+
+class EntryImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class EntryImportResult(BaseModel):
+    inserted: int
+    ids: List[int]
+    errors: List[EntryImportError]
+
+
+# Sync incrementale del diario: entry assente per le eliminazioni (deleted=True)
+
+class SymptomEntryChange(BaseModel):
+    id: int
+    deleted: bool
+    updated_at: Optional[datetime] = None
+    entry: Optional[SymptomEntryOut] = None
+
+
+class SymptomEntryChanges(BaseModel):
+    items: List[SymptomEntryChange]
+    cursor: str
+    has_more: bool
+
+
+# Timeline severità (punti ridotti con LTTB)
+
+class TimelinePoint(BaseModel):
+    id: int
+    timestamp: datetime
+    severity: int
+
+
+class Timeline(BaseModel):
+    total: int
+    points: List[TimelinePoint]
+
+
+# Andamento sintomi (aggregati per giorno/settimana/mese)
+
+class TrendPoint(BaseModel):
+    period_start: date
+    count: int
+    min_severity: int
+    max_severity: int
+    mean_severity: float
+
+
+class TrendSeries(BaseModel):
+    bucket: str
+    tag: Optional[str] = None
+    points: List[TrendPoint]
+
+
+# Statistiche di coorte (admin)
+
+class CohortTagStats(BaseModel):
+    tag: str
+    entries: int
+    patients: int
+    mean_severity: Optional[float] = None
+    std_severity: Optional[float] = None
+    p50: int
+    p90: int
+    p95: int
+    histogram: List[int]
+    this_week: int
+    previous_week: int
+    week_delta: int
+    week_change_pct: Optional[float] = None
+    mean_severity_this_week: Optional[float] = None
+    mean_severity_previous_week: Optional[float] = None
+
+
+class CohortPatient(BaseModel):
+    user_id: int
+    entries: int
+    mean_severity: float
+    max_severity: int
+
+
+class CohortStats(BaseModel):
+    computed_at: datetime
+    since: datetime
+    days: int
+    entries: int
+    patients: int
+    mean_severity: Optional[float] = None
+    p50: Optional[int] = None
+    p90: Optional[int] = None
+    p95: Optional[int] = None
+    threshold: int
+    patients_above_threshold: int
+    top_patients: List[CohortPatient]
+    trending_up: List[str]
+    tags: List[CohortTagStats]
@@ -0,0 +1,219 @@
+import argparse
+import re
+from typing import List, Optional
+
+from sqlalchemy import column, delete, exists, insert, inspect, literal_column, select, table, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Indici di ricerca sui sintomi, aggiornati dagli handler insieme alla riga:
+# - entry_tags: un record per tag normalizzato (minuscolo, senza spazi ai lati),
+#   usato per filtrare per tag esatto con un indice;
+# - symptom_entries_fts: tabella FTS5 su titolo/descrizione (rowid = id sintomo)
+#   per la ricerca full-text ordinata per rilevanza (bm25). Solo su SQLite:
+#   sugli altri database la ricerca ripiega su ILIKE.
+
+FTS_TABLE = "symptom_entries_fts"
+_fts = table(FTS_TABLE, column("rowid"))
+
+_fts_enabled: Optional[bool] = None
+
+
+def normalize_tags(raw: Optional[str]) -> List[str]:
+    """"Mal di testa, nausea,," -> ["mal di testa", "nausea"] (ordine preservato, senza duplicati)."""
+    seen = []
+    for tag in (raw or "").split(","):
+        tag = " ".join(tag.split()).lower()
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def fts_enabled(db: Session) -> bool:
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = inspect(db.get_bind()).has_table(FTS_TABLE)
+    return _fts_enabled
+
+
+def ensure_schema(engine) -> None:
+    """Crea la tabella FTS5 se manca; alla prima creazione indicizza il testo dei sintomi esistenti."""
+    global _fts_enabled
+    if engine.dialect.name != "sqlite":
+        _fts_enabled = False
+        return
+    if inspect(engine).has_table(FTS_TABLE):
+        _fts_enabled = True
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "title, description, user_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        ))
+    _fts_enabled = True
+    with Session(engine) as db:
+        for batch in db.execute(_entries_stmt()).partitions():
+            _index_text(db, batch)
+        db.commit()
+
+
+def backfill_tags(engine) -> None:
+    """Indicizza i tag dei sintomi che non ne hanno in entry_tags (DB precedenti, ogni database)."""
+    E = models.SymptomEntry
+    stmt = (
+        _entries_stmt()
+        .where(E.tags.is_not(None), E.tags != "", ~exists().where(models.EntryTag.entry_id == E.id))
+        .order_by(E.id)
+        .limit(1000)
+    )
+    last_id = 0
+    with Session(engine) as db:
+        # a pagine per id: non legge entry_tags con un cursore aperto mentre ci scrive
+        while batch := db.execute(stmt.where(E.id > last_id)).all():
+            _index_tags(db, batch)
+            last_id = batch[-1].id
+        db.commit()
+
+
+# aggiornamento (nella transazione dell'handler)
+
+def index_entry(db: Session, entry: models.SymptomEntry) -> None:
+    """(Re)indicizza tag e testo di un sintomo; entry.id deve essere già assegnato."""
+    remove_entry(db, entry.id)
+    index_entries(db, [entry])
+
+
+def index_entries(db: Session, entries) -> None:
+    """
+    Indicizza in blocco sintomi nuovi (oggetti o righe con id, user_id,
+    title, description, tags): un INSERT multiplo per tabella.
+    """
+    entries = list(entries)
+    _index_tags(db, entries)
+    _index_text(db, entries)
+
+
+def _index_tags(db: Session, entries) -> None:
+    tag_rows = [
+        {"entry_id": e.id, "user_id": e.user_id, "tag": t}
+        for e in entries for t in normalize_tags(e.tags)
+    ]
+    if tag_rows:
+        db.execute(insert(models.EntryTag), tag_rows)
+
+
+def _index_text(db: Session, entries) -> None:
+    if entries and fts_enabled(db):
+        db.execute(
+            text(f"INSERT INTO {FTS_TABLE}(rowid, title, description, user_id) VALUES (:id, :t, :d, :u)"),
+            [{"id": e.id, "t": e.title, "d": e.description or "", "u": e.user_id} for e in entries],
+        )
+
+
+def remove_entry(db: Session, entry_id: int) -> None:
+    db.execute(delete(models.EntryTag).where(models.EntryTag.entry_id == entry_id))
+    if fts_enabled(db):
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": entry_id})
+
+
+def rebuild(db: Session, batch_size: int = 1000) -> int:
+    """Ricostruisce entry_tags e FTS da symptom_entries. Restituisce i sintomi indicizzati."""
+    db.execute(delete(models.EntryTag))
+    if fts_enabled(db):
+        db.execute(text(f"DELETE FROM {FTS_TABLE}"))
+
+    count = 0
+    for batch in db.execute(_entries_stmt(batch_size)).partitions():
+        index_entries(db, batch)
+        count += len(batch)
+    return count
+
+
+def _entries_stmt(batch_size: int = 1000):
+    return select(
+        models.SymptomEntry.id,
+        models.SymptomEntry.user_id,
+        models.SymptomEntry.title,
+        models.SymptomEntry.description,
+        models.SymptomEntry.tags,
+    ).where(models.SymptomEntry.deleted_at.is_(None)).execution_options(yield_per=batch_size)
+
+
+# interrogazione
+
+def _tag_key(tag: str) -> str:
+    return (normalize_tags(tag) or [""])[0]
+
+
+def has_tag(tag: str):
+    """Condizione EXISTS per filtrare symptom_entries per tag esatto (query già ristrette a un utente)."""
+    return exists().where(
+        models.EntryTag.entry_id == models.SymptomEntry.id,
+        models.EntryTag.tag == _tag_key(tag),
+    )
+
+
+def tagged(tag: str):
+    """
+    Condizione id IN (...) per filtrare per tag esatto su tutti i diari: la
+    query parte da ix_entry_tags_tag_entry invece di scorrere i sintomi.
+    """
+    return models.SymptomEntry.id.in_(
+        select(models.EntryTag.entry_id).where(models.EntryTag.tag == _tag_key(tag))
+    )
+
+
+def fts_query(q: str) -> str:
+    """Testo libero -> query FTS5 sicura: ogni parola diventa un prefisso tra virgolette."""
+    words = re.findall(r"\w+", q, flags=re.UNICODE)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def search_stmt(columns, q: str, db: Session, user_id: Optional[int] = None):
+    """
+    SELECT delle colonne richieste sui sintomi che corrispondono a q,
+    ordinati per rilevanza (FTS5) o per data (fallback ILIKE).
+    Restituisce (stmt, colonna score) dove score è None nel fallback.
+    """
+    if fts_enabled(db):
+        score = literal_column(f"bm25({FTS_TABLE})").label("score")
+        stmt = (
+            select(*columns, score)
+            .join_from(models.SymptomEntry, _fts, _fts.c.rowid == models.SymptomEntry.id)
+            .where(text(f"{FTS_TABLE} MATCH :q").bindparams(q=fts_query(q)))
+            .order_by(score, models.SymptomEntry.timestamp.desc())
+        )
+    else:
+        like = f"%{q}%"
+        stmt = (
+            select(*columns)
+            .where(models.SymptomEntry.title.ilike(like) | models.SymptomEntry.description.ilike(like))
+            .order_by(models.SymptomEntry.timestamp.desc())
+        )
+        score = None
+    stmt = stmt.where(models.SymptomEntry.deleted_at.is_(None))
+    if user_id is not None:
+        stmt = stmt.where(models.SymptomEntry.user_id == user_id)
+    return stmt, score
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Indici di ricerca sintomi")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="ricostruisce tag normalizzati e indice full-text")
+    args = parser.parse_args(argv)
+
+    from . import migrations
+    from .database import engine
+
+    if args.command == "rebuild":
+        migrations.upgrade(engine)
+        with Session(engine) as db:
+            n = rebuild(db)
+            db.commit()
+        print(f"Sintomi indicizzati: {n}")
+
+
+if __name__ == "__main__":
+    main()
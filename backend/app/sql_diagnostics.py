@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+# Diagnostica SQL per sviluppo e staging (MSD_SQL_DIAGNOSTICS=1, spenta di default):
+#   - query lente: ogni statement oltre MSD_SLOW_QUERY_MS viene loggato con
+#     parametri e piano di esecuzione (EXPLAIN, solo per le SELECT);
+#   - N+1: a fine richiesta segnala gli statement con la stessa forma (stesso
+#     SQL, liste IN comprese) ripetuti almeno MSD_N_PLUS_ONE volte, tipico
+#     effetto dei lazy load delle relationship dentro un ciclo;
+#   - budget: query_budget() fa fallire un test/benchmark se una richiesta
+#     servita nel blocco supera il numero massimo di statement.
+#
+#   MSD_SQL_DIAGNOSTICS=1 MSD_SLOW_QUERY_MS=50 uvicorn app.main:app
+#   cd backend && python -m bench.query_budget
+
+ENABLED = os.getenv("MSD_SQL_DIAGNOSTICS", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("MSD_SLOW_QUERY_MS", "100"))
+N_PLUS_ONE = int(os.getenv("MSD_N_PLUS_ONE", "5"))
+MAX_PARAMS_CHARS = 500
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)")
+_SPACES = re.compile(r"\s+")
+_READ = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestQueries:
+    """Statement eseguiti durante una richiesta, raggruppati per forma."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = path
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def add(self, statement: str, seconds: float) -> None:
+        self.statements += 1
+        self.seconds += seconds
+        key = shape(statement)
+        self.shapes[key] = self.shapes.get(key, 0) + 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE) -> Dict[str, int]:
+        return {s: n for s, n in self.shapes.items() if n >= threshold}
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("msd_sql_diagnostics", default=None)
+_budgets: List["QueryBudget"] = []
+_budgets_lock = threading.Lock()
+
+
+def shape(statement: str) -> str:
+    """Forma dello statement: spazi normalizzati, liste IN di lunghezza qualsiasi uguali."""
+    return _IN_LIST.sub("(?...)", _SPACES.sub(" ", statement).strip())
+
+
+# query lente
+
+def _plan(conn, statement: str, parameters) -> str:
+    # cursore DBAPI diretto: non rientra negli eventi dell'engine
+    sqlite = conn.dialect.name == "sqlite"
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ") + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return " | ".join(str(row[3] if sqlite else row[0]) for row in rows)
+
+
+def _log_slow(conn, statement: str, parameters, executemany: bool, ms: float) -> None:
+    plan = "-"
+    if not executemany and _READ.match(statement):
+        try:
+            plan = _plan(conn, statement, parameters)
+        except Exception as exc:  # il piano è solo diagnostica
+            plan = f"non disponibile ({exc})"
+    current = _current.get()
+    where = f"{current.method} {current.path}" if current else "fuori richiesta"
+    params = repr(parameters)
+    if len(params) > MAX_PARAMS_CHARS:
+        params = params[:MAX_PARAMS_CHARS] + "..."
+    logger.warning(
+        "query lenta %.1f ms (%s): %s\n  parametri: %s\n  piano: %s",
+        ms, where, shape(statement), params, plan,
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("msd_diag_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["msd_diag_start"].pop()
+    current = _current.get()
+    if current is not None:
+        current.add(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        _log_slow(conn, statement, parameters, executemany, elapsed * 1000)
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("msd_diag_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Registra gli eventi di diagnostica su un engine sync (per l'async: engine.sync_engine)."""
+    if not ENABLED or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# per richiesta
+
+class DiagnosticsMiddleware:
+    """Middleware ASGI: raccoglie gli statement di ogni richiesta, segnala gli N+1 e li passa ai budget attivi."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope["method"], scope["path"])
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            queries.route = getattr(scope.get("route"), "path", None) or queries.path
+            _request_done(queries)
+
+
+def _request_done(queries: RequestQueries) -> None:
+    for statement, count in queries.repeated().items():
+        logger.warning(
+            "probabile N+1 in %s %s: %d volte in una richiesta: %s",
+            queries.method, queries.route, count, statement,
+        )
+    with _budgets_lock:
+        budgets = list(_budgets)
+    for budget in budgets:
+        budget.requests.append(queries)
+
+
+# budget
+
+class QueryBudget:
+    def __init__(self, max_statements: int, max_repeats: Optional[int] = None):
+        self.max_statements = max_statements
+        self.max_repeats = max_repeats
+        self.requests: List[RequestQueries] = []
+
+    def failures(self) -> List[str]:
+        out = []
+        for q in self.requests:
+            if q.statements > self.max_statements:
+                out.append(f"{q.method} {q.route}: {q.statements} statement SQL (budget {self.max_statements})")
+            if self.max_repeats is not None:
+                for statement, count in q.repeated(self.max_repeats + 1).items():
+                    out.append(f"{q.method} {q.route}: {count} volte lo stesso statement (max {self.max_repeats}): {statement}")
+        return out
+
+
+@contextmanager
+def query_budget(max_statements: int, max_repeats: Optional[int] = None) -> Iterator[QueryBudget]:
+    """Raccoglie le richieste servite nel blocco; all'uscita QueryBudgetExceeded
+    se una ha eseguito più di max_statements statement, o ripetuto lo stesso
+    statement più di max_repeats volte.
+
+        with sql_diagnostics.query_budget(3):
+            client.get("/api/entries", headers=h)
+    """
+    if not ENABLED:
+        raise RuntimeError("query_budget richiede MSD_SQL_DIAGNOSTICS=1 prima dell'import dell'app")
+    budget = QueryBudget(max_statements, max_repeats)
+    with _budgets_lock:
+        _budgets.append(budget)
+    try:
+        yield budget
+    finally:
+        with _budgets_lock:
+            _budgets.remove(budget)
+    failures = budget.failures()
+    if failures:
+        raise QueryBudgetExceeded("\n".join(failures))
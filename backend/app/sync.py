@@ -0,0 +1,54 @@
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .pagination import decode_cursor, encode_cursor, keyset_after
+
+# Sync incrementale del diario sintomi.
+# Ogni modifica (inserimento, aggiornamento, eliminazione) assegna alla riga
+# change_seq = nuova versione del diario dell'utente (versions.bump), che cresce
+# in modo monotono per utente; le eliminazioni restano come tombstone
+# (deleted_at valorizzato). Il client conserva il cursore (change_seq, id)
+# dell'ultima modifica ricevuta e chiede solo le successive.
+# Sui DB esistenti le colonne arrivano dalla migrazione "sintomi_sync" (migrations.py).
+
+CHANGES_MAX_LIMIT = 1000
+
+
+def changes_query(user_id: int, after: Optional[Tuple[int, int]]):
+    """
+    SELECT delle righe di user_id dopo il cursore (change_seq, id), in ordine di
+    change_seq; senza cursore le sole righe vive.
+    """
+    E = models.SymptomEntry
+    stmt = select(E).where(E.user_id == user_id)
+    if after:
+        stmt = stmt.where(keyset_after([E.change_seq, E.id], list(after)))
+    else:
+        stmt = stmt.where(E.deleted_at.is_(None))
+    return stmt.order_by(E.change_seq, E.id)
+
+
+def changes(db: Session, user_id: int, since: Optional[str], limit: int) -> dict:
+    """
+    Modifiche del diario di user_id successive al cursore, in ordine di change_seq.
+    Senza cursore: tutte le righe vive (sync iniziale, niente tombstone).
+    """
+    after = tuple(decode_cursor(since, [int, int])) if since else None
+    seq, entry_id = after or (0, 0)
+
+    rows = db.execute(changes_query(user_id, after).limit(limit + 1)).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        seq, entry_id = rows[-1].change_seq, rows[-1].id
+
+    items = []
+    for e in rows:
+        if e.deleted_at is not None:
+            items.append({"id": e.id, "deleted": True, "updated_at": e.deleted_at})
+        else:
+            items.append({"id": e.id, "deleted": False, "updated_at": e.updated_at, "entry": e})
+    return {"items": items, "cursor": encode_cursor(seq, entry_id), "has_more": has_more}
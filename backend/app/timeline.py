@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import lazy, models, search
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Timeline severità del diario per i grafici: al massimo N punti per intervallo,
+# scelti con Largest-Triangle-Three-Buckets (LTTB) che conserva picchi e
+# andamento, così il payload non cresce con la lunghezza del diario.
+# NumPy viene importato alla prima richiesta, non all'avvio dell'app.
+
+_np = lazy.module("numpy")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indici (crescenti) dei punti scelti da LTTB; primo e ultimo sempre inclusi."""
+    np = _np()
+
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = a = 0
+    for i in range(n_out - 2):
+        # bucket corrente [start, end) e media del bucket successivo
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        if end >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        xs, ys = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        out[i + 1] = a
+    out[-1] = n - 1
+    return out
+
+
+def timeline_query(user_id: int, from_date: Optional[datetime], to_date: Optional[datetime], tag: Optional[str]):
+    """SELECT (id, timestamp, severità) dei sintomi dell'utente in ordine di tempo."""
+    E = models.SymptomEntry
+    stmt = select(E.id, E.timestamp, E.severity).where(E.user_id == user_id, E.deleted_at.is_(None))
+    if from_date:
+        stmt = stmt.where(E.timestamp >= from_date)
+    if to_date:
+        stmt = stmt.where(E.timestamp <= to_date)
+    if tag:
+        stmt = stmt.where(search.has_tag(tag))
+    return stmt.order_by(E.timestamp, E.id)
+
+
+def user_timeline(
+    db: Session,
+    user_id: int,
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    tag: Optional[str],
+    points: int,
+) -> dict:
+    np = _np()
+
+    rows = db.execute(timeline_query(user_id, from_date, to_date, tag)).all()
+
+    if rows:
+        ids, stamps, severities = zip(*rows)
+        x = np.fromiter((t.timestamp() for t in stamps), dtype=np.float64, count=len(rows))
+        chosen: List[int] = lttb(x, np.array(severities, dtype=np.float64), points).tolist()
+    else:
+        ids = stamps = severities = ()
+        chosen = []
+
+    return {
+        "total": len(rows),
+        "points": [
+            {"id": ids[i], "timestamp": stamps[i], "severity": severities[i]} for i in chosen
+        ],
+    }
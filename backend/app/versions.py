@@ -0,0 +1,53 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import upsert_insert
+
+# Contatori di versione per collezione/utente: ogni handler che modifica
+# una collezione chiama bump() prima del commit, chi legge usa get()
+# per capire se una copia già calcolata (PDF, ETag, ...) è ancora valida.
+# owner_id = GLOBAL tiene la versione della collezione di tutti gli utenti
+# (liste admin), incrementata insieme a quella del singolo utente.
+
+ENTRIES = "entries"
+APPOINTMENTS = "appointments"
+GLOBAL = 0
+
+
+def _bump_one(db: Session, collection: str, owner_id: int) -> int:
+    insert = upsert_insert(db.get_bind().dialect.name)
+    table = models.CollectionVersion.__table__
+    stmt = insert(table).values(collection=collection, owner_id=owner_id, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.collection, table.c.owner_id],
+        set_={"version": table.c.version + 1},
+    ).returning(table.c.version)
+    return db.execute(stmt).scalar_one()
+
+
+def bump(db: Session, collection: str, owner_id: int) -> int:
+    """
+    Incrementa la versione dell'utente e quella globale nella transazione corrente
+    (commit a carico del chiamante) e restituisce la nuova versione dell'utente.
+    """
+    version = _bump_one(db, collection, owner_id)
+    if owner_id != GLOBAL:
+        _bump_one(db, collection, GLOBAL)
+    return version
+
+
+def _get_stmt(collection: str, owner_id: int):
+    return select(models.CollectionVersion.version).where(
+        models.CollectionVersion.collection == collection,
+        models.CollectionVersion.owner_id == owner_id,
+    )
+
+
+def get(db: Session, collection: str, owner_id: int) -> int:
+    return db.execute(_get_stmt(collection, owner_id)).scalar() or 0
+
+
+async def aget(db, collection: str, owner_id: int) -> int:
+    """Come get() per una AsyncSession."""
+    return (await db.execute(_get_stmt(collection, owner_id))).scalar() or 0
@@ -0,0 +1,110 @@
+"""
+Stress test prenotazioni concorrenti sullo stesso slot.
+
+Per ogni slot invia N prenotazioni in parallelo (utenti diversi) e conta:
+prenotazioni riuscite, conflitti 409, errori, doppie prenotazioni (più di una
+risposta 200 per lo stesso slot) e throughput.
+
+In-process (database temporaneo):
+    cd backend && python -m bench.booking_stress --slots 20 --concurrency 16
+Contro un server avviato (gli utenti bench-*@example.com vengono registrati):
+    python -m bench.booking_stress --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import base64
+import time
+from collections import Counter
+from datetime import date, time as dt_time, timedelta
+
+import httpx
+
+from .common import use_temp_workdir
+
+PDF_B64 = base64.b64encode(b"%PDF-1.4 bench\n" * 64).decode()
+
+
+def _slot(i: int):
+    d = date.today() + timedelta(days=365 + i // 10)
+    return d, dt_time(8 + i % 10, 0)
+
+
+async def _register_and_login(client: httpx.AsyncClient, n: int) -> list:
+    async def one(i):
+        email = f"bench-{i}@example.com"
+        await client.post("/api/auth/register", json={"name": f"bench{i}", "email": email, "password": "bench"})
+        r = await client.post("/api/auth/login", data={"username": email, "password": "bench"})
+        r.raise_for_status()
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    return await asyncio.gather(*(one(i) for i in range(n)))
+
+
+async def run(client: httpx.AsyncClient, slots: int, concurrency: int, facility: str) -> dict:
+    headers = await _register_and_login(client, concurrency)
+    outcomes = Counter()
+    booked = Counter()
+
+    async def book(h, d, t):
+        r = await client.post(
+            "/api/appointments",
+            headers=h,
+            json={"facility": facility, "date": d.isoformat(), "time": t.strftime("%H:%M"),
+                  "pdf_filename": "bench.pdf", "pdf_base64": PDF_B64},
+        )
+        outcomes[r.status_code] += 1
+        if r.status_code == 200:
+            booked[(d, t)] += 1
+
+    start = time.perf_counter()
+    for i in range(slots):
+        d, t = _slot(i)
+        await asyncio.gather(*(book(h, d, t) for h in headers))
+    elapsed = time.perf_counter() - start
+
+    total = slots * concurrency
+    return {
+        "requests": total,
+        "ok": outcomes[200],
+        "conflicts_409": outcomes[409],
+        "errors": total - outcomes[200] - outcomes[409],
+        "double_bookings": sum(n - 1 for n in booked.values() if n > 1),
+        "seconds": round(elapsed, 3),
+        "req_per_s": round(total / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="server già avviato; se assente usa l'app in-process")
+    parser.add_argument("--slots", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--facility", default="Milano")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        # database e blob store temporanei: l'app usa percorsi relativi alla cwd
+        use_temp_workdir()
+        from app import migrations
+        from app.database import engine
+        from app.main import app
+
+        # ASGITransport non esegue il lifespan: schema creato qui
+        migrations.upgrade(engine)
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async def go():
+        async with client:
+            return await run(client, args.slots, args.concurrency, args.facility)
+
+    result = asyncio.run(go())
+    for key, value in result.items():
+        print(f"{key:>16}: {value}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
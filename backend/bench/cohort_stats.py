@@ -0,0 +1,127 @@
+"""
+Benchmark statistiche di coorte admin (app/cohort.py).
+
+Genera N sintomi sintetici (default 1M) con tag su un database temporaneo,
+poi misura separatamente il caricamento delle colonne in NumPy, il calcolo
+vettoriale e la lettura dalla cache. Con --baseline confronta il calcolo con
+un'implementazione Python riga per riga sugli stessi dati.
+
+    cd backend && python -m bench.cohort_stats --entries 1000000 --users 5000
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from .common import use_temp_workdir
+
+TAGS = ["mal di testa", "nausea", "febbre", "tosse", "stanchezza", "dolore", "vertigini", "insonnia"]
+
+
+def _populate(engine, n_entries: int, n_users: int, days: int, batch: int = 50_000) -> None:
+    from sqlalchemy import insert
+
+    from app import models
+
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.User),
+            [
+                {"name": f"u{i}", "email": f"u{i}@bench.local", "password_hash": "-", "is_admin": False}
+                for i in range(1, n_users + 1)
+            ],
+        )
+    entry_id = 0
+    while entry_id < n_entries:
+        entries, tags = [], []
+        for _ in range(min(batch, n_entries - entry_id)):
+            entry_id += 1
+            user_id = rnd.randint(1, n_users)
+            picked = rnd.sample(TAGS, rnd.randint(0, 3))
+            entries.append({
+                "id": entry_id,
+                "user_id": user_id,
+                "title": "bench",
+                "severity": rnd.randint(1, 10),
+                "timestamp": now - timedelta(minutes=rnd.randint(0, days * 24 * 60)),
+                "tags": ",".join(picked),
+                "change_seq": 0,
+            })
+            tags.extend({"entry_id": entry_id, "user_id": user_id, "tag": t} for t in picked)
+        with engine.begin() as conn:
+            conn.execute(insert(models.SymptomEntry), entries)
+            if tags:
+                conn.execute(insert(models.EntryTag), tags)
+
+
+def _baseline(cols) -> int:
+    # stesso calcolo per tag (conteggio, media, percentili), riga per riga
+    by_id = {
+        int(e): (int(s), int(u))
+        for e, s, u in zip(cols["entry_id"], cols["severity"], cols["user_id"])
+    }
+    sev_by_tag = defaultdict(list)
+    users_by_tag = defaultdict(set)
+    for entry_id, code in zip(cols["tag_entry"].tolist(), cols["tag_code"].tolist()):
+        sev, user = by_id[entry_id]
+        sev_by_tag[code].append(sev)
+        users_by_tag[code].add(user)
+    out = 0
+    for code, values in sev_by_tag.items():
+        values.sort()
+        _ = (sum(values) / len(values), values[len(values) // 2], values[int(len(values) * 0.9)])
+        out += len(users_by_tag[code])
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--baseline", action="store_true")
+    args = parser.parse_args()
+
+    workdir = use_temp_workdir()
+
+    from app import cohort
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+
+    t0 = time.perf_counter()
+    _populate(engine, args.entries, args.users, args.days)
+    print(f"dati: {args.entries} sintomi, {args.users} utenti in {time.perf_counter() - t0:.1f}s ({workdir})")
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        cols = cohort.load_columns(db, now - timedelta(days=args.days))
+        load_s = time.perf_counter() - t0
+    finally:
+        db.close()
+
+    t0 = time.perf_counter()
+    stats = cohort.compute(cols, now, cohort.COHORT_THRESHOLD)
+    compute_s = time.perf_counter() - t0
+    print(f"caricamento colonne: {load_s:.2f}s ({cols['entry_id'].size} sintomi, {cols['tag_entry'].size} tag)")
+    print(f"calcolo vettoriale:  {compute_s * 1000:.1f}ms ({len(stats['tags'])} tag)")
+
+    if args.baseline:
+        t0 = time.perf_counter()
+        _baseline(cols)
+        print(f"calcolo Python:      {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    cohort.get_stats(SessionLocal, args.days, cohort.COHORT_THRESHOLD, refresh=True)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        cohort.get_stats(SessionLocal, args.days, cohort.COHORT_THRESHOLD)
+    print(f"lettura da cache:    {(time.perf_counter() - t0) / 1000 * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Funzioni condivise dagli script di benchmark."""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentile (nearest-rank) di una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def latency_summary(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Throughput e p50/p95/p99 in millisecondi."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "req_per_s": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def use_workdir(path: str) -> str:
+    """Sposta la cwd in path (DB, blob e cache dell'app sono relativi) e rende importabile app."""
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return path
+
+
+def use_temp_workdir(prefix: str = "msd-bench-") -> str:
+    """Sposta la cwd in una cartella temporanea nuova."""
+    return use_workdir(tempfile.mkdtemp(prefix=prefix))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(env: Optional[Dict[str, str]] = None, workdir: Optional[str] = None) -> Iterator[str]:
+    """Avvia app.main:app con uvicorn in un processo separato e ne restituisce l'URL."""
+    port = _free_port()
+    workdir = workdir or tempfile.mkdtemp(prefix="msd-bench-")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR, **(env or {})},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                httpx.get(url + "/", timeout=1)
+                break
+            except httpx.TransportError:
+                if proc.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("uvicorn non si è avviato")
+                time.sleep(0.2)
+        yield url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
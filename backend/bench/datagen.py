@@ -0,0 +1,250 @@
+"""
+Generatore di dati sintetici riproducibili per benchmark e prove di carico.
+
+Crea (con --seed fisso, stessi dati a ogni esecuzione) nella cartella di lavoro:
+  - --patients pazienti e un admin, tutti con password "bench";
+  - --entries sintomi per paziente negli ultimi --days giorni, con tag
+    realistici (alcuni più frequenti, severità media diversa per tag e per
+    paziente, uno ogni dieci con sei tag), descrizioni facoltative e
+    maiuscole miste nei tag;
+  - --appointments visite distribuite tra le strutture e gli orari
+    disponibili, in tutti gli stati, ognuna con un PDF nel blob store;
+  - tag normalizzati, indice full-text, rollup e versioni delle collezioni
+    coerenti con i dati (come se fossero stati inseriti tramite le API).
+
+Scrive anche bench-data.json con parametri, conteggi e credenziali.
+
+    cd backend && python -m bench.datagen --patients 200 --entries 100 --appointments 1000 --workdir /tmp/msd-data
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional
+
+from .common import use_temp_workdir, use_workdir
+
+PASSWORD = "bench"
+ADMIN_EMAIL = "admin@bench.example.com"
+MANIFEST = "bench-data.json"
+BATCH = 10_000
+
+# (tag, probabilità di comparire in un sintomo, severità media)
+TAG_PROFILES = [
+    ("mal di testa", 0.30, 5.0),
+    ("stanchezza", 0.25, 4.0),
+    ("dolore", 0.20, 6.0),
+    ("tosse", 0.15, 4.0),
+    ("nausea", 0.15, 4.5),
+    ("febbre", 0.12, 6.0),
+    ("mal di schiena", 0.12, 5.0),
+    ("insonnia", 0.10, 3.5),
+    ("vertigini", 0.08, 5.5),
+    ("emicrania", 0.06, 7.5),
+]
+# tag per sintomo: al massimo MAX_TAGS, tranne un sintomo ogni WIDE_EVERY che
+# ne ha WIDE_TAGS (caso peggiore per entry_tags e rollup, che crescono con i tag)
+MAX_TAGS = 3
+WIDE_EVERY = 10
+WIDE_TAGS = 6
+DESCRIPTIONS = [
+    "Comparso al risveglio, migliora nel pomeriggio.",
+    "Dopo il pranzo, durata circa due ore.",
+    "Peggiora con lo sforzo fisico.",
+    "Preso un antidolorifico, sollievo parziale.",
+    "Episodio simile alla settimana scorsa.",
+    "Notte agitata, pochi risvegli.",
+]
+STATUS_WEIGHTS = {"PENDING": 0.30, "CONFIRMED": 0.40, "REJECTED": 0.15, "PROPOSED": 0.15}
+
+
+def patient_email(i: int) -> str:
+    return f"patient{i}@bench.example.com"
+
+
+def _pdf_bytes(n: int, size: int) -> bytes:
+    head = f"%PDF-1.4\n% impegnativa visita {n}\n".encode()
+    tail = b"\n%%EOF\n"
+    return head + b"0" * max(0, size - len(head) - len(tail)) + tail
+
+
+def _entries(rnd: random.Random, n_patients: int, per_patient: int, days: int, now: datetime) -> List[dict]:
+    rows = []
+    for user_id in range(1, n_patients + 1):
+        # pazienti con disturbi più o meno intensi della media
+        offset = rnd.gauss(0, 1.0)
+        user_rows = []
+        for k in range(per_patient):
+            if k % WIDE_EVERY == WIDE_EVERY - 1:
+                tags = rnd.sample([t for t, _, _ in TAG_PROFILES], WIDE_TAGS)
+            else:
+                tags = [t for t, p, _ in TAG_PROFILES if rnd.random() < p][:MAX_TAGS]
+            means = [m for t, _, m in TAG_PROFILES if t in tags] or [4.0]
+            severity = min(10, max(1, round(rnd.gauss(sum(means) / len(means) + offset, 1.8))))
+            shown = [t.capitalize() if rnd.random() < 0.3 else t for t in tags]
+            user_rows.append({
+                "user_id": user_id,
+                "title": tags[0].capitalize() if tags else "Controllo",
+                "description": rnd.choice(DESCRIPTIONS) if rnd.random() < 0.5 else None,
+                "severity": severity,
+                "timestamp": now - timedelta(minutes=rnd.randint(0, days * 24 * 60)),
+                "tags": ", ".join(shown) or None,
+            })
+        # change_seq come se i sintomi fossero stati inseriti in ordine di data
+        user_rows.sort(key=lambda r: r["timestamp"])
+        for seq, row in enumerate(user_rows, start=1):
+            row["change_seq"] = seq
+            row["updated_at"] = row["timestamp"]
+        rows.extend(user_rows)
+    for entry_id, row in enumerate(rows, start=1):
+        row["id"] = entry_id
+    return rows
+
+
+def _slots(rnd: random.Random, count: int, today: date) -> list:
+    """count slot (struttura, data, ora) distinti in giorni feriali attorno a oggi."""
+    from app import availability
+
+    per_day = len(availability.FACILITIES) * len(availability.SLOT_TIMES)
+    span = math.ceil(count / per_day * 7 / 5) + 7
+    start = today - timedelta(days=span // 2)
+    slots = [
+        (f, start + timedelta(days=d), t)
+        for d in range(span)
+        if (start + timedelta(days=d)).weekday() in availability.OPEN_WEEKDAYS
+        for f in availability.FACILITIES
+        for t in availability.SLOT_TIMES
+    ]
+    rnd.shuffle(slots)
+    return slots[:count]
+
+
+def _appointments(rnd: random.Random, n_patients: int, count: int, today: date, pdf_kb: int) -> List[dict]:
+    from app import availability, blobstore
+
+    statuses, weights = zip(*STATUS_WEIGHTS.items())
+    rows = []
+    for n, (facility, d, t) in enumerate(_slots(rnd, count, today), start=1):
+        status = rnd.choices(statuses, weights)[0]
+        row = {
+            "id": n,
+            "user_id": rnd.randint(1, n_patients),
+            "facility": facility,
+            "date": d,
+            "time": t,
+            "status": status,
+            "proposed_date": None,
+            "proposed_time": None,
+            "pdf_filename": f"impegnativa_{n}.pdf",
+            "pdf_ref": blobstore.put_bytes(_pdf_bytes(n, pdf_kb * 1024)),
+        }
+        if status == "PROPOSED":
+            row["proposed_date"] = d + timedelta(days=7)
+            row["proposed_time"] = rnd.choice(availability.SLOT_TIMES)
+        rows.append(row)
+    return rows
+
+
+def _versions(entries: List[dict], appointments: List[dict]) -> List[dict]:
+    from app import versions
+
+    counts: Dict[tuple, int] = {}
+    for collection, rows in ((versions.ENTRIES, entries), (versions.APPOINTMENTS, appointments)):
+        for row in rows:
+            for owner in (row["user_id"], versions.GLOBAL):
+                key = (collection, owner)
+                counts[key] = counts.get(key, 0) + 1
+    return [{"collection": c, "owner_id": o, "version": v} for (c, o), v in counts.items()]
+
+
+def generate(
+    engine,
+    patients: int,
+    entries: int,
+    appointments: int,
+    days: int = 180,
+    seed: int = 42,
+    pdf_kb: int = 16,
+) -> dict:
+    """Popola il database (vuoto) di engine e restituisce il manifest dei dati."""
+    from sqlalchemy import insert
+    from sqlalchemy.orm import Session
+
+    from app import migrations, models, passwords, rollups, search
+
+    rnd = random.Random(seed)
+    # ora arrotondata: con lo stesso seed i dati cambiano solo con il giorno
+    now = datetime.combine(date.today(), dt_time(12, 0))
+    migrations.upgrade(engine)
+
+    password_hash = passwords.hash_password(PASSWORD)
+    users = [
+        {"id": i, "name": f"Paziente {i}", "email": patient_email(i), "password_hash": password_hash, "is_admin": False}
+        for i in range(1, patients + 1)
+    ]
+    users.append({
+        "id": patients + 1, "name": "Admin", "email": ADMIN_EMAIL, "password_hash": password_hash, "is_admin": True,
+    })
+    entry_rows = _entries(rnd, patients, entries, days, now)
+    appt_rows = _appointments(rnd, patients, appointments, now.date(), pdf_kb)
+
+    with Session(engine) as db:
+        db.execute(insert(models.User), users)
+        for i in range(0, len(entry_rows), BATCH):
+            db.execute(insert(models.SymptomEntry), entry_rows[i:i + BATCH])
+        for i in range(0, len(appt_rows), BATCH):
+            db.execute(insert(models.Appointment), appt_rows[i:i + BATCH])
+        db.execute(insert(models.CollectionVersion), _versions(entry_rows, appt_rows))
+        search.rebuild(db)
+        rollups.rebuild(db)
+        db.commit()
+
+    return {
+        "seed": seed,
+        "days": days,
+        "generated_at": now.isoformat(),
+        "password": PASSWORD,
+        "admin": ADMIN_EMAIL,
+        "patients": [u["email"] for u in users[:-1]],
+        "counts": {
+            "patients": patients,
+            "entries": len(entry_rows),
+            "appointments": len(appt_rows),
+        },
+    }
+
+
+def write_manifest(manifest: dict, path: str = MANIFEST) -> None:
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main(argv: Optional[list] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=100, help="sintomi per paziente")
+    parser.add_argument("--appointments", type=int, default=500)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pdf-kb", type=int, default=16)
+    parser.add_argument("--workdir", help="cartella del DB (default: nuova cartella temporanea)")
+    args = parser.parse_args(argv)
+
+    workdir = use_workdir(args.workdir) if args.workdir else use_temp_workdir()
+    from app.database import engine
+
+    t0 = time.perf_counter()
+    manifest = generate(engine, args.patients, args.entries, args.appointments, args.days, args.seed, args.pdf_kb)
+    write_manifest(manifest)
+    counts = manifest["counts"]
+    print(
+        f"{counts['patients']} pazienti, {counts['entries']} sintomi, {counts['appointments']} visite "
+        f"in {time.perf_counter() - t0:.1f}s -> {workdir}"
+    )
+    return manifest
+
+
+if __name__ == "__main__":
+    main()
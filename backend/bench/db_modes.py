@@ -0,0 +1,82 @@
+"""
+Confronto modalità database sync e async (MSD_DB_MODE) sotto carico concorrente.
+
+Per ogni modalità avvia uvicorn su un database temporaneo, crea un utente con
+--entries sintomi e alcune visite, poi esegue --requests richieste con
+--concurrency client in parallelo su GET /api/entries, /api/appointments e
+/api/users/me. Riporta richieste/s e latenza p50/p95/p99.
+
+    cd backend && python -m bench.db_modes --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import base64
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from .common import latency_summary, uvicorn_server
+
+ROUTES = ["/api/entries", "/api/appointments", "/api/users/me"]
+
+
+async def _seed(client: httpx.AsyncClient, entries: int) -> dict:
+    email = "bench-modes@example.com"
+    await client.post("/api/auth/register", json={"name": "bench", "email": email, "password": "bench"})
+    r = await client.post("/api/auth/login", data={"username": email, "password": "bench"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    for i in range(entries):
+        await client.post("/api/entries", headers=headers, json={
+            "title": f"sintomo {i}", "description": "descrizione " * 5, "severity": 1 + i % 10,
+            "timestamp": f"2024-01-{1 + i % 28:02d}T{i % 24:02d}:00:00", "tags": "mal di testa,nausea",
+        })
+    pdf = base64.b64encode(b"%PDF-1.4 bench").decode()
+    for i in range(5):
+        d = date.today() + timedelta(days=400 + i)
+        await client.post("/api/appointments", headers=headers, json={
+            "facility": "Milano", "date": d.isoformat(), "time": "09:00", "pdf_filename": "b.pdf", "pdf_base64": pdf,
+        })
+    return headers
+
+
+async def _load(url: str, requests: int, concurrency: int, entries: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        headers = await _seed(client, entries)
+        latencies = []
+        counter = iter(range(requests))
+
+        async def worker():
+            for i in counter:
+                t0 = time.perf_counter()
+                r = await client.get(ROUTES[i % len(ROUTES)], headers=headers)
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latency_summary(latencies, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--entries", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode in ("sync", "async"):
+        with uvicorn_server(env={"MSD_DB_MODE": mode}) as url:
+            results[mode] = asyncio.run(_load(url, args.requests, args.concurrency, args.entries))
+
+    keys = list(results["sync"])
+    print(f"{'':>10} " + " ".join(f"{k:>10}" for k in keys))
+    for mode, res in results.items():
+        print(f"{mode:>10} " + " ".join(f"{res[k]:>10}" for k in keys))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Budget di query SQL per route, con rilevatore di N+1.
+
+Su un piccolo dataset sintetico (bench/datagen.py) esegue --requests
+richieste per ogni route della suite (bench/suite.py), in-process con la
+diagnostica SQL attiva (app/sql_diagnostics.py), e verifica che nessuna
+richiesta superi il budget di statement della route in ROUTE_BUDGETS né
+ripeta lo stesso statement MSD_N_PLUS_ONE volte o più. Esce con codice 1 se
+una route sfora o non ha un budget: una nuova route va aggiunta qui.
+
+    cd backend && python -m bench.query_budget --requests 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+os.environ["MSD_SQL_DIAGNOSTICS"] = "1"
+
+import httpx  # noqa: E402
+
+from . import datagen, suite  # noqa: E402
+from .common import use_temp_workdir  # noqa: E402
+
+# statement SQL massimi per richiesta (autenticazione compresa: il login
+# è in cache dopo la prima richiesta dello stesso token). Sono obiettivi, non
+# i valori misurati: circa un quarto di margine (almeno uno statement) su
+# quanto eseguono oggi le route; quelle servite dalla memoria restano a 0.
+ROUTE_BUDGETS = {
+    "GET /": 0,
+    "POST /api/auth/register": 4,
+    "POST /api/auth/login": 2,
+    "GET /api/users/me": 1,
+    # diario del paziente
+    "GET /api/entries": 3,
+    "GET /api/entries (304)": 2,
+    "GET /api/entries?tag": 3,
+    "GET /api/entries/timeline": 2,
+    "GET /api/entries/search": 2,
+    "GET /api/entries/export": 2,
+    "GET /api/entries/trends": 2,
+    "GET /api/entries/changes": 2,
+    "POST /api/entries": 12,
+    "POST /api/entries/import": 8,
+    # tag e rollup aggiornati con statement per insieme: non crescono con il
+    # numero di tag (la suite modifica ed elimina anche sintomi con sei tag)
+    "PUT /api/entries/{id}": 18,
+    "DELETE /api/entries/{id}": 13,
+    # admin, sintomi
+    "GET /api/entries/admin/all": 4,
+    "GET /api/entries/admin/feed": 3,
+    "GET /api/entries/admin/feed?filtri": 3,
+    "GET /api/entries/admin/search": 2,
+    "GET /api/entries/admin/trends": 2,
+    # di solito dalla cache; al miss il ricalcolo legge colonne e tag (2 query)
+    "GET /api/entries/admin/cohort": 3,
+    # visite
+    "GET /api/appointments/availability": 0,
+    "GET /api/appointments/availability/free": 0,
+    "GET /api/appointments/availability/first": 0,
+    "POST /api/appointments": 4,
+    "POST /api/appointments/upload": 4,
+    "GET /api/appointments": 3,
+    "GET /api/appointments/{id}/attachment": 2,
+    "PUT /api/appointments/{id}/status": 7,
+    "PUT /api/appointments/{id}/propose": 7,
+    "PUT /api/appointments/{id}/accept": 7,
+    "PUT /api/appointments/{id}/reject": 7,
+    "GET /api/appointments/admin/all": 3,
+    "GET /api/appointments/admin/queue": 4,
+    "GET /api/appointments/{id}/pdf": 3,
+    "GET /metrics": 0,
+}
+
+
+async def _run(manifest: dict, requests: int) -> list:
+    from app import sql_diagnostics
+    from app.main import app
+
+    rows = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            ctx = await suite.build_context(client, manifest, 4)
+            for route in suite.routes():
+                if route.setup:
+                    await route.setup(client, ctx, requests)
+                budget = ROUTE_BUDGETS.get(route.name)
+                failures = [] if budget is not None else ["budget mancante in ROUTE_BUDGETS"]
+                try:
+                    with sql_diagnostics.query_budget(
+                        budget if budget is not None else sys.maxsize,
+                        max_repeats=sql_diagnostics.N_PLUS_ONE - 1,
+                    ) as collected:
+                        for i in range(requests):
+                            method, url, kwargs = route.build(ctx, i)
+                            await client.request(method, url, **kwargs)
+                except sql_diagnostics.QueryBudgetExceeded as exc:
+                    failures.extend(str(exc).splitlines())
+                worst = max((q.statements for q in collected.requests), default=0)
+                rows.append((route.name, worst, budget, failures))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5, help="richieste per route")
+    args = parser.parse_args(argv)
+
+    use_temp_workdir("msd-query-budget-")
+    from app.database import engine
+
+    manifest = datagen.generate(engine, patients=10, entries=30, appointments=60)
+    rows = asyncio.run(_run(manifest, args.requests))
+
+    print(f"  {'route':<42} {'max':>5} {'budget':>6}")
+    failed = 0
+    for name, worst, budget, failures in rows:
+        print(f"  {name:<42} {worst:>5} {budget if budget is not None else '-':>6} {'SFORA' if failures else ''}")
+        for failure in failures:
+            print(f"      {failure}")
+        failed += bool(failures)
+    if failed:
+        print(f"\n{failed} route fuori budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
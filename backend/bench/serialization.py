@@ -0,0 +1,167 @@
+"""
+Benchmark serializzazione delle liste (app/fastjson.py).
+
+Confronta il costo per riga delle due strade su N sintomi sintetici:
+
+  prima: oggetti ORM (o dict per riga) -> validazione response_model di
+         FastAPI -> jsonable_encoder -> json.dumps (JSONResponse)
+  dopo:  tuple di colonne -> dict -> orjson (fastjson.response)
+
+Misura separatamente lettura dal DB e serializzazione, per la lista
+paziente (SymptomEntryOut) e per quella admin (EntryAdminOut).
+
+    cd backend && python -m bench.serialization --rows 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from .common import use_temp_workdir
+
+
+def _populate(engine, n_rows: int) -> None:
+    from sqlalchemy import insert
+
+    from app import models
+
+    rnd = random.Random(42)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.User),
+            [{"id": 1, "name": "u1", "email": "u1@bench.local", "password_hash": "-", "is_admin": False}],
+        )
+        conn.execute(
+            insert(models.SymptomEntry),
+            [
+                {
+                    "user_id": 1,
+                    "title": f"sintomo {i}",
+                    "description": "descrizione di prova" if i % 2 else None,
+                    "severity": rnd.randint(1, 10),
+                    "timestamp": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365)),
+                    "updated_at": now,
+                    "tags": "mal di testa,nausea" if i % 3 else None,
+                    "change_seq": i,
+                }
+                for i in range(n_rows)
+            ],
+        )
+
+
+def _best(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _old_render(field, content) -> bytes:
+    # stessa sequenza di FastAPI per un valore restituito dall'handler
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    value = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(value).body
+
+
+def _report(name: str, n: int, fetch_old: float, ser_old: float, fetch_new: float, ser_new: float) -> None:
+    us = lambda s: s / n * 1e6  # noqa: E731
+    old, new = fetch_old + ser_old, fetch_new + ser_new
+    print(f"{name}")
+    print(f"  lettura DB      prima {us(fetch_old):6.2f}us/riga   dopo {us(fetch_new):6.2f}us/riga")
+    print(f"  serializzazione prima {us(ser_old):6.2f}us/riga   dopo {us(ser_new):6.2f}us/riga")
+    print(f"  totale          prima {us(old):6.2f}us/riga   dopo {us(new):6.2f}us/riga   ({old / new:.1f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = use_temp_workdir()
+
+    from fastapi.utils import create_model_field
+    from sqlalchemy import select
+
+    from app import fastjson, models, schemas
+    from app.database import Base, SessionLocal, engine
+    from app.routers.entries_routes import _ADMIN_FEED_COLUMNS, query_miei_sintomi
+
+    Base.metadata.create_all(bind=engine)
+    _populate(engine, args.rows)
+    print(f"dati: {args.rows} sintomi ({workdir}), orjson: {'sì' if fastjson.orjson else 'no'}\n")
+
+    n, repeat = args.rows, args.repeat
+    db = SessionLocal()
+    try:
+        # lista paziente
+        orm_stmt = select(models.SymptomEntry).where(models.SymptomEntry.user_id == 1).order_by(
+            models.SymptomEntry.timestamp.desc()
+        )
+        cols_stmt = query_miei_sintomi(1, None, None, None)
+        field = create_model_field("Response", List[schemas.SymptomEntryOut], mode="serialization")
+
+        def fetch_orm():
+            db.expunge_all()
+            return db.execute(orm_stmt).scalars().all()
+
+        def fetch_cols():
+            return db.execute(cols_stmt).all()
+
+        objs, rows = fetch_orm(), fetch_cols()
+        _report(
+            "GET /api/entries (SymptomEntryOut)", n,
+            _best(fetch_orm, repeat),
+            _best(lambda: _old_render(field, objs), repeat),
+            _best(fetch_cols, repeat),
+            _best(lambda: fastjson.response(fastjson.records(rows)).body, repeat),
+        )
+
+        # lista admin: prima un dict per riga costruito da (entità, email)
+        admin_orm_stmt = (
+            select(models.SymptomEntry, models.User.email)
+            .join(models.User, models.User.id == models.SymptomEntry.user_id)
+            .order_by(models.SymptomEntry.timestamp.desc())
+        )
+        admin_cols_stmt = (
+            select(*_ADMIN_FEED_COLUMNS)
+            .join(models.User, models.User.id == models.SymptomEntry.user_id)
+            .order_by(models.SymptomEntry.timestamp.desc())
+        )
+        admin_field = create_model_field("Response", List[schemas.EntryAdminOut], mode="serialization")
+
+        def fetch_admin_orm():
+            db.expunge_all()
+            return [
+                {
+                    "id": e.id, "title": e.title, "description": e.description,
+                    "severity": e.severity, "timestamp": e.timestamp, "tags": e.tags,
+                    "user_id": e.user_id, "user_email": email,
+                }
+                for e, email in db.execute(admin_orm_stmt).all()
+            ]
+
+        def fetch_admin_cols():
+            return db.execute(admin_cols_stmt).all()
+
+        dicts, admin_rows = fetch_admin_orm(), fetch_admin_cols()
+        _report(
+            "GET /api/entries/admin/all (EntryAdminOut)", n,
+            _best(fetch_admin_orm, repeat),
+            _best(lambda: _old_render(admin_field, dicts), repeat),
+            _best(fetch_admin_cols, repeat),
+            _best(lambda: fastjson.response(fastjson.records(admin_rows)).body, repeat),
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark avvio dell'app, con budget.
+
+In processi Python nuovi (nessuna cache di moduli) misura:
+  - import di app.main (nessun accesso al DB);
+  - startup del lifespan su un DB vuoto (migrazioni complete) e su un DB
+    già migrato (il caso di un riavvio);
+e verifica che ReportLab, passlib, python-jose e NumPy non vengano
+importati all'avvio. Esce con codice 1 se una mediana supera il budget
+o se un modulo pesante viene caricato in anticipo.
+
+    cd backend && python -m bench.startup --runs 5 --import-budget-ms 2000 --startup-budget-ms 500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from .common import BACKEND_DIR
+
+LAZY_MODULES = ("reportlab", "passlib", "jose", "numpy")
+
+# eseguito nel processo figlio: stampa le misure in JSON sull'ultima riga
+_CHILD = """
+import asyncio, json, sys, time, warnings
+warnings.simplefilter("ignore")
+t0 = time.perf_counter()
+from app.main import app
+import_s = time.perf_counter() - t0
+eager = [m for m in {lazy!r} if m in sys.modules]
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter() - t1
+
+t1 = time.perf_counter()
+startup_s = asyncio.run(startup())
+print(json.dumps({{"import_ms": import_s * 1000, "startup_ms": startup_s * 1000, "eager": eager}}))
+"""
+
+
+def _run_child(workdir: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(lazy=LAZY_MODULES)],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR, "MSD_COHORT_REFRESH": "0"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int) -> dict:
+    """Mediane (ms) di import, primo avvio e riavvio su `runs` processi nuovi."""
+    imports, first, restart, eager = [], [], [], set()
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix="msd-bench-")
+        cold = _run_child(workdir)
+        warm = _run_child(workdir)
+        imports.extend([cold["import_ms"], warm["import_ms"]])
+        first.append(cold["startup_ms"])
+        restart.append(warm["startup_ms"])
+        eager.update(cold["eager"])
+    return {
+        "import_ms": round(statistics.median(imports), 1),
+        "first_startup_ms": round(statistics.median(first), 1),
+        "restart_startup_ms": round(statistics.median(restart), 1),
+        "eager_modules": sorted(eager),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("MSD_IMPORT_BUDGET_MS", "2000")))
+    parser.add_argument("--startup-budget-ms", type=float, default=float(os.getenv("MSD_STARTUP_BUDGET_MS", "500")))
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs)
+    for key, value in result.items():
+        print(f"{key:>20}: {value}")
+
+    failures = []
+    if result["import_ms"] > args.import_budget_ms:
+        failures.append(f"import {result['import_ms']}ms > budget {args.import_budget_ms}ms")
+    if result["restart_startup_ms"] > args.startup_budget_ms:
+        failures.append(f"riavvio {result['restart_startup_ms']}ms > budget {args.startup_budget_ms}ms")
+    if result["eager_modules"]:
+        failures.append(f"moduli importati all'avvio: {', '.join(result['eager_modules'])}")
+    for failure in failures:
+        print(f"FUORI BUDGET: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""
+Suite di benchmark delle API: tutte le route, in-process e via HTTP.
+
+Genera un dataset sintetico (bench/datagen.py, seed fisso), poi per ogni
+modalità (--mode inprocess, http o both) esegue --requests richieste per
+route con --concurrency client in parallelo e riporta richieste/s,
+latenza p50/p95/p99 ed errori (status diverso da quello atteso).
+Le risorse consumate dalle route di scrittura (sintomi da eliminare, visite
+da confermare/accettare, ...) vengono preparate prima, fuori dalla misura.
+
+  inprocess: app ASGI nello stesso processo (httpx.ASGITransport), lifespan incluso
+  http:      uvicorn locale su una copia degli stessi dati (bench/common.py)
+
+Baseline: --save-baseline salva i risultati in JSON; --compare li confronta
+con una baseline salvata ed esce con codice 1 se una route peggiora oltre
+--tolerance (p95 più alto o richieste/s più basse).
+
+    cd backend && python -m bench.suite --mode both --save-baseline /tmp/msd-baseline.json
+    cd backend && python -m bench.suite --mode both --compare /tmp/msd-baseline.json
+    cd backend && python -m bench.suite --routes admin --requests 50
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from . import datagen
+from .common import BACKEND_DIR, latency_summary, use_workdir, uvicorn_server
+
+Request = Tuple[str, str, dict]
+
+PDF_BYTES = datagen._pdf_bytes(0, 16 * 1024)
+PDF_B64 = base64.b64encode(PDF_BYTES).decode()
+MANY_TAGS = ", ".join(t for t, _, _ in datagen.TAG_PROFILES[:datagen.WIDE_TAGS])
+
+
+@dataclass
+class Context:
+    """Stato condiviso dalle route: intestazioni di login e risorse preparate."""
+    admin: dict
+    patients: List[dict]
+    entry_ids: List[List[int]]
+    appointments: List[Tuple[int, int]]  # (indice paziente, id visita)
+    slots: Iterator[tuple]
+    prepared: Dict[str, list] = field(default_factory=dict)
+    etags: List[str] = field(default_factory=list)
+    # sintomi con datagen.WIDE_TAGS tag, per paziente
+    wide_entry_ids: List[List[int]] = field(default_factory=list)
+
+    def patient(self, i: int) -> dict:
+        return self.patients[i % len(self.patients)]
+
+    def entry(self, i: int) -> int:
+        """Sintomo del paziente i: alternati uno qualsiasi e uno con molti tag."""
+        ids = self.entry_ids[i % len(self.patients)]
+        wide = self.wide_entry_ids[i % len(self.patients)] if self.wide_entry_ids else []
+        if i % 2 and wide:
+            return wide[i // 2 % len(wide)]
+        return ids[i % len(ids)]
+
+
+@dataclass
+class Route:
+    name: str
+    build: Callable[[Context, int], Request]
+    setup: Optional[Callable[[httpx.AsyncClient, Context, int], Awaitable[None]]] = None
+    expect: Tuple[int, ...] = (200,)
+
+
+def _future_slots() -> Iterator[tuple]:
+    """Slot liberi (struttura, data, ora) oltre l'orizzonte del dataset.
+
+    Ogni (data, ora) esce una volta sola: le proposte restano nella struttura
+    della visita, quindi non devono incrociare slot prenotati altrove.
+    """
+    from app import availability
+
+    d = date.today() + timedelta(days=400)
+    n = 0
+    while True:
+        if d.weekday() in availability.OPEN_WEEKDAYS:
+            for t in availability.SLOT_TIMES:
+                yield availability.FACILITIES[n % len(availability.FACILITIES)], d, t
+                n += 1
+        d += timedelta(days=1)
+
+
+def _booking(slot) -> dict:
+    facility, d, t = slot
+    return {"facility": facility, "date": d.isoformat(), "time": t.strftime("%H:%M"),
+            "pdf_filename": "bench.pdf", "pdf_base64": PDF_B64}
+
+
+async def _login(client: httpx.AsyncClient, email: str) -> dict:
+    r = await client.post("/api/auth/login", data={"username": email, "password": datagen.PASSWORD})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def build_context(client: httpx.AsyncClient, manifest: dict, n_patients: int) -> Context:
+    emails = manifest["patients"][:n_patients]
+    admin = await _login(client, manifest["admin"])
+    patients = list(await asyncio.gather(*(_login(client, e) for e in emails)))
+    entry_ids, wide_entry_ids, appointments = [], [], []
+    for p, headers in enumerate(patients):
+        entries = (await client.get("/api/entries", headers=headers)).json()
+        entry_ids.append([e["id"] for e in entries[:50]] or [0])
+        wide_entry_ids.append([e["id"] for e in entries if len((e["tags"] or "").split(",")) >= datagen.WIDE_TAGS])
+        appointments.extend((p, a["id"]) for a in (await client.get("/api/appointments", headers=headers)).json())
+    return Context(admin, patients, entry_ids, appointments, _future_slots(), wide_entry_ids=wide_entry_ids)
+
+
+# preparazione risorse (non misurata)
+
+async def _prepare_entries(client, ctx: Context, n: int) -> None:
+    ids = []
+    for i in range(n):
+        r = await client.post("/api/entries", headers=ctx.patient(i), json={
+            "title": "da eliminare", "severity": 3, "timestamp": "2024-01-01T10:00:00",
+            "tags": MANY_TAGS if i % 2 else None})
+        ids.append(r.json()["id"])
+    ctx.prepared["delete"] = ids
+
+
+async def _book(client, ctx: Context, n: int, propose: bool = False) -> List[int]:
+    ids = []
+    for i in range(n):
+        r = await client.post("/api/appointments", headers=ctx.patient(i), json=_booking(next(ctx.slots)))
+        r.raise_for_status()
+        appt_id = r.json()["id"]
+        if propose:
+            facility, d, t = next(ctx.slots)
+            await client.put(f"/api/appointments/{appt_id}/propose", headers=ctx.admin,
+                             json={"proposed_date": d.isoformat(), "proposed_time": t.strftime("%H:%M")})
+        ids.append(appt_id)
+    return ids
+
+
+def _prepare_bookings(key: str, propose: bool = False):
+    async def setup(client, ctx: Context, n: int) -> None:
+        ctx.prepared[key] = await _book(client, ctx, n, propose)
+    return setup
+
+
+async def _prepare_etags(client, ctx: Context, n: int) -> None:
+    ctx.etags = [(await client.get("/api/entries", headers=h)).headers["etag"] for h in ctx.patients]
+
+
+def _proposal(ctx: Context) -> dict:
+    facility, d, t = next(ctx.slots)
+    return {"proposed_date": d.isoformat(), "proposed_time": t.strftime("%H:%M")}
+
+
+def _import_body(i: int) -> list:
+    return [{"title": f"importato {i}-{k}", "severity": 1 + k % 10,
+             "timestamp": f"2024-02-{1 + k % 28:02d}T08:00:00", "tags": "tosse"} for k in range(20)]
+
+
+def _owned(ctx: Context, i: int) -> Tuple[dict, int]:
+    p, appt_id = ctx.appointments[i % len(ctx.appointments)]
+    return ctx.patients[p], appt_id
+
+
+def routes() -> List[Route]:
+    today = date.today()
+    get = lambda url, who="patient": (  # noqa: E731
+        lambda ctx, i: ("GET", url, {"headers": ctx.admin if who == "admin" else ctx.patient(i)})
+    )
+    return [
+        Route("GET /", lambda ctx, i: ("GET", "/", {})),
+        # autenticazione
+        Route("POST /api/auth/register", lambda ctx, i: ("POST", "/api/auth/register", {
+            "json": {"name": "carico", "email": f"load-{os.getpid()}-{time.time_ns()}-{i}@bench.example.com",
+                     "password": datagen.PASSWORD}})),
+        Route("POST /api/auth/login", lambda ctx, i: ("POST", "/api/auth/login", {
+            "data": {"username": datagen.patient_email(1 + i % len(ctx.patients)), "password": datagen.PASSWORD}})),
+        Route("GET /api/users/me", get("/api/users/me")),
+        # diario del paziente
+        Route("GET /api/entries", get("/api/entries")),
+        Route("GET /api/entries (304)", lambda ctx, i: ("GET", "/api/entries", {
+            "headers": {**ctx.patient(i), "If-None-Match": ctx.etags[i % len(ctx.etags)]}}),
+            setup=_prepare_etags, expect=(304,)),
+        Route("GET /api/entries?tag", get("/api/entries?tag=mal%20di%20testa")),
+        Route("GET /api/entries/timeline", get("/api/entries/timeline?points=200")),
+        Route("GET /api/entries/search", get("/api/entries/search?q=testa")),
+        Route("GET /api/entries/export", get("/api/entries/export?format=csv")),
+        Route("GET /api/entries/trends", get("/api/entries/trends?bucket=week")),
+        Route("GET /api/entries/changes", get("/api/entries/changes?limit=500")),
+        Route("POST /api/entries", lambda ctx, i: ("POST", "/api/entries", {"headers": ctx.patient(i), "json": {
+            "title": "carico", "description": "sintomo di prova", "severity": 1 + i % 10,
+            "timestamp": "2024-03-01T09:00:00", "tags": "nausea, Mal di testa"}})),
+        Route("POST /api/entries/import", lambda ctx, i: ("POST", "/api/entries/import", {
+            "headers": ctx.patient(i), "json": _import_body(i)})),
+        Route("PUT /api/entries/{id}", lambda ctx, i: ("PUT", f"/api/entries/{ctx.entry(i)}", {
+            "headers": ctx.patient(i), "json": {"severity": 1 + i % 10}})),
+        Route("DELETE /api/entries/{id}", lambda ctx, i: ("DELETE", f"/api/entries/{ctx.prepared['delete'][i]}", {
+            "headers": ctx.patient(i)}), setup=_prepare_entries),
+        # admin, sintomi
+        Route("GET /api/entries/admin/all", get("/api/entries/admin/all", "admin")),
+        Route("GET /api/entries/admin/feed", get("/api/entries/admin/feed?limit=50", "admin")),
+        Route("GET /api/entries/admin/feed?filtri", get(
+            "/api/entries/admin/feed?limit=50&tag=nausea&min_severity=5", "admin")),
+        Route("GET /api/entries/admin/search", get("/api/entries/admin/search?q=dolore", "admin")),
+        Route("GET /api/entries/admin/trends", get("/api/entries/admin/trends?bucket=month", "admin")),
+        Route("GET /api/entries/admin/cohort", get("/api/entries/admin/cohort", "admin")),
+        # visite
+        Route("GET /api/appointments/availability", get(
+            f"/api/appointments/availability?facility=Milano&date={today + timedelta(days=3)}")),
+        Route("GET /api/appointments/availability/free", get("/api/appointments/availability/free?days=14")),
+        Route("GET /api/appointments/availability/first", get("/api/appointments/availability/first")),
+        Route("POST /api/appointments", lambda ctx, i: ("POST", "/api/appointments", {
+            "headers": ctx.patient(i), "json": _booking(next(ctx.slots))})),
+        Route("POST /api/appointments/upload", lambda ctx, i: (lambda f, d, t: ("POST", "/api/appointments/upload", {
+            "headers": {**ctx.patient(i), "Content-Type": "application/pdf"},
+            "params": {"facility": f, "date": d.isoformat(), "time": t.strftime("%H:%M"), "pdf_filename": "b.pdf"},
+            "content": PDF_BYTES}))(*next(ctx.slots))),
+        Route("GET /api/appointments", get("/api/appointments")),
+        Route("GET /api/appointments/{id}/attachment", lambda ctx, i: (lambda h, a: (
+            "GET", f"/api/appointments/{a}/attachment", {"headers": h}))(*_owned(ctx, i))),
+        Route("PUT /api/appointments/{id}/status", lambda ctx, i: (
+            "PUT", f"/api/appointments/{ctx.prepared['status'][i]}/status",
+            {"headers": ctx.admin, "json": {"status": "CONFIRMED"}}), setup=_prepare_bookings("status")),
+        Route("PUT /api/appointments/{id}/propose", lambda ctx, i: (
+            "PUT", f"/api/appointments/{ctx.prepared['propose'][i]}/propose",
+            {"headers": ctx.admin, "json": _proposal(ctx)}), setup=_prepare_bookings("propose")),
+        Route("PUT /api/appointments/{id}/accept", lambda ctx, i: (
+            "PUT", f"/api/appointments/{ctx.prepared['accept'][i]}/accept",
+            {"headers": ctx.patient(i)}), setup=_prepare_bookings("accept", propose=True)),
+        Route("PUT /api/appointments/{id}/reject", lambda ctx, i: (
+            "PUT", f"/api/appointments/{ctx.prepared['reject'][i]}/reject",
+            {"headers": ctx.patient(i)}), setup=_prepare_bookings("reject", propose=True)),
+        Route("GET /api/appointments/admin/all", get("/api/appointments/admin/all", "admin")),
+        Route("GET /api/appointments/admin/queue", get("/api/appointments/admin/queue?status=PENDING&limit=50", "admin")),
+        Route("GET /api/appointments/{id}/pdf", lambda ctx, i: (
+            "GET", f"/api/appointments/{_owned(ctx, i)[1]}/pdf", {"headers": ctx.admin})),
+        Route("GET /metrics", lambda ctx, i: ("GET", "/metrics", {"headers": ctx.admin})),
+    ]
+
+
+async def run_route(client: httpx.AsyncClient, ctx: Context, route: Route, requests: int, concurrency: int) -> dict:
+    if route.setup:
+        await route.setup(client, ctx, requests)
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = route.build(ctx, i)
+            t0 = time.perf_counter()
+            r = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code not in route.expect:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = latency_summary(latencies, time.perf_counter() - start)
+    summary["errors"] = errors
+    return summary
+
+
+async def run_suite(client, manifest: dict, selected: List[Route], args) -> Dict[str, dict]:
+    ctx = await build_context(client, manifest, args.logged_patients)
+    results = {}
+    for route in selected:
+        results[route.name] = res = await run_route(client, ctx, route, args.requests, args.concurrency)
+        print(f"  {route.name:<42} {res['req_per_s']:>9} {res['p50_ms']:>9} {res['p95_ms']:>9} "
+              f"{res['p99_ms']:>9} {res['errors']:>6}")
+    return results
+
+
+def _limits(concurrency: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+
+async def _inprocess(manifest: dict, selected: List[Route], args) -> Dict[str, dict]:
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120,
+                                     limits=_limits(args.concurrency)) as client:
+            return await run_suite(client, manifest, selected, args)
+
+
+async def _http(url: str, manifest: dict, selected: List[Route], args) -> Dict[str, dict]:
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=_limits(args.concurrency)) as client:
+        return await run_suite(client, manifest, selected, args)
+
+
+def _header() -> None:
+    print(f"  {'route':<42} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errori':>6}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Route peggiorate rispetto alla baseline: p95 più alto o richieste/s più basse oltre la tolleranza."""
+    regressions = []
+    print(f"\n  {'confronto con baseline':<52} {'p95 ms':>17} {'req/s':>17}")
+    for mode, routes_now in current["results"].items():
+        for name, now in routes_now.items():
+            base = baseline.get("results", {}).get(mode, {}).get(name)
+            if base is None:
+                continue
+            slower = (now["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                      and now["p95_ms"] - base["p95_ms"] > min_delta_ms)
+            fewer = now["req_per_s"] < base["req_per_s"] * (1 - tolerance)
+            flag = "PEGGIO" if slower or fewer else ""
+            print(f"  {mode:<9} {name:<42} {base['p95_ms']:>8}->{now['p95_ms']:<8} "
+                  f"{base['req_per_s']:>8}->{now['req_per_s']:<8} {flag}")
+            if flag:
+                regressions.append(f"{mode} {name}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "http", "both"], default="inprocess")
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=100, help="sintomi per paziente")
+    parser.add_argument("--appointments", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="richieste per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--logged-patients", type=int, default=16, help="pazienti che generano il carico")
+    parser.add_argument("--routes", nargs="*", help="solo le route il cui nome contiene uno di questi testi")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignora peggioramenti p95 sotto questa soglia")
+    args = parser.parse_args(argv)
+
+    selected = [r for r in routes() if not args.routes or any(s in r.name for s in args.routes)]
+
+    # dataset generato una volta, in un processo a parte: ogni modalità lavora
+    # su una copia (il motore SQLite fissa il percorso assoluto del DB alla creazione)
+    template = tempfile.mkdtemp(prefix="msd-suite-data-")
+    subprocess.run(
+        [sys.executable, "-m", "bench.datagen", "--workdir", template, "--seed", str(args.seed),
+         "--patients", str(args.patients), "--entries", str(args.entries), "--appointments", str(args.appointments)],
+        cwd=BACKEND_DIR,
+        check=True,
+    )
+    with open(os.path.join(template, datagen.MANIFEST)) as f:
+        manifest = json.load(f)
+    print()
+
+    modes = ["inprocess", "http"] if args.mode == "both" else [args.mode]
+    results = {}
+    for mode in modes:
+        workdir = tempfile.mkdtemp(prefix=f"msd-suite-{mode}-")
+        shutil.copytree(template, workdir, dirs_exist_ok=True)
+        print(f"{mode} ({workdir})")
+        _header()
+        if mode == "http":
+            with uvicorn_server(workdir=workdir) as url:
+                results[mode] = asyncio.run(_http(url, manifest, selected, args))
+        else:
+            use_workdir(workdir)
+            results[mode] = asyncio.run(_inprocess(manifest, selected, args))
+        print()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "data": manifest["counts"],
+        },
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline salvata in {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("data") != manifest["counts"]:
+            print("attenzione: la baseline è stata misurata su un dataset diverso")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\nPEGGIORAMENTI: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
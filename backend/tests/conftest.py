@@ -0,0 +1,45 @@
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# app.database legge DATABASE_URL all'import: DB e blob store dei test in una
+# cartella temporanea, mai quelli locali
+_TMP = tempfile.mkdtemp(prefix="msd-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ["MSD_BLOB_DIR"] = os.path.join(_TMP, "blobs")
+
+_emails = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def make_user(client):
+    """Registra un utente nuovo (email univoca) e restituisce gli header di autenticazione."""
+    from app import models
+    from app.database import SessionLocal
+
+    def _make(admin: bool = False) -> dict:
+        email = f"utente{next(_emails)}@example.com"
+        client.post("/api/auth/register", json={"name": "test", "email": email, "password": "pass"})
+        if admin:
+            db = SessionLocal()
+            try:
+                db.query(models.User).filter(models.User.email == email).update({"is_admin": True})
+                db.commit()
+            finally:
+                db.close()
+        r = client.post("/api/auth/login", data={"username": email, "password": "pass"})
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    return _make
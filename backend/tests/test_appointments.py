@@ -0,0 +1,33 @@
+from datetime import date, time
+
+from app import availability
+
+SLOT = {"facility": "Milano", "date": "2031-03-04", "time": "09:00"}
+
+
+def _prenota(client, headers, **slot):
+    body = {**SLOT, **slot, "pdf_filename": "referto.pdf", "pdf_base64": "JVBERi0xLjQ="}
+    return client.post("/api/appointments", json=body, headers=headers)
+
+
+def test_doppia_prenotazione_409(client, make_user):
+    first = _prenota(client, make_user())
+    assert first.status_code == 200, first.text
+    assert _prenota(client, make_user()).status_code == 409
+
+
+def test_doppia_prenotazione_409_anche_con_indice_vecchio(client, make_user):
+    # indice in memoria vuoto (es. prenotazione fatta da un altro processo):
+    # decide l'indice unico parziale del DB
+    slot = {"time": "10:00"}
+    assert _prenota(client, make_user(), **slot).status_code == 200
+    availability.index.release("Milano", date(2031, 3, 4), time(10))
+    assert _prenota(client, make_user(), **slot).status_code == 409
+
+
+def test_slot_liberato_dal_rifiuto_si_può_riprenotare(client, make_user):
+    admin, h = make_user(admin=True), make_user()
+    appt = _prenota(client, h, time="11:00").json()
+    r = client.put(f"/api/appointments/{appt['id']}/status", json={"status": "REJECTED"}, headers=admin)
+    assert r.status_code == 200, r.text
+    assert _prenota(client, make_user(), time="11:00").status_code == 200
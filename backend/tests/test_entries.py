@@ -0,0 +1,92 @@
+def _add(client, headers, **fields):
+    body = {"title": "Mal di testa", "severity": 5, "timestamp": "2024-01-01T10:00:00", **fields}
+    r = client.post("/api/entries", json=body, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_risultato_ricerca_uguale_alla_lista(client, make_user):
+    h = make_user()
+    entry = _add(client, h, description="emicrania dopo pranzo", tags="headache")
+
+    listed = {e["id"]: e for e in client.get("/api/entries", headers=h).json()}[entry["id"]]
+    hits = client.get("/api/entries/search", params={"q": "emicrania"}, headers=h).json()["items"]
+    assert [hit["id"] for hit in hits] == [entry["id"]]
+
+    hit = dict(hits[0])
+    hit.pop("score")
+    assert listed["updated_at"] is not None
+    assert hit == listed
+
+
+def test_filtro_tag_esatto_senza_maiuscole(client, make_user):
+    h = make_user()
+    mal = _add(client, h, tags="Headache, Mal di testa")
+    _add(client, h, tags="headaches")
+
+    def ids(tag):
+        return [e["id"] for e in client.get("/api/entries", params={"tag": tag}, headers=h).json()]
+
+    assert ids("HEADACHE") == [mal["id"]]
+    assert ids("mal di testa") == [mal["id"]]
+    assert ids("ache") == []
+    assert ids("mal") == []
+
+
+def test_andamento_dopo_modifica_ed_eliminazione(client, make_user):
+    h = make_user()
+    a = _add(client, h, severity=2, tags="nausea", timestamp="2024-05-06T08:00:00")
+    b = _add(client, h, severity=8, tags="nausea", timestamp="2024-05-06T20:00:00")
+
+    def punti(tag=None):
+        params = {"bucket": "day", "from_date": "2024-05-06", "to_date": "2024-05-06"}
+        if tag:
+            params["tag"] = tag
+        return client.get("/api/entries/trends", params=params, headers=h).json()["points"]
+
+    assert [(p["count"], p["min_severity"], p["max_severity"]) for p in punti("nausea")] == [(2, 2, 8)]
+
+    client.put(f"/api/entries/{b['id']}", json={"severity": 5, "tags": "febbre"}, headers=h)
+    assert [(p["count"], p["min_severity"], p["max_severity"]) for p in punti("nausea")] == [(1, 2, 2)]
+    assert [(p["count"], p["min_severity"], p["max_severity"]) for p in punti()] == [(2, 2, 5)]
+
+    client.delete(f"/api/entries/{a['id']}", headers=h)
+    assert punti("nausea") == []
+    assert [(p["count"], p["min_severity"], p["max_severity"]) for p in punti()] == [(1, 5, 5)]
+
+
+def test_sync_restituisce_tombstone(client, make_user):
+    h = make_user()
+    keep = _add(client, h)
+    gone = _add(client, h)
+
+    first = client.get("/api/entries/changes", headers=h).json()
+    assert {i["id"] for i in first["items"]} == {keep["id"], gone["id"]}
+    assert not first["has_more"]
+
+    client.delete(f"/api/entries/{gone['id']}", headers=h)
+    changes = client.get("/api/entries/changes", params={"since": first["cursor"]}, headers=h).json()
+    assert [(i["id"], i["deleted"], i["entry"]) for i in changes["items"]] == [(gone["id"], True, None)]
+
+    # dopo il cursore nuovo non c'è più nulla; la sync completa non riporta le tombstone
+    again = client.get("/api/entries/changes", params={"since": changes["cursor"]}, headers=h).json()
+    assert again["items"] == []
+    full = client.get("/api/entries/changes", headers=h).json()
+    assert [i["id"] for i in full["items"]] == [keep["id"]]
+
+
+def test_etag_304_finché_il_diario_non_cambia(client, make_user):
+    h = make_user()
+    _add(client, h)
+
+    first = client.get("/api/entries", headers=h)
+    etag = first.headers["etag"]
+    cached = client.get("/api/entries", headers={**h, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    _add(client, h, title="Febbre")
+    changed = client.get("/api/entries", headers={**h, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
@@ -0,0 +1,15 @@
+from app import metrics
+
+
+def test_metriche_chiuse_per_default(client, make_user, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scraper")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer altro"}).status_code == 401
+    assert client.get("/metrics", headers=make_user()).status_code == 403
+    assert client.get("/metrics", headers=make_user(admin=True)).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer scraper"}).status_code == 200
+
+
+def test_metriche_pubbliche_solo_con_opt_out(client, monkeypatch):
+    monkeypatch.setattr(metrics, "PUBLIC", True)
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app import migrations, query_plans
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_nessuna_scansione_completa(engine):
+    scans = {name: tables for name, _, tables in query_plans.check(engine) if tables}
+    assert scans == {}
+
+
+def test_feed_admin_per_tag_parte_dall_indice_dei_tag(engine):
+    plans = {name: detail for name, detail, _ in query_plans.check(engine)}
+    assert any("ix_entry_tags_tag_entry (tag=?)" in line for line in plans["feed admin per tag"])
+
+
+def test_copre_sync_andamenti_e_coorte(engine):
+    names = {name for name, _, _ in query_plans.check(engine)}
+    assert {"sync iniziale", "sync modifiche", "andamento utente", "andamento admin",
+            "coorte colonne", "coorte tag"} <= names
@@ -5,6 +5,7 @@ const API_BASE_URL = `${window.location.protocol}//${window.location.hostname}:8
 // Storage keys
 const STORAGE_TOKEN_KEY = "msd_token";
 const STORAGE_USER_KEY = "msd_user";
+const STORAGE_ENTRIES_KEY = "msd_entries";
 
 let authToken = null;
 
@@ -39,6 +40,7 @@ function clearAuth() {
   currentUser = null;
   sessionStorage.removeItem(STORAGE_TOKEN_KEY);
   sessionStorage.removeItem(STORAGE_USER_KEY);
+  sessionStorage.removeItem(STORAGE_ENTRIES_KEY);
 }
 
 function redirectTo(path) {
@@ -395,7 +397,12 @@ async function setupAdminAppointmentsPage() {
   async function loadAppointments() {
     listEl.innerHTML = `<p class="hint">Caricamento...</p>`;
 
-    const res = await fetch(`${API_BASE_URL}/api/appointments/admin/all`, {
+    // solo la coda di lavoro (da confermare / proposte), non tutto lo storico
+    const qs = new URLSearchParams({ limit: "200" });
+    qs.append("status", "PENDING");
+    qs.append("status", "PROPOSED");
+
+    const res = await fetch(`${API_BASE_URL}/api/appointments/admin/queue?${qs.toString()}`, {
       headers: { Authorization: `Bearer ${authToken}` },
     });
 
@@ -404,13 +411,21 @@ async function setupAdminAppointmentsPage() {
       return;
     }
 
-    const data = await res.json();
+    const queue = await res.json();
+    const data = queue.items;
+    const counts = queue.counts || {};
     if (!data.length) {
-      listEl.innerHTML = `<p class="hint">Nessuna prenotazione presente.</p>`;
+      listEl.innerHTML = `<p class="hint">Nessuna prenotazione da gestire.</p>`;
       return;
     }
 
-    listEl.innerHTML = "";
+    listEl.innerHTML = `
+      <p class="hint">
+        Da confermare: ${counts.PENDING || 0} - Proposte inviate: ${counts.PROPOSED || 0}
+        - Confermate: ${counts.CONFIRMED || 0} - Rifiutate: ${counts.REJECTED || 0}
+        ${queue.next_cursor ? "(mostrate le prime 200)" : ""}
+      </p>
+    `;
 
     data.forEach((a) => {
       const div = document.createElement("div");
@@ -711,21 +726,12 @@ async function setupAdminSymptomsPage() {
     }
   };
 
-  try {
-    const res = await fetch(`${API_BASE_URL}/api/entries/admin/all`, {
-      headers: { Authorization: `Bearer ${authToken}` },
-    });
-
-    if (!res.ok) {
-      listEl.innerHTML = `<p class="hint">Errore caricando i sintomi.</p>`;
-      return;
-    }
+  // feed paginato: le pagine successive si caricano con "Carica altri"
+  const entries = [];
+  let nextCursor = null;
 
-    const entries = await res.json();
-    if (!entries.length) {
-      listEl.innerHTML = `<p class="hint">Nessun sintomo registrato.</p>`;
-      return;
-    }
+  function renderGroups() {
+    listEl.innerHTML = "";
 
     const groups = {};
     entries.forEach((e) => {
@@ -760,10 +766,47 @@ async function setupAdminSymptomsPage() {
 
         listEl.appendChild(wrap);
       });
-  } catch (e) {
-    console.error(e);
-    listEl.innerHTML = `<p class="hint">Errore di rete caricando i sintomi.</p>`;
+
+    if (nextCursor) {
+      const moreBtn = document.createElement("button");
+      moreBtn.className = "small-button";
+      moreBtn.textContent = "Carica altri";
+      moreBtn.addEventListener("click", loadPage);
+      listEl.appendChild(moreBtn);
+    }
   }
+
+  async function loadPage() {
+    try {
+      const qs = new URLSearchParams({ limit: "100" });
+      if (nextCursor) qs.set("cursor", nextCursor);
+
+      const res = await fetch(`${API_BASE_URL}/api/entries/admin/feed?${qs.toString()}`, {
+        headers: { Authorization: `Bearer ${authToken}` },
+      });
+
+      if (!res.ok) {
+        listEl.innerHTML = `<p class="hint">Errore caricando i sintomi.</p>`;
+        return;
+      }
+
+      const page = await res.json();
+      entries.push(...page.items);
+      nextCursor = page.next_cursor;
+
+      if (!entries.length) {
+        listEl.innerHTML = `<p class="hint">Nessun sintomo registrato.</p>`;
+        return;
+      }
+
+      renderGroups();
+    } catch (e) {
+      console.error(e);
+      listEl.innerHTML = `<p class="hint">Errore di rete caricando i sintomi.</p>`;
+    }
+  }
+
+  await loadPage();
 }
 
 
@@ -985,6 +1028,42 @@ async function setupDiaryPage() {
 
 }
 
+// copia locale del diario, aggiornata solo con le modifiche (GET /api/entries/changes)
+
+function loadLocalEntries() {
+  try {
+    const local = JSON.parse(sessionStorage.getItem(STORAGE_ENTRIES_KEY) || "null");
+    if (local && local.userId === currentUser?.id) return local;
+  } catch {
+    // copia corrotta: si riparte da zero
+  }
+  return { userId: currentUser?.id, cursor: null, entries: {} };
+}
+
+async function syncEntries() {
+  const local = loadLocalEntries();
+  let hasMore = true;
+
+  while (hasMore) {
+    const qs = local.cursor ? `?since=${encodeURIComponent(local.cursor)}` : "";
+    const res = await fetch(`${API_BASE_URL}/api/entries/changes${qs}`, {
+      headers: { Authorization: `Bearer ${authToken}` },
+    });
+    if (!res.ok) return null;
+
+    const page = await res.json();
+    page.items.forEach((change) => {
+      if (change.deleted) delete local.entries[change.id];
+      else local.entries[change.id] = change.entry;
+    });
+    local.cursor = page.cursor;
+    hasMore = page.has_more;
+  }
+
+  sessionStorage.setItem(STORAGE_ENTRIES_KEY, JSON.stringify(local));
+  return Object.values(local.entries).sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
+}
+
 // snapshot.html || Elenco miei sintomi
 
 async function loadEntries(entriesList, symptomForm, getEditingId, setEditingId) {
@@ -996,16 +1075,13 @@ async function loadEntries(entriesList, symptomForm, getEditingId, setEditingId)
   }
 
   try {
-    const res = await fetch(`${API_BASE_URL}/api/entries`, {
-      headers: { Authorization: `Bearer ${authToken}` },
-    });
+    const data = await syncEntries();
 
-    if (!res.ok) {
+    if (!data) {
       entriesList.innerHTML = `<p class = "hint">Errore caricando sintomi.</p>`;
       return;
     }
 
-    const data = await res.json();
     if (data.length === 0) {
       entriesList.innerHTML = `<p class = "hint">Nessun sintomo ancora.</p>`;
       return;
@@ -1164,7 +1240,7 @@ async function setupAppointmentsPage() {
   // PDF in memoria
   let pdfBlobUrl = null;
   let pdfFileName = null;
-  let pdfBase64 = null; 
+  let pdfBlob = null;
 
   function setSlots(bookedSet) {
     timeSel.innerHTML = `<option value="">Seleziona...</option>`;
@@ -1250,21 +1326,18 @@ async function setupAppointmentsPage() {
   generatePdfBtn.addEventListener("click", async () => {
     try {
       // richiamo i sintomi dell'utente dal backend
-      const res = await fetch(`${API_BASE_URL}/api/entries`, {
-        headers: { Authorization: `Bearer ${authToken}` },
-      });
-      if (!res.ok) {
+      const entries = await syncEntries();
+      if (!entries) {
         showToast("Impossibile caricare i sintomi.", { type: "error" });
         return;
       }
 
-      const entries = await res.json();
       entries.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
 
       if (!entries.length) {
         showToast("Nessun sintomo. Inserisci almeno un sintomo nel Diario.", { type: "error" });
 
-        pdfBase64 = null;
+        pdfBlob = null;
         pdfFileName = null;
         pdfFilenameInput.value = "(non generato)";
         downloadPdfLink.classList.add("hidden");
@@ -1310,12 +1383,8 @@ async function setupAppointmentsPage() {
       const blob = doc.output("blob");
       pdfBlobUrl = URL.createObjectURL(blob);
 
-      // 2) base64 per allegare alla prenotazione 
-      const arrayBuffer = await blob.arrayBuffer();
-      const bytes = new Uint8Array(arrayBuffer);
-      let binary = "";
-      bytes.forEach((b) => binary += String.fromCharCode(b));
-      pdfBase64 = btoa(binary);
+      // 2) blob binario da allegare alla prenotazione (niente base64)
+      pdfBlob = blob;
 
       pdfFileName = fileName;
       pdfFilenameInput.value = fileName;
@@ -1345,27 +1414,27 @@ async function setupAppointmentsPage() {
     }
 
     // pdf obbligatorio
-    if (!pdfBase64 || !pdfFileName) {
+    if (!pdfBlob || !pdfFileName) {
       showToast("Genera prima il PDF del diario sintomi.", { type: "error" });
       return;
     }
 
     try {
-      const payload = {
+      // PDF inviato come corpo binario, metadati in query string
+      const qs = new URLSearchParams({
         facility,
         date,          // "YYYY-MM-DD"
         time,          // "HH:MM" 
         pdf_filename: pdfFileName,
-        pdf_base64: pdfBase64
-      };
+      });
 
-      const res = await fetch(`${API_BASE_URL}/api/appointments`, {
+      const res = await fetch(`${API_BASE_URL}/api/appointments/upload?${qs.toString()}`, {
         method: "POST",
         headers: {
-          "Content-Type": "application/json",
+          "Content-Type": "application/pdf",
           Authorization: `Bearer ${authToken}`
         },
-        body: JSON.stringify(payload),
+        body: pdfBlob,
       });
 
       if (res.status === 409) {